@@ -0,0 +1,253 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+class QueryLimiter:
+    """Bound concurrent query work and the queue of requests waiting for it
+
+    Blocking query work runs on a dedicated executor with one thread per
+    slot, so the event loop stays free for uploads and health checks.
+    Requests beyond the slots wait in a bounded queue; when that queue is
+    full they are rejected immediately with 429, and requests that wait
+    longer than the queue timeout get 503. Batches between them hold at most
+    max_concurrent - 1 slots, so one is always left for interactive queries.
+    """
+
+    def __init__(self, max_concurrent=None, max_queue=None, queue_timeout=None):
+        self.max_concurrent = max_concurrent or settings.QUERY_MAX_CONCURRENCY
+        self.max_queue = settings.QUERY_MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout or settings.QUERY_QUEUE_TIMEOUT
+        self.max_batch_slots = max(1, self.max_concurrent - 1)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent,
+            thread_name_prefix="query"
+        )
+        # Created on first use so they bind to the running loop (Python 3.9)
+        self._semaphore = None
+        self._lease_lock = None
+        self._batch_semaphore = None
+        self._batch_lock = None
+        self._waiting = 0
+        self._in_flight = 0
+
+    def _get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    async def acquire(self):
+        """Wait for a query slot, rejecting when the wait queue is full"""
+        semaphore = self._get_semaphore()
+        if not semaphore.locked():
+            # A free slot is taken without suspending
+            await semaphore.acquire()
+            self._in_flight += 1
+            return
+        if self._waiting >= self.max_queue:
+            logger.warning(f"Rejecting query, {self._waiting} already waiting")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many queries in progress, please retry shortly",
+                headers={"Retry-After": "1"}
+            )
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail="Timed out waiting for a free query slot",
+                headers={"Retry-After": "5"}
+            )
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+
+    def release(self):
+        """Free a slot taken with acquire"""
+        self._in_flight -= 1
+        self._get_semaphore().release()
+
+    async def lease(self, slots=1):
+        """Take slots as a QuerySlot, for work that outlives the request handler
+
+        Several slots (at most max_concurrent) are taken one after another
+        under a lock, so two leases never each hold part of what they need
+        and wait on each other.
+        """
+        slots = max(1, min(slots, self.max_concurrent))
+        if slots == 1:
+            await self.acquire()
+            return QuerySlot(self)
+        if self._lease_lock is None:
+            self._lease_lock = asyncio.Lock()
+        async with self._lease_lock:
+            taken = 0
+            try:
+                for _ in range(slots):
+                    await self.acquire()
+                    taken += 1
+            except BaseException:
+                for _ in range(taken):
+                    self.release()
+                raise
+        return QuerySlot(self, slots)
+
+    async def lease_batch(self, slots):
+        """Take slots for a batch as a QuerySlot, within the batch share
+
+        At most max_batch_slots are held by batches at once; a batch waits
+        for its share up to the queue timeout (503 after that) before taking
+        the slots themselves.
+        """
+        slots = max(1, min(slots, self.max_batch_slots))
+        if self._batch_semaphore is None:
+            self._batch_semaphore = asyncio.Semaphore(self.max_batch_slots)
+            self._batch_lock = asyncio.Lock()
+        try:
+            await asyncio.wait_for(self._take_batch_share(slots), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail="Timed out waiting for other batches to finish",
+                headers={"Retry-After": "5"}
+            )
+        try:
+            slot = await self.lease(slots)
+        except BaseException:
+            self._release_batch_share(slots)
+            raise
+        slot.on_release = functools.partial(self._release_batch_share, slots)
+        return slot
+
+    async def _take_batch_share(self, slots):
+        # Taken under a lock, like lease, so two batches never each hold part of a share
+        async with self._batch_lock:
+            taken = 0
+            try:
+                for _ in range(slots):
+                    await self._batch_semaphore.acquire()
+                    taken += 1
+            except BaseException:
+                self._release_batch_share(taken)
+                raise
+
+    def _release_batch_share(self, slots):
+        for _ in range(slots):
+            self._batch_semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a query slot for the duration of the block"""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run_in_slot(self, func, *args, **kwargs):
+        """Run blocking work on the query executor; the caller holds a slot"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def run(self, func, *args, **kwargs):
+        """Take a slot and run blocking work on the query executor"""
+        async with self.slot():
+            return await self.run_in_slot(func, *args, **kwargs)
+
+    async def iterate(self, iterator):
+        """Drain a blocking iterator on the query executor; the caller holds a slot
+
+        However iteration ends, including cancellation when a client goes
+        away, the iterator is then closed on the executor so a generator's
+        cleanup runs, e.g. closing an LLM stream that would otherwise keep
+        producing tokens nobody reads.
+        """
+        step = None
+        try:
+            while True:
+                step = self._executor.submit(next, iterator, _DONE)
+                item = await asyncio.wrap_future(step)
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            self._executor.submit(self._close_after, iterator, step)
+
+    def _close_after(self, iterator, step):
+        """Close an iterator once its step in flight has returned
+
+        A cancelled await leaves next() running on its thread, and closing a
+        generator while it runs would fail.
+        """
+        close = getattr(iterator, "close", None)
+        if close is None:
+            return
+        if step is not None:
+            wait([step])
+        try:
+            close()
+        except Exception as e:
+            logger.error(f"Error closing query iterator: {str(e)}")
+
+    def stats(self):
+        """Current slot usage, for readiness and debugging"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_queue": self.max_queue
+        }
+
+class QuerySlot:
+    """Taken query slots that may be released more than once, only the first counts"""
+
+    def __init__(self, limiter, slots=1):
+        self.limiter = limiter
+        self.slots = slots
+        self.released = False
+        self.on_release = None
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            for _ in range(self.slots):
+                self.limiter.release()
+            if self.on_release is not None:
+                self.on_release()
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls on_close however the response ends
+
+    The body generator's finally never runs when the client goes away before
+    the body starts, and background tasks are skipped when sending fails, so
+    cleanup such as freeing a query slot goes here. A body left suspended
+    between chunks is closed first rather than whenever it is collected.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                self.on_close()
+
+query_limiter = QueryLimiter()
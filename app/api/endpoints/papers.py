@@ -1,17 +1,36 @@
 import os
 import shutil
+import logging
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
 
 from app.db.database import get_db
 from app.core.config import settings
-from app.rag.document_processor import DocumentProcessor
-from app.rag.index_manager import IndexManager
+from app.core.container import container
+from app.core.metrics import ERRORS
+from app.rag.distributed_lock import INDEX_MAINTENANCE_LOCK, RedisLeaseLock
 
 router = APIRouter()
-document_processor = DocumentProcessor()
-index_manager = IndexManager()
+
+logger = logging.getLogger(__name__)
+
+def _maintenance_lock():
+    """Wait for the index maintenance lock, one corpus change at a time across workers"""
+    return RedisLeaseLock(container.redis_manager.redis_client, INDEX_MAINTENANCE_LOCK)
+
+def _save_upload(file: UploadFile, file_path: str):
+    """Write an uploaded PDF to disk"""
+    try:
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+
+def _check_arxiv_id(arxiv_id: str):
+    """Reject ids that are not a plain file name"""
+    if not arxiv_id or arxiv_id != os.path.basename(arxiv_id) or arxiv_id.startswith("."):
+        raise HTTPException(status_code=400, detail=f"Invalid arXiv id: {arxiv_id}")
 
 @router.post("/upload/")
 async def upload_paper(
@@ -24,28 +43,81 @@ async def upload_paper(
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
     # Save the file
-    file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+    file_path = os.path.join(settings.UPLOAD_DIR, os.path.basename(file.filename))
+    _save_upload(file, file_path)
     
     # Process and index the file in the background
     background_tasks.add_task(process_and_index_file, file_path)
     
     return {"filename": file.filename, "status": "File uploaded successfully. Processing in background."}
 
-async def process_and_index_file(file_path: str):
-    """Process and index a file in the background"""
+@router.put("/{arxiv_id}")
+async def replace_paper(
+    arxiv_id: str,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...)
+):
+    """Replace the PDF of a paper and re-index only that paper"""
+    _check_arxiv_id(arxiv_id)
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    
+    # Overwrite the stored copy so node ids, derived from the arxiv id, stay stable
+    file_path = (
+        container.document_processor.find_paper_file(arxiv_id)
+        or os.path.join(settings.UPLOAD_DIR, f"{arxiv_id}.pdf")
+    )
+    _save_upload(file, file_path)
+    
+    background_tasks.add_task(process_and_index_file, file_path)
+    
+    return {"arxiv_id": arxiv_id, "status": "File replaced successfully. Processing in background."}
+
+@router.delete("/{arxiv_id}")
+async def delete_paper(arxiv_id: str):
+    """Delete a paper, its nodes and its vectors"""
+    _check_arxiv_id(arxiv_id)
+    
+    def delete():
+        with _maintenance_lock() as lock:
+            index_manager = container.index_manager
+            index_manager.refresh_generation(force=True)
+            # Retired generations lose the paper too, a rollback must not bring it back
+            node_ids = container.document_processor.remove_paper(
+                arxiv_id, generations=index_manager.live_generations(), lock=lock
+            )
+            return index_manager.delete_paper(arxiv_id, node_ids, lock=lock)
+    
     try:
-        # Process the file
-        nodes, leaf_nodes = document_processor.process_file(file_path)
-        if nodes and leaf_nodes:
-            # Index the documents
-            index_manager.index_documents(nodes, leaf_nodes)
+        deleted = await run_in_threadpool(delete)
     except Exception as e:
-        print(f"Error processing file {file_path}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error deleting paper {arxiv_id}: {str(e)}")
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Paper {arxiv_id} not found")
+    
+    return {"arxiv_id": arxiv_id, "deleted_nodes": deleted, "status": "Paper deleted successfully"}
+
+def process_and_index_file(file_path: str):
+    """Process and index a file in the background (runs in the threadpool)"""
+    try:
+        with _maintenance_lock() as lock:
+            index_manager = container.index_manager
+            index_manager.refresh_generation(force=True)
+            
+            # Only this paper is parsed, its outdated chunks are reported back
+            result = container.document_processor.process_file(
+                file_path, generations=index_manager.live_generations(), lock=lock
+            )
+            
+            # Drop vectors of chunks that no longer exist
+            index_manager.delete_nodes(result.removed_node_ids, lock=lock)
+            
+            # Embed and index the paper's nodes
+            if result.nodes:
+                index_manager.add_nodes(result.nodes, lock=lock)
+    except Exception as e:
+        ERRORS.labels("ingest").inc()
+        logger.error(f"Error processing file {file_path}: {str(e)}")
 
 @router.post("/reindex/")
 async def reindex_all_papers(background_tasks: BackgroundTasks):
@@ -53,19 +125,25 @@ async def reindex_all_papers(background_tasks: BackgroundTasks):
     background_tasks.add_task(process_and_index_all)
     return {"status": "Reindexing started in background"}
 
-async def process_and_index_all():
-    """Process and index all files in the background"""
+def process_and_index_all():
+    """Process and index new or changed files in the background (runs in the threadpool)"""
     try:
-        # Process all files in the directory
-        nodes, leaf_nodes = document_processor.process_directory()
-        if nodes and leaf_nodes:
-            # Get list of current doc_ids
-            current_doc_ids = [node.node_id for node in nodes]
+        # One reindex at a time across workers, queries keep using the current index
+        with _maintenance_lock() as lock:
+            index_manager = container.index_manager
+            index_manager.refresh_generation(force=True)
+            
+            # Only new or changed files are parsed, removed ones are reported back
+            result = container.document_processor.sync_directory(
+                generations=index_manager.live_generations(), lock=lock
+            )
             
-            # Index the documents
-            index_manager.index_documents(nodes, leaf_nodes)
+            # Drop vectors of removed papers and of chunks replaced by a new version
+            index_manager.delete_nodes(result.removed_node_ids, lock=lock)
             
-            # Cleanup old documents
-            index_manager.cleanup_documents(current_doc_ids)
+            # Embed and index the new nodes
+            if result.nodes:
+                index_manager.add_nodes(result.nodes, lock=lock)
     except Exception as e:
-        print(f"Error processing directory: {str(e)}") 
\ No newline at end of file
+        ERRORS.labels("ingest").inc()
+        logger.error(f"Error processing directory: {str(e)}")
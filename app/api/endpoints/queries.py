@@ -1,18 +1,19 @@
+import json
+import asyncio
 import logging
+import threading
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, field_validator
 from typing import List, Optional
 import pickle
 
-from app.rag.index_manager import IndexManager
-from app.rag.query_engine import QueryProcessor
-from app.rag.document_processor import DocumentProcessor
-from app.rag.redis_manager import RedisManager
+from app.core.config import settings
+from app.core.container import container
+from app.rag.distributed_lock import INDEX_MAINTENANCE_LOCK, LockNotAcquired, RedisLeaseLock, run_as_leader
+from app.api.concurrency import ClosingStreamingResponse, query_limiter
 
 router = APIRouter()
-index_manager = IndexManager()
-document_processor = DocumentProcessor()
-redis_manager = RedisManager()
 
 logger = logging.getLogger(__name__)
 
@@ -31,72 +32,115 @@ class QueryResponse(BaseModel):
     answer: str
     source_nodes: List[SourceNode] = []
 
-async def initialize_index():
-    """Initialize the index once at startup"""
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+
+    @field_validator("queries")
+    @classmethod
+    def reject_blank_queries(cls, queries):
+        blank = [index for index, query in enumerate(queries) if not query.strip()]
+        if blank:
+            raise ValueError(f"Queries at indexes {blank} are empty")
+        return queries
+
+_BATCH_DONE = object()
+
+def _build_index(lock=None):
+    """Build the index from the vector store, stored nodes or the papers (blocking)"""
+    redis_manager = container.redis_manager
+    index_manager = container.index_manager
+    
+    # Try to get existing index
+    index = index_manager.get_index()
+    if index is not None:
+        # Store index state in Redis
+        redis_manager.mark_initialized(lock)
+        return index
+        
+    # If index is None, index the nodes stored in the database, one batch at a time
+    index = index_manager.index_node_batches(index_manager.node_store.iter_node_batches(), lock=lock)
+    if index is not None:
+        # Store index state in Redis
+        redis_manager.mark_initialized(lock)
+        return index
+        
+    # If we get here, there's no index and no stored nodes
+    # Process documents as a last resort
+    result = container.document_processor.sync_directory(generations=[index_manager.generation], lock=lock)
+    # Papers removed since the manifest was written must not keep their vectors
+    index_manager.delete_nodes(result.removed_node_ids, lock=lock)
+    if result.nodes:
+        # Store and index the nodes
+        index_manager._init_storage_context()
+        index = index_manager.index_documents(result.nodes, lock=lock)
+        # Store index state in Redis
+        redis_manager.mark_initialized(lock)
+        return index
+        
+    # If we get here, we have no data at all
+    raise HTTPException(
+        status_code=500,
+        detail="No documents or stored nodes found. Knowledge base is empty."
+    )
+
+def _initialize_index():
+    """Initialize the index once at startup (blocking)"""
     try:
+        redis_manager = container.redis_manager
+        index_manager = container.index_manager
+        
         # Check if index is already initialized in Redis
         if redis_manager.is_initialized():
             logger.info("Using existing index from Redis")
             return index_manager.get_index()
-            
-        # Try to get existing index
-        index = index_manager.get_index()
-        if index is not None:
-            # Store index state in Redis
-            redis_manager.mark_initialized()
-            return index
-            
-        # If index is None, check if we have stored nodes in the database
-        stored_nodes = index_manager.node_store.load_nodes()
-        if stored_nodes:
-            # We have nodes in database but not in the index, let's update the index
-            logger.info(f"Found {len(stored_nodes)} nodes in database, building index")
-            
-            # Reinitialize storage context with existing nodes
-            index_manager._init_storage_context()
-            
-            # Create the index
-            index = index_manager.index_documents(stored_nodes)
-            # Store index state in Redis
-            redis_manager.mark_initialized()
-            return index
-            
-        # If we get here, there's no index and no stored nodes
-        # Process documents as a last resort
-        nodes = document_processor.process_directory()
-        if nodes:
-            # Store and index the nodes
-            index_manager._init_storage_context()
-            index = index_manager.index_documents(nodes)
-            # Store index state in Redis
-            redis_manager.mark_initialized()
-            return index
-            
-        # If we get here, we have no data at all
-        raise HTTPException(
-            status_code=500,
-            detail="No documents or stored nodes found. Knowledge base is empty."
+        
+        # Exactly one worker builds the index, the others wait until it is ready
+        index = run_as_leader(
+            redis_manager.redis_client,
+            INDEX_MAINTENANCE_LOCK,
+            _build_index,
+            is_ready=redis_manager.is_initialized
         )
+        return index if index is not None else index_manager.get_index()
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error initializing index: {str(e)}"
         )
 
+def _maintenance_lock():
+    """Take the index maintenance lock without waiting, 409 if another worker holds it"""
+    lock = RedisLeaseLock(container.redis_manager.redis_client, INDEX_MAINTENANCE_LOCK)
+    if lock.acquire(blocking=False) is None:
+        raise HTTPException(
+            status_code=409,
+            detail="Another worker is already initializing or rebuilding the index"
+        )
+    return lock
+
+async def initialize_index():
+    """Initialize the index once at startup without blocking the event loop"""
+    return await run_in_threadpool(_initialize_index)
+
 @router.post("/", response_model=QueryResponse)
 async def process_query(query_request: QueryRequest):
     """Process a query against the research papers"""
     try:
-        # Get query processor (it will handle initialization if needed)
-        query_processor = index_manager.get_query_processor()
-        if query_processor is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Index not initialized"
-            )
+        # Wait for a query slot, rejected with 429/503 when overloaded
+        async with query_limiter.slot():
+            # Get query processor (it will handle initialization if needed)
+            query_processor = await query_limiter.run_in_slot(_get_query_processor)
+            if query_processor is None:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Index not initialized"
+                )
             
-        # Process the query
-        result = query_processor.process_query(query_request.query)
+            # Process the query off the event loop
+            result = await query_limiter.run_in_slot(
+                query_processor.process_query,
+                query_request.query
+            )
         
         return result
     except HTTPException:
@@ -107,16 +151,165 @@ async def process_query(query_request: QueryRequest):
             detail=f"Error processing query: {str(e)}"
         )
 
+def _get_query_processor():
+    """Shared query processor, built on first use if warm-up has not finished
+
+    A query waits at most LOCK_REQUEST_WAIT_TIMEOUT for a worker loading the
+    node cache and is answered with 409 after that.
+    """
+    try:
+        return container.get_query_processor(lock_wait_timeout=settings.LOCK_REQUEST_WAIT_TIMEOUT)
+    except LockNotAcquired:
+        raise HTTPException(
+            status_code=409,
+            detail="Another worker is loading the index, try again shortly"
+        )
+
+def _sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/stream")
+async def stream_query(query_request: QueryRequest):
+    """Process a query, streaming sources, answer tokens and timings as server-sent events"""
+    # The slot is held until the stream finishes, so take it before responding
+    slot = await query_limiter.lease()
+    try:
+        query_processor = await query_limiter.run_in_slot(_get_query_processor)
+    except Exception:
+        slot.release()
+        raise
+    if query_processor is None:
+        slot.release()
+        raise HTTPException(
+            status_code=500,
+            detail="Index not initialized"
+        )
+    
+    async def event_stream():
+        # The LLM stream is blocking, so each step runs on the query executor
+        try:
+            events = query_processor.stream_query(query_request.query)
+            async for event, data in query_limiter.iterate(events):
+                yield _sse_event(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            yield _sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+        finally:
+            # iterate has already handed the token stream to the executor to
+            # close, so the LLM stops generating before the slot is reused
+            slot.release()
+    
+    return ClosingStreamingResponse(
+        event_stream(),
+        slot.release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _start_batch(query_processor, queries, slot):
+    """Run a batch on the query executor, handing its results to a queue
+    
+    The worker owns the slots and frees them only once the batch has
+    stopped, including generations still running when the client left.
+    Setting the returned event stops the batch at its next result.
+    """
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+    cancel = threading.Event()
+    
+    def run():
+        batch = query_processor.process_batch(queries, generation_concurrency=slot.slots)
+        try:
+            for item in batch:
+                if cancel.is_set():
+                    break
+                loop.call_soon_threadsafe(results.put_nowait, item)
+        finally:
+            # Waits for running generations
+            batch.close()
+    
+    def finished(future):
+        slot.release()
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            logger.error(f"Error processing query batch: {str(error)}")
+        results.put_nowait(error or _BATCH_DONE)
+    
+    worker = asyncio.ensure_future(query_limiter.run_in_slot(run))
+    worker.add_done_callback(finished)
+    return results, cancel
+
+@router.post("/batch")
+async def batch_query(batch_request: BatchQueryRequest):
+    """Answer a list of queries, streaming one JSON line per query as its answer finishes
+    
+    Each line carries the index of the query in the request, the query and
+    either its answer and source nodes or an error.
+    """
+    queries = batch_request.queries
+    if not queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(queries) > settings.BATCH_QUERY_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(queries)} queries exceeds the limit of {settings.BATCH_QUERY_MAX_SIZE}"
+        )
+    
+    # One slot per concurrent generation, taken before responding; batches
+    # always leave a slot free for interactive queries
+    slot = await query_limiter.lease_batch(settings.BATCH_QUERY_GENERATION_CONCURRENCY)
+    try:
+        query_processor = await query_limiter.run_in_slot(_get_query_processor)
+    except Exception:
+        slot.release()
+        raise
+    if query_processor is None:
+        slot.release()
+        raise HTTPException(
+            status_code=500,
+            detail="Index not initialized"
+        )
+    
+    results, cancel = _start_batch(query_processor, queries, slot)
+    
+    async def result_stream():
+        while True:
+            item = await results.get()
+            if item is _BATCH_DONE:
+                return
+            if isinstance(item, Exception):
+                yield json.dumps({"error": f"Error processing batch: {str(item)}"}) + "\n"
+                return
+            positions, result = item
+            for position in positions:
+                yield json.dumps({"index": position, "query": queries[position], **result}) + "\n"
+    
+    # A client that goes away stops the batch from starting new work
+    return ClosingStreamingResponse(
+        result_stream(),
+        cancel.set,
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Add a method to explicitly refresh the index if needed
 @router.post("/refresh-index")
 async def refresh_index():
     """Force refresh the index - use when new documents are added"""
+    def refresh():
+        lock = _maintenance_lock()
+        try:
+            # Clear Redis state
+            container.index_manager.node_cache.clear_all()
+            
+            # Reinitialize
+            _build_index(lock)
+        finally:
+            lock.release()
+    
     try:
-        # Clear Redis state
-        redis_manager.clear_all()
-        
-        # Reinitialize
-        await initialize_index()
+        await run_in_threadpool(refresh)
         
         return {"status": "Index refreshed successfully"}
     except HTTPException:
@@ -129,25 +322,69 @@ async def refresh_index():
     
 @router.post("/rebuild-all-papers")
 async def rebuild_all_papers():
-    """Rebuild all papers"""
+    """Rebuild all papers into a new index generation while queries use the current one"""
+    def rebuild():
+        lock = _maintenance_lock()
+        try:
+            index_manager = container.index_manager
+            document_processor = container.document_processor
+            
+            # Re-parse every paper without touching what queries are served from
+            nodes, entries = document_processor.parse_directory()
+            
+            # Store and embed into a new generation, validate it and switch
+            # queries over; the previous generation keeps its own nodes
+            generation = index_manager.build_generation(lock, nodes=nodes)
+            document_processor.replace_manifest(entries)
+            container.redis_manager.mark_initialized(lock)
+            
+            # Build the query processor before reporting success
+            index_manager.warm_up()
+            return generation
+        finally:
+            lock.release()
+    
     try:
-        # Clear Redis state
-        redis_manager.clear_all()
+        generation = await run_in_threadpool(rebuild)
+        
+        return {"status": "All papers rebuilt successfully", "generation": generation}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error rebuilding all papers: {str(e)}"
+        )
 
-        # Delete all nodes from database
-        index_manager.node_store.delete_all_nodes()
+@router.get("/generations")
+async def list_generations():
+    """List index generations and the one serving queries"""
+    generations = container.index_manager.generations
+    return {
+        "current_generation": generations.current(),
+        "generations": generations.list()
+    }
 
-        # Delete the Pinecone index
-        index_manager.delete_vector_database()
-        
-        # Reinitialize
-        await initialize_index()
+@router.post("/rollback-generation")
+async def rollback_generation():
+    """Point queries back at the previous index generation"""
+    def rollback():
+        lock = _maintenance_lock()
+        try:
+            return container.index_manager.rollback_generation(lock)
+        finally:
+            lock.release()
+    
+    try:
+        generation = await run_in_threadpool(rollback)
         
-        return {"status": "All papers rebuilt successfully"}
+        return {"status": "Rolled back index generation", "generation": generation}
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Error rebuilding all papers: {str(e)}"
-        )
\ No newline at end of file
+            detail=f"Error rolling back index generation: {str(e)}"
+        )
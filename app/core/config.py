@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
@@ -17,12 +18,128 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./test.db")
     
+    # Vector store backend: "pinecone" or "local"
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "pinecone")
+    
     # Pinecone
-    PINECONE_API_KEY: str = os.getenv("PINECONE_API_KEY")
-    PINECONE_INDEX_NAME: str = os.getenv("PINECONE_INDEX_NAME")
+    # Only required when VECTOR_BACKEND=pinecone
+    PINECONE_API_KEY: Optional[str] = os.getenv("PINECONE_API_KEY")
+    PINECONE_INDEX_NAME: Optional[str] = os.getenv("PINECONE_INDEX_NAME")
     PINECONE_ENVIRONMENT: str = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
     
+    # Local vector store (VECTOR_BACKEND=local), IVF lists of 0 means exact search
+    LOCAL_VECTOR_DIR: str = os.getenv("LOCAL_VECTOR_DIR", "./vector_store")
+    LOCAL_VECTOR_IVF_LISTS: int = int(os.getenv("LOCAL_VECTOR_IVF_LISTS", "0"))
+    LOCAL_VECTOR_IVF_PROBES: int = int(os.getenv("LOCAL_VECTOR_IVF_PROBES", "8"))
+    
     # File storage
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./papers")
+    
+    # Ingestion
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "1"))
+    
+    # Node table writes: rows per bulk upsert statement, batches per commit
+    NODE_STORE_BATCH_SIZE: int = int(os.getenv("NODE_STORE_BATCH_SIZE", "500"))
+    NODE_STORE_COMMIT_INTERVAL: int = int(os.getenv("NODE_STORE_COMMIT_INTERVAL", "10"))
+    
+    # Vector upserts
+    UPSERT_BATCH_SIZE: int = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+    UPSERT_CONCURRENCY: int = int(os.getenv("UPSERT_CONCURRENCY", "4"))
+    UPSERT_MAX_RETRIES: int = int(os.getenv("UPSERT_MAX_RETRIES", "3"))
+    UPSERT_RETRY_BACKOFF: float = float(os.getenv("UPSERT_RETRY_BACKOFF", "1.0"))
+    
+    # Retrieval: "vector" (dense only) or "hybrid" (dense + BM25 with rank fusion)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "hybrid")
+    BM25_INDEX_PATH: str = os.getenv("BM25_INDEX_PATH", "./bm25_index.sqlite")
+    HYBRID_VECTOR_TOP_K: int = int(os.getenv("HYBRID_VECTOR_TOP_K", "8"))
+    HYBRID_BM25_TOP_K: int = int(os.getenv("HYBRID_BM25_TOP_K", "8"))
+    HYBRID_TOP_K: int = int(os.getenv("HYBRID_TOP_K", "10"))
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", "60"))
+    
+    # Retrieval depth: dense candidates handed to the reranker in "vector" mode
+    # (HYBRID_TOP_K in hybrid mode) and nodes the reranker keeps for the LLM
+    SIMILARITY_TOP_K: int = int(os.getenv("SIMILARITY_TOP_K", "12"))
+    RERANK_TOP_N: int = int(os.getenv("RERANK_TOP_N", "6"))
+    
+    # Chunking: "flat" (CHUNK_SIZE tokens) or "hierarchical" (nested chunks of
+    # HIERARCHICAL_CHUNK_SIZES, only the smallest are embedded), both with
+    # CHUNK_OVERLAP tokens of overlap. In hierarchical mode retrieved chunks are
+    # merged into their parent once more than AUTO_MERGE_RATIO of the parent's
+    # children were retrieved
+    CHUNKING_MODE: str = os.getenv("CHUNKING_MODE", "flat")
+    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "512"))
+    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "10"))
+    HIERARCHICAL_CHUNK_SIZES: str = os.getenv("HIERARCHICAL_CHUNK_SIZES", "2048,512,128")
+    AUTO_MERGE_RATIO: float = float(os.getenv("AUTO_MERGE_RATIO", "0.5"))
+    
+    # Query concurrency: slots running queries, bounded wait queue (429 when full)
+    # and the longest a request may wait for a slot (503 after that)
+    QUERY_MAX_CONCURRENCY: int = int(os.getenv("QUERY_MAX_CONCURRENCY", "4"))
+    QUERY_MAX_QUEUE: int = int(os.getenv("QUERY_MAX_QUEUE", "32"))
+    QUERY_QUEUE_TIMEOUT: float = float(os.getenv("QUERY_QUEUE_TIMEOUT", "30"))
+    
+    # Batch queries: most queries per request, vector searches run at once and
+    # answers generated at once. A batch takes one query slot per concurrent
+    # generation; batches between them hold at most QUERY_MAX_CONCURRENCY - 1
+    # slots, so interactive queries keep at least one. Vector searches are
+    # network round trips and run beside them
+    BATCH_QUERY_MAX_SIZE: int = int(os.getenv("BATCH_QUERY_MAX_SIZE", "500"))
+    BATCH_QUERY_RETRIEVE_CONCURRENCY: int = int(os.getenv("BATCH_QUERY_RETRIEVE_CONCURRENCY", "16"))
+    BATCH_QUERY_GENERATION_CONCURRENCY: int = int(os.getenv("BATCH_QUERY_GENERATION_CONCURRENCY", "2"))
+    
+    # Reranker micro-batching: pairs from concurrent queries share one forward pass
+    RERANK_MICRO_BATCHING: bool = os.getenv("RERANK_MICRO_BATCHING", "true").lower() == "true"
+    RERANK_MAX_BATCH_PAIRS: int = int(os.getenv("RERANK_MAX_BATCH_PAIRS", "64"))
+    RERANK_MAX_WAIT_MS: float = float(os.getenv("RERANK_MAX_WAIT_MS", "8"))
+    
+    # Semantic answer cache (Redis), off unless enabled. The threshold is the
+    # minimum cosine similarity for reusing an answer: at 0.95 paraphrases hit,
+    # but so can questions that differ in one entity, year or negation ("the
+    # 2019 paper" vs "the 2020 paper") and get the other question's answer.
+    # Raise it for fewer wrong hits, lower it for more reuse
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_TTL: int = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+    
+    # Redis node cache, nodes per pipelined write/read batch
+    REDIS_NODE_BATCH_SIZE: int = int(os.getenv("REDIS_NODE_BATCH_SIZE", "500"))
+    
+    # Redis lease locks for initialization and reindexing across workers: lease TTL
+    # (renewed while held), how long followers wait for the leader, how long a
+    # query waits for the node cache lock before it is answered with 409, poll interval
+    LOCK_TTL_SECONDS: float = float(os.getenv("LOCK_TTL_SECONDS", "30"))
+    LOCK_WAIT_TIMEOUT: float = float(os.getenv("LOCK_WAIT_TIMEOUT", "900"))
+    LOCK_REQUEST_WAIT_TIMEOUT: float = float(os.getenv("LOCK_REQUEST_WAIT_TIMEOUT", "2"))
+    LOCK_RETRY_INTERVAL: float = float(os.getenv("LOCK_RETRY_INTERVAL", "0.5"))
+    
+    # Index generations: how often query workers check for a switch (and whether
+    # their BM25 index is behind papers ingested by other instances), how long a
+    # new generation may take to show all its vectors, how long retired
+    # generations are kept for rollback before they are deleted, and how often
+    # each worker looks for expired ones (0 only collects at startup and after rebuilds)
+    GENERATION_CHECK_INTERVAL: float = float(os.getenv("GENERATION_CHECK_INTERVAL", "2"))
+    GENERATION_VALIDATE_TIMEOUT: float = float(os.getenv("GENERATION_VALIDATE_TIMEOUT", "120"))
+    GENERATION_GC_GRACE_SECONDS: float = float(os.getenv("GENERATION_GC_GRACE_SECONDS", "3600"))
+    GENERATION_GC_INTERVAL: float = float(os.getenv("GENERATION_GC_INTERVAL", "600"))
+    
+    # Docstore: "memory" loads every node into each worker, "lazy" fetches nodes
+    # on demand through an LRU of DOCSTORE_CACHE_SIZE nodes, Redis and the database.
+    # The LRU is emptied whenever another worker changes nodes
+    DOCSTORE_MODE: str = os.getenv("DOCSTORE_MODE", "lazy")
+    DOCSTORE_CACHE_SIZE: int = int(os.getenv("DOCSTORE_CACHE_SIZE", "2048"))
+    DOCSTORE_REDIS_TIER: bool = os.getenv("DOCSTORE_REDIS_TIER", "true").lower() == "true"
+    
+    # Embedding cache
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_MAX_BYTES: int = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    
+    # Query embedding cache: in-process LRU of QUERY_EMBEDDING_CACHE_SIZE vectors
+    # in front of a Redis tier shared by the workers, whose entries expire
+    # after QUERY_EMBEDDING_CACHE_TTL seconds
+    QUERY_EMBEDDING_CACHE_ENABLED: bool = os.getenv("QUERY_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+    QUERY_EMBEDDING_CACHE_REDIS: bool = os.getenv("QUERY_EMBEDDING_CACHE_REDIS", "true").lower() == "true"
+    QUERY_EMBEDDING_CACHE_TTL: int = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
 
 settings = Settings() 
\ No newline at end of file
@@ -0,0 +1,167 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """Process-wide registry of shared services, built once and lazily
+
+    Every component is created on first access (or by the background
+    warm-up) under a lock, so the API modules, the database helpers and the
+    startup hook all share one Redis connection, one IndexManager with its
+    vector store, embedding model and LLM, one DocumentProcessor and one
+    NodeStore (with its BM25 index connection) per index generation.
+    """
+
+    # Warm-up order, later components depend on earlier ones
+    COMPONENTS = ("redis_manager", "node_stores", "document_processor", "index_manager", "query_processor")
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._instances = {}
+        self._errors = {}
+        self._timings = {}
+        self._warm_up_thread = None
+
+    def _create_redis_manager(self):
+        from app.rag.redis_manager import RedisManager
+        return RedisManager()
+
+    def _create_node_stores(self):
+        from app.rag.node_store import GenerationNodeStores
+        return GenerationNodeStores()
+
+    def _create_document_processor(self):
+        from app.rag.document_processor import DocumentProcessor
+        return DocumentProcessor(node_stores=self.node_stores)
+
+    def _create_index_manager(self):
+        from app.rag.index_manager import IndexManager
+        return IndexManager(redis_manager=self.redis_manager, node_stores=self.node_stores)
+
+    def _get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                started = time.perf_counter()
+                try:
+                    instance = getattr(self, f"_create_{name}")()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                self._timings[name] = time.perf_counter() - started
+                self._errors.pop(name, None)
+                self._instances[name] = instance
+                logger.info(f"Initialized {name} in {self._timings[name]:.2f}s")
+            return instance
+
+    @property
+    def redis_manager(self):
+        return self._get("redis_manager")
+
+    @property
+    def node_stores(self):
+        return self._get("node_stores")
+
+    @property
+    def document_processor(self):
+        return self._get("document_processor")
+
+    @property
+    def index_manager(self):
+        return self._get("index_manager")
+
+    @property
+    def query_processor(self):
+        return self.get_query_processor()
+
+    def get_query_processor(self, lock_wait_timeout=None):
+        """Query processor, lock_wait_timeout bounds the wait for the node cache lock"""
+        # Owned by the IndexManager, which drops it whenever the index is rebuilt
+        started = time.perf_counter()
+        try:
+            query_processor = self.index_manager.get_query_processor(lock_wait_timeout)
+        except Exception as e:
+            self._errors["query_processor"] = str(e)
+            raise
+        if query_processor is not None and "query_processor" not in self._timings:
+            self._timings["query_processor"] = time.perf_counter() - started
+            logger.info(f"Initialized query_processor in {self._timings['query_processor']:.2f}s")
+        self._errors.pop("query_processor", None)
+        return query_processor
+
+    def _is_warm(self, name):
+        if name == "query_processor":
+            index_manager = self._instances.get("index_manager")
+            return index_manager is not None and index_manager.has_query_processor()
+        return name in self._instances
+
+    def override(self, **instances):
+        """Replace components with prebuilt instances (tests, benchmarks)"""
+        with self._lock:
+            for name, instance in instances.items():
+                if name not in self.COMPONENTS or name == "query_processor":
+                    raise ValueError(f"Unknown component: {name}")
+                self._instances[name] = instance
+
+    def reset(self, *names):
+        """Forget built components so they are created again on next use"""
+        with self._lock:
+            for name in names or self.COMPONENTS:
+                self._instances.pop(name, None)
+                self._timings.pop(name, None)
+
+    def warm_up(self):
+        """Build every component now, logging failures instead of raising
+
+        Once the IndexManager exists it also starts collecting expired index
+        generations, so they go away without waiting for the next rebuild.
+        """
+        for name in self.COMPONENTS:
+            try:
+                getattr(self, name)
+            except Exception as e:
+                logger.error(f"Error warming up {name}: {str(e)}")
+        index_manager = self._instances.get("index_manager")
+        if index_manager is not None:
+            index_manager.start_generation_gc()
+
+    def start_warm_up(self):
+        """Warm up in a background thread so startup returns immediately"""
+        if self._warm_up_thread is None or not self._warm_up_thread.is_alive():
+            self._warm_up_thread = threading.Thread(
+                target=self.warm_up,
+                name="service-warm-up",
+                daemon=True
+            )
+            self._warm_up_thread.start()
+
+    def readiness(self):
+        """Report which components are built and how long each took"""
+        components = {
+            name: {
+                "warm": self._is_warm(name),
+                "init_seconds": self._timings.get(name),
+                "error": self._errors.get(name)
+            }
+            for name in self.COMPONENTS
+        }
+        return {
+            "ready": all(component["warm"] for component in components.values()),
+            "components": components
+        }
+
+    def shutdown(self):
+        """Stop background work and release shared connections"""
+        index_manager = self._instances.get("index_manager")
+        if index_manager is not None:
+            index_manager.stop_generation_gc()
+        redis_manager = self._instances.get("redis_manager")
+        if redis_manager is not None:
+            redis_manager.cleanup()
+
+container = ServiceContainer()
@@ -0,0 +1,138 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from llama_index.core.utils import get_tokenizer
+
+# Query stages: embed_query, vector_search, bm25_search, retrieve (including
+# fusion and auto-merging), rerank, synthesize, and the whole query. Batch
+# queries embed and rerank all their queries at once (batch_embed, batch_rerank)
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds",
+    "Time spent in each stage of answering a query",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+
+# Node loads from the Redis node cache and the nodes table
+STORE_LOAD_SECONDS = Histogram(
+    "rag_store_load_seconds",
+    "Time spent loading nodes from Redis or the database",
+    ["store", "operation"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+# Caches: semantic (answers), embedding (ingestion vectors), docstore (LRU),
+# query_embedding_lru and query_embedding_redis (the two query vector tiers)
+CACHE_REQUESTS = Counter(
+    "rag_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"]
+)
+
+# Tokens: context sent to the LLM and answer tokens generated
+LLM_TOKENS = Counter(
+    "rag_llm_tokens_total",
+    "Tokens sent to and generated by the LLM",
+    ["kind"]
+)
+
+ERRORS = Counter(
+    "rag_errors_total",
+    "Errors by the operation that failed",
+    ["operation"]
+)
+
+# Ingestion: items processed in total and the throughput of the latest run per
+# stage (parse_files: PDFs, parse_nodes: nodes split from them, store: node
+# table writes, upsert: vectors embedded and written)
+INGEST_ITEMS = Counter(
+    "rag_ingest_items_total",
+    "Items processed by ingestion stage",
+    ["stage"]
+)
+INGEST_THROUGHPUT = Gauge(
+    "rag_ingest_items_per_second",
+    "Throughput of the most recent run of an ingestion stage",
+    ["stage"],
+    multiprocess_mode="mostrecent"
+)
+
+_tokenizer = None
+
+@contextmanager
+def observe_stage(stage):
+    """Time a block of query work into the stage histogram"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        QUERY_STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+@contextmanager
+def observe_load(store, operation):
+    """Time a node load from Redis or the database"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STORE_LOAD_SECONDS.labels(store, operation).observe(time.perf_counter() - started)
+
+def record_cache(cache, hits, misses=0):
+    """Count cache hits and misses"""
+    if hits:
+        CACHE_REQUESTS.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(cache, "miss").inc(misses)
+
+def record_ingest(stage, count, seconds):
+    """Count items of an ingestion stage and publish its throughput"""
+    INGEST_ITEMS.labels(stage).inc(count)
+    if count and seconds > 0:
+        INGEST_THROUGHPUT.labels(stage).set(count / seconds)
+
+def count_tokens(text):
+    """Number of tokens in a text, with the tokenizer llama-index budgets prompts with"""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = get_tokenizer()
+    return len(_tokenizer(text)) if text else 0
+
+def clear_multiprocess_dir():
+    """Delete sample files left in PROMETHEUS_MULTIPROC_DIR by earlier runs
+
+    Must run in the launcher before any worker starts: samples of dead
+    workers would otherwise be added to every counter after a restart.
+    """
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+
+def mark_process_dead(pid=None):
+    """Drop the live gauge samples of a worker that is exiting"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+def render_metrics():
+    """Metrics in the Prometheus text format, with the content type to serve them with
+
+    With PROMETHEUS_MULTIPROC_DIR set (several worker processes), samples
+    written by every worker are aggregated.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
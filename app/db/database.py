@@ -6,13 +6,9 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy import Column, Integer, String, Text, DateTime
 from sqlalchemy.sql import func
 from app.core.config import settings
-from app.rag.redis_manager import RedisManager
 
 logger = logging.getLogger(__name__)
 
-# Create Redis manager
-redis_manager = RedisManager()
-
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
 # Create SQLAlchemy engine
@@ -28,7 +24,7 @@ class Base(DeclarativeBase):
     pass
 
 # Import models to ensure they are registered with Base
-from app.db.models import Node
+from app.db.models import Node, PaperManifest, EmbeddingCacheEntry
 
 # Dependency to get DB session
 def get_db():
@@ -40,11 +36,15 @@ def get_db():
 
 def init_db():
     """Initialize the database"""
-    try:
-        # Check if database is already initialized in Redis
-        if redis_manager.redis_client.get("db_initialized"):
-            return  # Silently return if already initialized
-
+    # Imported here, the container builds services that import this module
+    from app.core.container import container
+    from app.rag.distributed_lock import run_as_leader
+    redis_manager = container.redis_manager
+    
+    def is_initialized():
+        return bool(redis_manager.redis_client.get("db_initialized"))
+    
+    def create_tables(lock):
         # Create all tables
         Base.metadata.create_all(bind=engine)
         
@@ -53,8 +53,16 @@ def init_db():
             db.execute(text("SELECT 1"))
         
         # Mark database as initialized in Redis
-        redis_manager.redis_client.set("db_initialized", "true")
+        lock.fenced_set("db_initialized", "true")
         logger.info("Database initialized")
+    
+    try:
+        # Check if database is already initialized in Redis
+        if is_initialized():
+            return  # Silently return if already initialized
+        
+        # One worker creates the tables, the others wait for it
+        run_as_leader(redis_manager.redis_client, "db-init", create_tables, is_ready=is_initialized)
         
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
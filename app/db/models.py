@@ -1,12 +1,68 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+import threading
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, LargeBinary
+from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.sql import func
 from app.db.database import Base
 
-class Node(Base):
-    __tablename__ = "nodes"
-
+class NodeColumns:
+    """Columns of a nodes table, shared by every index generation"""
     id = Column(Integer, primary_key=True, index=True)
     node_id = Column(String, unique=True, index=True)
     node_text = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    node_metadata = Column(Text, nullable=True) 
\ No newline at end of file
+    node_metadata = Column(Text, nullable=True) 
+
+class Node(NodeColumns, Base):
+    __tablename__ = "nodes"
+
+class GenerationBase(DeclarativeBase):
+    """Tables of index generations, created and dropped at runtime rather than by init_db"""
+    pass
+
+_generation_node_models = {}
+_generation_node_models_lock = threading.Lock()
+
+def node_model(generation=0):
+    """Model of the nodes table of an index generation
+
+    Generation 0 uses the nodes table, every later generation gets a
+    nodes_gen_<n> table of its own.
+    """
+    if not generation:
+        return Node
+    with _generation_node_models_lock:
+        model = _generation_node_models.get(generation)
+        if model is None:
+            model = type(
+                f"GenerationNode{generation}",
+                (NodeColumns, GenerationBase),
+                {"__tablename__": f"nodes_gen_{generation}"}
+            )
+            _generation_node_models[generation] = model
+        return model
+
+class PaperManifest(Base):
+    __tablename__ = "paper_manifest"
+
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, unique=True, index=True)
+    arxiv_id = Column(String, index=True)
+    content_hash = Column(String)
+    file_size = Column(Integer)
+    mtime = Column(Float)
+    chunker_config = Column(Text)
+    node_ids = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True)
+    model_name = Column(String)
+    dimensions = Column(Integer)
+    embedding = Column(LargeBinary)
+    size_bytes = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
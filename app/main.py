@@ -2,6 +2,7 @@ import logging
 import os
 import atexit
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
@@ -9,7 +10,9 @@ from app.api.endpoints import papers, queries
 from app.core.config import settings
 from app.db.database import init_db
 from app.api.endpoints.queries import initialize_index
-from app.rag.redis_manager import RedisManager
+from app.api.concurrency import query_limiter
+from app.core.container import container
+from app.core.metrics import mark_process_dead, render_metrics
 
 # Configure logging
 logging.basicConfig(
@@ -20,15 +23,10 @@ logging.basicConfig(
 # Create upload directory if it doesn't exist
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
-# Global Redis manager instance
-redis_manager = None
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global redis_manager
-    
     # Initialize Redis
-    redis_manager = RedisManager()
+    redis_manager = container.redis_manager
     
     # Only initialize if not already initialized
     if not redis_manager.is_initialized():
@@ -44,18 +42,21 @@ async def lifespan(app: FastAPI):
     else:
         logging.info("Using existing system state from Redis")
     
+    # Load models, vector store and nodes in the background, /ready reports progress
+    container.start_warm_up()
+    
     yield
     
     # Cleanup on shutdown
-    if redis_manager:
-        try:
-            redis_manager.cleanup()
-            logging.info("Cleaned up Redis resources")
-        except Exception as e:
-            logging.error(f"Error during Redis cleanup: {str(e)}")
+    try:
+        container.shutdown()
+        logging.info("Cleaned up Redis resources")
+    except Exception as e:
+        logging.error(f"Error during Redis cleanup: {str(e)}")
+    mark_process_dead()
 
 # Register cleanup function with atexit
-atexit.register(lambda: redis_manager.cleanup() if redis_manager else None)
+atexit.register(container.shutdown)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -80,6 +81,19 @@ app.include_router(queries.router, prefix=f"{settings.API_V1_STR}/queries", tags
 async def root():
     return {"message": "Welcome to the RAG Research Paper Assistant API"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe, 503 until every shared service has been warmed up"""
+    readiness = container.readiness()
+    readiness["queries"] = query_limiter.stats()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage query latency, cache hits, tokens, errors and ingestion throughput"""
+    data, content_type = render_metrics()
+    return Response(content=data, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -0,0 +1,227 @@
+import os
+import re
+import math
+import logging
+import sqlite3
+import threading
+from collections import Counter
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Keeps arXiv ids (2401.12345), versions and hyphenated names (bge-reranker-base) whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+TOKEN_SEPARATORS = re.compile(r"[._\-/]")
+
+# Very common words carry no signal and would produce huge posting lists
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or
+that the their there these this those to was were will with which what how
+""".split())
+
+# Keep IN (...) lists well below SQLite's parameter limit
+QUERY_BATCH_SIZE = 500
+
+def generation_index_path(generation=0, path=None):
+    """BM25 index file of an index generation, generation 0 uses BM25_INDEX_PATH"""
+    path = path or settings.BM25_INDEX_PATH
+    if not generation:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.gen-{generation}{extension}"
+
+def tokenize(text):
+    """Lowercase and split text into BM25 terms"""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token not in STOPWORDS:
+            terms.append(token)
+        # Compound tokens are indexed whole and by their parts
+        if TOKEN_SEPARATORS.search(token):
+            terms.extend(
+                part for part in TOKEN_SEPARATORS.split(token)
+                if part and part not in STOPWORDS
+            )
+    return terms
+
+def _index_text(node):
+    """Text indexed for a node: its content plus identifying metadata"""
+    metadata = node.metadata or {}
+    extra = " ".join(
+        str(metadata[key]) for key in ('arxiv_id', 'filename') if metadata.get(key)
+    )
+    return f"{node.get_content()} {extra}"
+
+
+class BM25Index:
+    """Inverted BM25 index persisted in a SQLite file
+
+    Postings are stored per (term, node) together with the node length, so
+    adding or removing nodes only touches their own rows and any process
+    can open the same file for searching. The file also records the node
+    version (see RedisManager.bump_nodes_version) it was last synced at.
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path or settings.BM25_INDEX_PATH
+        self.k1 = k1
+        self.b = b
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT, node_id TEXT, tf INTEGER, doc_length INTEGER, "
+            "PRIMARY KEY (term, node_id)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS postings_node_id ON postings (node_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS docs (node_id TEXT PRIMARY KEY, length INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def _remove(self, node_ids):
+        for start in range(0, len(node_ids), QUERY_BATCH_SIZE):
+            batch = node_ids[start:start + QUERY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            self._db.execute(f"DELETE FROM postings WHERE node_id IN ({placeholders})", batch)
+            self._db.execute(f"DELETE FROM docs WHERE node_id IN ({placeholders})", batch)
+
+    def _insert(self, nodes):
+        """Write the rows of nodes, replacing previous versions, returning how many were written"""
+        postings = []
+        docs = []
+        for node in nodes:
+            counts = Counter(tokenize(_index_text(node)))
+            length = sum(counts.values())
+            docs.append((node.node_id, length))
+            postings.extend((term, node.node_id, tf, length) for term, tf in counts.items())
+        self._remove([node_id for node_id, _ in docs])
+        self._db.executemany("INSERT INTO docs (node_id, length) VALUES (?, ?)", docs)
+        self._db.executemany(
+            "INSERT INTO postings (term, node_id, tf, doc_length) VALUES (?, ?, ?, ?)",
+            postings
+        )
+        return len(docs)
+
+    def add_nodes(self, nodes):
+        """Index nodes, replacing any previous version of the same ids"""
+        if not nodes:
+            return
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                count = self._insert(nodes)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        logger.info(f"Indexed {count} nodes in BM25 index")
+
+    def rebuild(self, batches, version):
+        """Replace every node with the given batches and record version, in one transaction
+
+        Other processes keep searching the previous contents until the
+        rebuild commits. Returns the number of nodes indexed.
+        """
+        count = 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute("DELETE FROM postings")
+                self._db.execute("DELETE FROM docs")
+                for nodes in batches:
+                    count += self._insert(nodes)
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return count
+
+    def synced_version(self):
+        """Node version the index was last synced at, None if never"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def mark_synced(self, version, previous=None):
+        """Record that the index holds the nodes of version
+
+        With previous, only when the index was in sync at previous: a change
+        made elsewhere in between still leaves it stale.
+        """
+        with self._lock:
+            if previous is None:
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+                return True
+            cursor = self._db.execute(
+                "UPDATE meta SET value = ? WHERE key = 'version' AND value = ?", (version, previous)
+            )
+            return cursor.rowcount == 1
+
+    def remove_nodes(self, node_ids):
+        """Remove nodes from the index"""
+        if not node_ids:
+            return
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._remove(list(node_ids))
+            self._db.execute("COMMIT")
+
+    def retain_nodes(self, node_ids):
+        """Remove every node that is not in node_ids"""
+        keep = set(node_ids)
+        with self._lock:
+            stale = [node_id for (node_id,) in self._db.execute("SELECT node_id FROM docs") if node_id not in keep]
+        self.remove_nodes(stale)
+
+    def clear(self):
+        """Remove every node from the index"""
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM docs")
+            self._db.execute("COMMIT")
+
+    def drop(self):
+        """Close the index and delete its files"""
+        with self._lock:
+            self._db.close()
+            for path in (self.path, f"{self.path}-wal", f"{self.path}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def count(self):
+        """Number of indexed nodes"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, query, top_k=10):
+        """Return (node_id, score) pairs for the best matching nodes"""
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count, total_length = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+            ).fetchone()
+            if doc_count == 0:
+                return []
+            placeholders = ",".join("?" * len(terms))
+            rows = self._db.execute(
+                f"SELECT term, node_id, tf, doc_length FROM postings WHERE term IN ({placeholders})",
+                terms
+            ).fetchall()
+
+        avg_length = total_length / doc_count
+        document_frequency = Counter(term for term, _, _, _ in rows)
+        scores = Counter()
+        for term, node_id, tf, doc_length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * doc_length / avg_length)
+            scores[node_id] += idf * tf * (self.k1 + 1) / norm
+        return scores.most_common(top_k)
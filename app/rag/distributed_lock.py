@@ -0,0 +1,198 @@
+import time
+import logging
+import threading
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Held by whichever worker initializes, reindexes or rebuilds the index
+INDEX_MAINTENANCE_LOCK = "index-maintenance"
+
+# Take the lease and hand out the next fencing token in one step
+_ACQUIRE_SCRIPT = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    local token = redis.call('incr', KEYS[2])
+    redis.call('set', KEYS[1], ARGV[1] .. ':' .. token, 'PX', ARGV[2])
+    return token
+end
+return false
+"""
+
+# Extend the lease only while we still hold it
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Release only our own lease, never one taken over after ours expired
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Write a key only while the lease is still ours
+_FENCED_SET_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('set', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+class LockNotAcquired(Exception):
+    """Raised when a lease could not be taken within the wait timeout"""
+
+
+class LockLost(Exception):
+    """Raised when a write is about to be made after the lease was lost"""
+
+
+class RedisLeaseLock:
+    """Lease lock in Redis shared by every worker process and instance
+
+    The lease is a key set with NX and a TTL, renewed from a background
+    thread while held, so a crashed holder frees it after at most one TTL.
+    Each acquisition gets a fencing token from an INCR counter; Redis writes
+    that must not land after the lease was lost go through fenced_set.
+    SQL and vector writes cannot be fenced by Redis, so their callers call
+    check() before each batch instead. A holder whose lease expired then
+    stops within one batch, but that batch can still land. Create one
+    instance per acquisition.
+    """
+
+    def __init__(self, redis_client, name, ttl=None, wait_timeout=None, retry_interval=None):
+        self.redis_client = redis_client
+        self.name = name
+        self.key = f"lock:{name}"
+        self.fence_key = f"lock:{name}:fence"
+        self.ttl = ttl or settings.LOCK_TTL_SECONDS
+        self.wait_timeout = settings.LOCK_WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+        self.retry_interval = retry_interval or settings.LOCK_RETRY_INTERVAL
+        self.token = None
+        self.lost = False
+        self._value = None
+        self._owner = f"{threading.get_ident()}-{time.time_ns()}"
+        self._stop_renewal = threading.Event()
+        self._renewal_thread = None
+
+    def _ttl_ms(self):
+        return int(self.ttl * 1000)
+
+    def acquire(self, blocking=True, timeout=None):
+        """Take the lease, returning the fencing token or None if not taken"""
+        timeout = self.wait_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            token = self.redis_client.eval(
+                _ACQUIRE_SCRIPT, 2, self.key, self.fence_key, self._owner, self._ttl_ms()
+            )
+            if token:
+                self.token = int(token)
+                self._value = f"{self._owner}:{self.token}"
+                self.lost = False
+                self._start_renewal()
+                logger.info(f"Acquired lock {self.name} (token {self.token})")
+                return self.token
+            if not blocking or time.monotonic() >= deadline:
+                return None
+            time.sleep(self.retry_interval)
+
+    def _start_renewal(self):
+        self._stop_renewal.clear()
+        self._renewal_thread = threading.Thread(
+            target=self._renew_loop,
+            name=f"lock-renewal-{self.name}",
+            daemon=True
+        )
+        self._renewal_thread.start()
+
+    def _renew_loop(self):
+        while not self._stop_renewal.wait(self.ttl / 3):
+            try:
+                renewed = self.redis_client.eval(
+                    _RENEW_SCRIPT, 1, self.key, self._value, self._ttl_ms()
+                )
+            except Exception as e:
+                logger.warning(f"Could not renew lock {self.name}: {str(e)}")
+                continue
+            if not renewed:
+                self.lost = True
+                logger.error(f"Lost lock {self.name} (token {self.token})")
+                return
+
+    def is_held(self):
+        """Whether the lease is still ours"""
+        if self._value is None:
+            return False
+        current = self.redis_client.get(self.key)
+        return current is not None and current.decode() == self._value
+
+    def check(self):
+        """Raise LockLost unless the lease is still ours"""
+        if self.lost or not self.is_held():
+            raise LockLost(f"Lost lock {self.name} (token {self.token})")
+
+    def fenced_set(self, key, value):
+        """Set a key only if the lease is still ours, returning whether it was written"""
+        if self._value is None:
+            return False
+        return bool(self.redis_client.eval(_FENCED_SET_SCRIPT, 2, self.key, key, self._value, value))
+
+    def release(self):
+        """Give the lease up"""
+        self._stop_renewal.set()
+        if self._value is None:
+            return
+        try:
+            self.redis_client.eval(_RELEASE_SCRIPT, 1, self.key, self._value)
+            logger.info(f"Released lock {self.name} (token {self.token})")
+        except Exception as e:
+            # The lease expires on its own after the TTL
+            logger.error(f"Error releasing lock {self.name}: {str(e)}")
+        finally:
+            self._value = None
+
+    def __enter__(self):
+        if self.acquire() is None:
+            raise LockNotAcquired(f"Timed out waiting for lock {self.name}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def run_as_leader(redis_client, name, func, is_ready=None, wait_timeout=None):
+    """Run func in exactly one worker while the others wait for it
+
+    The worker that takes the lease runs func. The others poll until
+    is_ready() reports the work as done (and return None), or until the
+    lease is free again, e.g. because the leader died, and then compete
+    for it once more.
+    """
+    wait_timeout = settings.LOCK_WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+    deadline = time.monotonic() + wait_timeout
+    while True:
+        if is_ready is not None and is_ready():
+            return None
+        lock = RedisLeaseLock(redis_client, name)
+        if lock.acquire(blocking=False) is not None:
+            try:
+                # The previous leader may have finished while we were waiting
+                if is_ready is not None and is_ready():
+                    return None
+                return func(lock)
+            finally:
+                lock.release()
+
+        logger.info(f"Waiting for the leader of {name}")
+        while redis_client.exists(lock.key):
+            if is_ready is not None and is_ready():
+                return None
+            if time.monotonic() >= deadline:
+                raise LockNotAcquired(f"Timed out waiting for the leader of {name}")
+            time.sleep(lock.retry_interval)
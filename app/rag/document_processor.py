@@ -1,26 +1,148 @@
 import os
+import json
+import hashlib
 import logging
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List
 from llama_index.core import Document
-from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.node_parser import HierarchicalNodeParser, SentenceSplitter
 from llama_index.core import SimpleDirectoryReader
 from llama_index.core import Settings
 
 from app.core.config import settings
-from app.rag.node_store import NodeStore
+from app.core.metrics import record_ingest
+from app.rag.node_store import GenerationNodeStores
+from app.rag.manifest_store import ManifestStore
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class DirectorySyncResult:
+    """Outcome of an incremental directory sync"""
+    nodes: List = field(default_factory=list)
+    removed_node_ids: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+def clean_text(text):
+    """Clean text by removing problematic characters"""
+    if not text:
+        return ""
+    
+    # Replace null characters
+    text = text.replace('\x00', '')
+    
+    # Replace other problematic control characters
+    text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
+    
+    # Handle Unicode surrogate pairs by replacing them with placeholders
+    # This is a common issue with mathematical symbols in papers
+    text = text.encode('ascii', 'replace').decode('ascii')
+    
+    return text
+
+def _node_id(i, doc):
+    """Deterministic node id so serial and parallel runs agree"""
+    return f"{doc.node_id}:{i}"
+
+def paper_arxiv_id(file_path):
+    """arXiv id of a paper, taken from its file name"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+def build_splitter(chunker_config):
+    """Build the node parser described by a chunker config dict"""
+    if chunker_config['splitter'] == 'HierarchicalNodeParser':
+        # Each level splits the chunks of the level above, child ids extend
+        # their parent's id so a paper's nodes keep the arxiv id prefix
+        node_parser_ids = [f"chunk_size_{chunk_size}" for chunk_size in chunker_config['chunk_sizes']]
+        return HierarchicalNodeParser.from_defaults(
+            node_parser_ids=node_parser_ids,
+            node_parser_map={
+                node_parser_id: SentenceSplitter(
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunker_config['chunk_overlap'],
+                    id_func=_node_id
+                )
+                for node_parser_id, chunk_size in zip(node_parser_ids, chunker_config['chunk_sizes'])
+            }
+        )
+    return SentenceSplitter(
+        chunk_size=chunker_config['chunk_size'],
+        chunk_overlap=chunker_config['chunk_overlap'],
+        id_func=_node_id
+    )
+
+def split_document(doc, splitter, page_index=0):
+    """Clean a loaded document, attach arXiv metadata and split it into nodes"""
+    # Clean text to remove problematic characters
+    cleaned_text = clean_text(doc.text)
+    
+    # Extract metadata from file path
+    file_path = doc.metadata.get('file_path', '') if doc.metadata else ''
+    filename = os.path.basename(file_path)
+    arxiv_id = paper_arxiv_id(filename)  # Remove .pdf extension
+    arxiv_url = f"https://arxiv.org/pdf/{arxiv_id}"
+    
+    # Create metadata for this specific document
+    metadata = {
+        'arxiv_url': arxiv_url,
+        'filename': filename,
+        'arxiv_id': arxiv_id
+    }
+    
+    # Create a document with cleaned text and metadata, the id keys the
+    # node ids to the paper and page they came from
+    clean_doc = Document(
+        id_=f"{arxiv_id}:{page_index}",
+        text=cleaned_text,
+        metadata=metadata
+    )
+    
+    # Parse this document into nodes
+    return splitter.get_nodes_from_documents([clean_doc])
+
+def parse_pdf(file_path, chunker_config):
+    """Load a single PDF and split all of its pages into nodes
+    
+    Module-level so it can be shipped to worker processes.
+    """
+    splitter = build_splitter(chunker_config)
+    documents = SimpleDirectoryReader(
+        input_files=[file_path],
+        filename_as_id=True,
+    ).load_data()
+    
+    nodes = []
+    for page_index, doc in enumerate(documents):
+        nodes.extend(split_document(doc, splitter, page_index))
+    return nodes
+
 class DocumentProcessor:
-    def __init__(self):
+    def __init__(self, workers=None, node_stores=None):
         self.upload_dir = settings.UPLOAD_DIR
-        self.node_store = NodeStore()
+        # Shared with the IndexManager, one NodeStore per index generation
+        self.node_stores = node_stores or GenerationNodeStores()
+        self.manifest_store = ManifestStore()
         
-        # Initialize sentence splitter
-        self.text_splitter = SentenceSplitter(
-            chunk_size=512,
-            chunk_overlap=10
-        )
+        # Number of processes used to parse and split PDFs, 1 keeps it serial
+        self.workers = max(1, workers or settings.INGEST_WORKERS)
+        
+        # Initialize sentence splitter, or the nested splitters of hierarchical mode
+        if settings.CHUNKING_MODE == "hierarchical":
+            self.chunker = {
+                'splitter': 'HierarchicalNodeParser',
+                'chunk_sizes': [int(size) for size in settings.HIERARCHICAL_CHUNK_SIZES.split(",")],
+                'chunk_overlap': settings.CHUNK_OVERLAP
+            }
+        else:
+            self.chunker = {
+                'splitter': 'SentenceSplitter',
+                'chunk_size': settings.CHUNK_SIZE,
+                'chunk_overlap': settings.CHUNK_OVERLAP
+            }
+        self.text_splitter = build_splitter(self.chunker)
         
         # Set text splitter globally
         Settings.text_splitter = self.text_splitter
@@ -31,78 +153,300 @@ class DocumentProcessor:
     
     def _clean_text(self, text):
         """Clean text by removing problematic characters"""
-        if not text:
-            return ""
+        return clean_text(text)
+    
+    def _chunker_config(self):
+        """Serialize the chunker settings that affect the produced nodes"""
+        return json.dumps(self.chunker, sort_keys=True)
+    
+    def _hash_file(self, file_path):
+        """Compute the SHA-256 of a file without loading it into memory"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _scan_directory(self):
+        """List PDF files in the upload directory keyed by their relative path"""
+        files = {}
+        for root, _, filenames in os.walk(self.upload_dir):
+            for name in filenames:
+                if name.lower().endswith('.pdf'):
+                    file_path = os.path.join(root, name)
+                    files[os.path.relpath(file_path, self.upload_dir)] = file_path
+        return dict(sorted(files.items()))
+    
+    def _parse_files(self, file_paths):
+        """Parse PDFs into nodes, fanning out to a process pool when enabled
+        
+        Results come back in input order whichever mode is used.
+        """
+        started = time.perf_counter()
+        if self.workers == 1 or len(file_paths) < 2:
+            results = [parse_pdf(file_path, self.chunker) for file_path in file_paths]
+        else:
+            workers = min(self.workers, len(file_paths))
+            logger.info(f"Parsing {len(file_paths)} files with {workers} worker processes")
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    parse_pdf,
+                    file_paths,
+                    [self.chunker] * len(file_paths)
+                ))
+        
+        elapsed = time.perf_counter() - started
+        record_ingest("parse_files", len(file_paths), elapsed)
+        record_ingest("parse_nodes", sum(len(nodes) for nodes in results), elapsed)
+        for file_path, nodes in zip(file_paths, results):
+            logger.info(f"Processed document {os.path.basename(file_path)}: {len(nodes)} nodes")
+        return results
+    
+    def _node_stores(self, generations):
+        """NodeStores of the given index generations"""
+        return [self.node_stores.get(generation) for generation in generations]
+    
+    def _manifest_entry(self, rel_path, stat, content_hash, chunker_config, doc_nodes):
+        """Manifest fields recording one processed file"""
+        return {
+            'filename': rel_path,
+            'arxiv_id': paper_arxiv_id(rel_path),
+            'content_hash': content_hash,
+            'file_size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'chunker_config': chunker_config,
+            'node_ids': [node.node_id for node in doc_nodes]
+        }
+    
+    def _paper_node_ids(self, node_stores, arxiv_id=None):
+        """Ids each node store holds, as one dict of arxiv id -> node ids per store
         
-        # Replace null characters
-        text = text.replace('\x00', '')
+        Generations chunked with different settings hold different ids for
+        the same paper, and the manifest only lists those of the latest build.
+        """
+        stored = []
+        for node_store in node_stores:
+            paper_ids = {}
+            for row in node_store.iter_rows(columns=['node_id'], arxiv_id=arxiv_id):
+                paper_ids.setdefault(arxiv_id or row['node_id'].split(':', 1)[0], set()).add(row['node_id'])
+            stored.append(paper_ids)
+        return stored
+    
+    def _store_file_nodes(self, rel_path, stat, content_hash, entry, chunker_config, doc_nodes, result,
+                          node_stores, stored_ids, lock=None):
+        """Replace the stored nodes of one file and record it in the manifest"""
+        arxiv_id = paper_arxiv_id(rel_path)
+        new_ids = {node.node_id for node in doc_nodes}
+        old_ids = set(entry['node_ids']) if entry else set()
+        removed = set()
         
-        # Replace other problematic control characters
-        text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
+        # Store nodes before recording them in the manifest so an
+        # interrupted run reprocesses the file next time
+        for node_store, paper_ids in zip(node_stores, stored_ids):
+            stale_ids = sorted((old_ids | paper_ids.get(arxiv_id, set())) - new_ids)
+            if lock is not None:
+                lock.check()
+            node_store.delete_nodes(stale_ids)
+            node_store.store_nodes(doc_nodes)
+            removed.update(stale_ids)
+        self.manifest_store.upsert_entry(
+            **self._manifest_entry(rel_path, stat, content_hash, chunker_config, doc_nodes)
+        )
         
-        # Handle Unicode surrogate pairs by replacing them with placeholders
-        # This is a common issue with mathematical symbols in papers
-        text = text.encode('ascii', 'replace').decode('ascii')
+        result.nodes.extend(doc_nodes)
+        result.removed_node_ids.extend(sorted(removed))
+    
+    def process_file(self, file_path, generations=(0,), lock=None):
+        """Ingest or re-ingest a single PDF, touching only that paper's nodes
         
-        return text
+        Nodes are written to the node stores of the given index generations,
+        with a lock only while its lease is still held.
+        Returns a DirectorySyncResult with the new nodes and the ids of the
+        paper's previous nodes that no longer exist.
+        """
+        try:
+            rel_path = os.path.relpath(file_path, self.upload_dir)
+            chunker_config = self._chunker_config()
+            entry = self.manifest_store.get_entry(rel_path)
+            stat = os.stat(file_path)
+            content_hash = self._hash_file(file_path)
+            
+            result = DirectorySyncResult()
+            if entry is not None and entry['chunker_config'] == chunker_config and entry['content_hash'] == content_hash:
+                self.manifest_store.touch_entry(rel_path, stat.st_mtime)
+                result.unchanged = 1
+                logger.info(f"Document {rel_path} is unchanged")
+                return result
+            
+            doc_nodes = self._parse_files([file_path])[0]
+            node_stores = self._node_stores(generations)
+            self._store_file_nodes(
+                rel_path, stat, content_hash, entry, chunker_config, doc_nodes, result,
+                node_stores, self._paper_node_ids(node_stores, paper_arxiv_id(rel_path)), lock
+            )
+            return result
+        except Exception as e:
+            logger.error(f"Error processing file {file_path}: {str(e)}")
+            raise
     
-    def process_directory(self):
-        """Process all PDF files in the upload directory"""
+    def find_paper_file(self, arxiv_id):
+        """Path of the stored PDF for a paper, None if there is none"""
+        for rel_path in self.manifest_store.find_by_arxiv_id(arxiv_id):
+            file_path = os.path.join(self.upload_dir, rel_path)
+            if os.path.exists(file_path):
+                return file_path
+        file_path = os.path.join(self.upload_dir, f"{arxiv_id}.pdf")
+        return file_path if os.path.exists(file_path) else None
+    
+    def remove_paper(self, arxiv_id, delete_file=True, generations=(0,), lock=None):
+        """Delete a paper's nodes, manifest entries and PDF, returning the removed node ids
+        
+        Nodes are deleted from the node stores of the given index generations,
+        with a lock only while its lease is still held.
+        """
         try:
-            # Load all PDF files from the directory
-            documents = SimpleDirectoryReader(
-                input_dir=self.upload_dir,
-                recursive=True,
-                filename_as_id=True,
-                required_exts=['.pdf'],
-            ).load_data()
+            node_stores = self._node_stores(generations)
+            entries = self.manifest_store.find_by_arxiv_id(arxiv_id)
+            node_ids = {node_id for entry in entries.values() for node_id in entry['node_ids']}
+            # Node ids start with the arxiv id, this also catches nodes the manifest missed
+            for node_store in node_stores:
+                node_ids.update(
+                    row['node_id'] for row in node_store.iter_rows(columns=['node_id'], arxiv_id=arxiv_id)
+                )
+            node_ids = sorted(node_ids)
             
-            if not documents:
-                logger.warning(f"No documents found in {self.upload_dir}")
-                return None
+            for node_store in node_stores:
+                if lock is not None:
+                    lock.check()
+                node_store.delete_nodes(node_ids)
+            if delete_file:
+                file_path = self.find_paper_file(arxiv_id)
+                if file_path is not None:
+                    os.remove(file_path)
+            self.manifest_store.delete_entries(list(entries))
+            logger.info(f"Removed paper {arxiv_id}: {len(node_ids)} nodes")
+            return node_ids
+        except Exception as e:
+            logger.error(f"Error removing paper {arxiv_id}: {str(e)}")
+            raise
+    
+    def sync_directory(self, full=False, generations=(0,), lock=None):
+        """Process only new or changed PDFs and drop nodes of removed ones
+        
+        Files are compared against the manifest by size and mtime first and
+        by content hash when those differ, so unchanged papers are never
+        re-read. Pass full=True to ignore the manifest. Nodes are written to
+        the node stores of the given index generations, the first of which
+        is checked for a wiped nodes table. With a lock, nodes are only
+        written while its lease is still held.
+        """
+        try:
+            node_stores = self._node_stores(generations)
+            chunker_config = self._chunker_config()
+            files = self._scan_directory()
             
-            # Process each document separately
-            all_nodes = []
-            doc_ids = []
+            # A manifest without stored nodes is stale (e.g. after the nodes
+            # table was wiped), so treat every file as new in that case
+            manifest = {} if full else self.manifest_store.load_entries()
+            if manifest and node_stores[0].count_nodes() == 0:
+                logger.info("Node table is empty, ignoring paper manifest")
+                manifest = {}
             
-            for doc in documents:
-                # Clean text to remove problematic characters
-                cleaned_text = self._clean_text(doc.text)
-                
-                # Extract metadata from file path
-                file_path = doc.metadata.get('file_path', '') if doc.metadata else ''
-                filename = os.path.basename(file_path)
-                arxiv_id = os.path.splitext(filename)[0]  # Remove .pdf extension
-                arxiv_url = f"https://arxiv.org/pdf/{arxiv_id}"
-                
-                # Create metadata for this specific document
-                metadata = {
-                    'arxiv_url': arxiv_url,
-                    'filename': filename,
-                    'arxiv_id': arxiv_id
-                }
-                
-                # Create a document with cleaned text and metadata
-                clean_doc = Document(text=cleaned_text, metadata=metadata)
+            result = DirectorySyncResult()
+            changed = []
+            for rel_path, file_path in files.items():
+                stat = os.stat(file_path)
+                entry = manifest.get(rel_path)
+                same_config = entry is not None and entry['chunker_config'] == chunker_config
                 
-                # Parse this document into nodes
-                doc_nodes = self.text_splitter.get_nodes_from_documents([clean_doc])
+                # Fast path: identical size and mtime means the file is untouched
+                if same_config and entry['file_size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                    result.unchanged += 1
+                    continue
                 
-                logger.info(f"Processed document {filename}: {len(doc_nodes)} nodes")
+                content_hash = self._hash_file(file_path)
+                if same_config and entry['content_hash'] == content_hash:
+                    # Only the mtime moved, keep the existing nodes
+                    self.manifest_store.touch_entry(rel_path, stat.st_mtime)
+                    result.unchanged += 1
+                    continue
                 
-                # Store document ID to avoid deletion
-                doc_ids.append(arxiv_id)
-                
-                # Add nodes to the collection
-                all_nodes.extend(doc_nodes)
+                changed.append((rel_path, file_path, stat, content_hash, entry))
+            
+            removed = [rel_path for rel_path in manifest if rel_path not in files]
+            # One pass over each store instead of a lookup per file
+            stored_ids = self._paper_node_ids(node_stores) if changed or removed else []
             
-            logger.info(f"Processed directory {self.upload_dir}: {len(all_nodes)} total nodes")
+            parsed = self._parse_files([item[1] for item in changed])
+            for (rel_path, file_path, stat, content_hash, entry), doc_nodes in zip(changed, parsed):
+                self._store_file_nodes(
+                    rel_path, stat, content_hash, entry, chunker_config, doc_nodes, result,
+                    node_stores, stored_ids, lock
+                )
             
-            # Store nodes in database
-            self.node_store.store_nodes(all_nodes)
+            for rel_path in removed:
+                arxiv_id = paper_arxiv_id(rel_path)
+                node_ids = set(manifest[rel_path]['node_ids'])
+                for paper_ids in stored_ids:
+                    node_ids.update(paper_ids.get(arxiv_id, set()))
+                node_ids = sorted(node_ids)
+                for node_store in node_stores:
+                    if lock is not None:
+                        lock.check()
+                    node_store.delete_nodes(node_ids)
+                result.removed_node_ids.extend(node_ids)
+                logger.info(f"Removed document {rel_path}: {len(node_ids)} nodes")
+            self.manifest_store.delete_entries(removed)
             
-            return all_nodes
+            logger.info(
+                f"Synced directory {self.upload_dir}: {len(changed)} new or changed, "
+                f"{result.unchanged} unchanged, {len(removed)} removed files, "
+                f"{len(result.nodes)} new nodes"
+            )
+            return result
         
         except Exception as e:
-            logger.error(f"Error processing directory {self.upload_dir}: {str(e)}")
-            raise 
\ No newline at end of file
+            logger.error(f"Error syncing directory {self.upload_dir}: {str(e)}")
+            raise
+    
+    def parse_directory(self):
+        """Parse every PDF in the upload directory without storing anything
+        
+        Returns the nodes and the manifest entries describing them, to be
+        recorded with replace_manifest once the nodes are indexed.
+        """
+        try:
+            chunker_config = self._chunker_config()
+            files = self._scan_directory()
+            # Stat and hash before parsing, a file changed meanwhile is then
+            # picked up by the next sync
+            stats = {rel_path: os.stat(file_path) for rel_path, file_path in files.items()}
+            hashes = {rel_path: self._hash_file(file_path) for rel_path, file_path in files.items()}
+            parsed = self._parse_files(list(files.values()))
+            
+            nodes = []
+            entries = []
+            for rel_path, doc_nodes in zip(files, parsed):
+                entries.append(self._manifest_entry(
+                    rel_path, stats[rel_path], hashes[rel_path], chunker_config, doc_nodes
+                ))
+                nodes.extend(doc_nodes)
+            logger.info(f"Parsed directory {self.upload_dir}: {len(files)} files, {len(nodes)} nodes")
+            return nodes, entries
+        except Exception as e:
+            logger.error(f"Error parsing directory {self.upload_dir}: {str(e)}")
+            raise
+    
+    def replace_manifest(self, entries):
+        """Make the manifest describe exactly the given files"""
+        self.manifest_store.delete_all_entries()
+        for entry in entries:
+            self.manifest_store.upsert_entry(**entry)
+    
+    def process_directory(self, full=False, generations=(0,)):
+        """Process new or changed PDF files in the upload directory"""
+        result = self.sync_directory(full=full, generations=generations)
+        if not result.nodes:
+            logger.warning(f"No new or changed documents found in {self.upload_dir}")
+            return None
+        return result.nodes
@@ -0,0 +1,178 @@
+import logging
+import hashlib
+from datetime import datetime, timezone
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from llama_index.core.schema import MetadataMode
+
+from app.core.config import settings
+from app.core.metrics import record_cache
+from app.db.database import SessionLocal, engine
+from app.db.models import EmbeddingCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Keep IN (...) lists well below database parameter limits
+LOOKUP_BATCH_SIZE = 500
+
+class EmbeddingCache:
+    """Durable embedding cache keyed by model name and normalized text hash"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or settings.EMBEDDING_CACHE_MAX_BYTES
+        # Created here as well because init_db is skipped once Redis marks it done
+        EmbeddingCacheEntry.__table__.create(bind=engine, checkfirst=True)
+
+    def _normalize(self, text):
+        """Collapse whitespace so formatting-only differences share an entry"""
+        return " ".join(text.split())
+
+    def _cache_key(self, model_name, text):
+        """Build the cache key for a text embedded with a given model"""
+        text_hash = hashlib.sha256(self._normalize(text).encode('utf-8')).hexdigest()
+        return f"{model_name}:{text_hash}"
+
+    def get_many(self, model_name, texts):
+        """Return cached embeddings for the given texts keyed by cache key"""
+        keys = list({self._cache_key(model_name, text) for text in texts})
+        found = {}
+        try:
+            with SessionLocal() as db:
+                for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                    batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                    rows = db.query(
+                        EmbeddingCacheEntry.cache_key,
+                        EmbeddingCacheEntry.embedding
+                    ).filter(EmbeddingCacheEntry.cache_key.in_(batch)).all()
+                    for cache_key, embedding in rows:
+                        found[cache_key] = np.frombuffer(embedding, dtype=np.float32).tolist()
+
+                    # Refresh recency of hits so eviction drops cold entries first
+                    hit_keys = [row[0] for row in rows]
+                    if hit_keys:
+                        db.query(EmbeddingCacheEntry).filter(
+                            EmbeddingCacheEntry.cache_key.in_(hit_keys)
+                        ).update(
+                            {EmbeddingCacheEntry.last_used_at: datetime.now(timezone.utc)},
+                            synchronize_session=False
+                        )
+                db.commit()
+        except Exception as e:
+            # A broken cache must never block indexing
+            logger.warning(f"Could not read embedding cache: {str(e)}")
+        return found
+
+    def _insert_batch(self, db, rows):
+        """Insert one batch of rows, leaving entries that already exist untouched"""
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            # Concurrent writers of the same text race on the unique key, the
+            # database settles it instead of a check followed by an insert
+            insert = pg_insert if dialect == "postgresql" else sqlite_insert
+            db.execute(
+                insert(EmbeddingCacheEntry).values(rows).on_conflict_do_nothing(
+                    index_elements=[EmbeddingCacheEntry.cache_key]
+                )
+            )
+            return
+
+        existing = set(
+            row[0] for row in db.query(EmbeddingCacheEntry.cache_key).filter(
+                EmbeddingCacheEntry.cache_key.in_([row['cache_key'] for row in rows])
+            )
+        )
+        db.bulk_insert_mappings(EmbeddingCacheEntry, [row for row in rows if row['cache_key'] not in existing])
+
+    def put_many(self, model_name, texts, embeddings):
+        """Store embeddings for the given texts and evict if over budget"""
+        try:
+            # Texts repeated within the call, also after normalization, are stored once
+            entries = {}
+            for text, embedding in zip(texts, embeddings):
+                vector = np.asarray(embedding, dtype=np.float32)
+                entries[self._cache_key(model_name, text)] = vector
+            rows = [
+                {
+                    'cache_key': cache_key,
+                    'model_name': model_name,
+                    'dimensions': int(vector.shape[0]),
+                    'embedding': vector.tobytes(),
+                    'size_bytes': int(vector.nbytes)
+                }
+                for cache_key, vector in entries.items()
+            ]
+
+            with SessionLocal() as db:
+                for start in range(0, len(rows), LOOKUP_BATCH_SIZE):
+                    self._insert_batch(db, rows[start:start + LOOKUP_BATCH_SIZE])
+                db.commit()
+            self.evict()
+        except Exception as e:
+            logger.warning(f"Could not write embedding cache: {str(e)}")
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its size budget"""
+        with SessionLocal() as db:
+            total = db.query(func.coalesce(func.sum(EmbeddingCacheEntry.size_bytes), 0)).scalar()
+            excess = total - self.max_bytes
+            if excess <= 0:
+                return
+
+            evicted = 0
+            freed = 0
+            while freed < excess:
+                rows = db.query(
+                    EmbeddingCacheEntry.id,
+                    EmbeddingCacheEntry.size_bytes
+                ).order_by(EmbeddingCacheEntry.last_used_at).limit(LOOKUP_BATCH_SIZE).all()
+                if not rows:
+                    break
+                ids = []
+                for row_id, size_bytes in rows:
+                    ids.append(row_id)
+                    freed += size_bytes
+                    if freed >= excess:
+                        break
+                db.query(EmbeddingCacheEntry).filter(
+                    EmbeddingCacheEntry.id.in_(ids)
+                ).delete(synchronize_session=False)
+                evicted += len(ids)
+            db.commit()
+            logger.info(f"Evicted {evicted} entries ({freed} bytes) from embedding cache")
+
+    def embed_nodes(self, nodes, embed_model):
+        """Attach embeddings to nodes, calling the model only for cache misses"""
+        pending = [node for node in nodes if node.embedding is None]
+        if not pending:
+            return nodes
+
+        model_name = embed_model.model_name
+        # Same text the vector index would embed, including metadata
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending]
+        cached = self.get_many(model_name, texts)
+
+        missing_texts = []
+        missing_nodes = []
+        for node, text in zip(pending, texts):
+            embedding = cached.get(self._cache_key(model_name, text))
+            if embedding is not None:
+                node.embedding = embedding
+            else:
+                missing_nodes.append(node)
+                missing_texts.append(text)
+
+        record_cache("embedding", hits=len(pending) - len(missing_nodes), misses=len(missing_nodes))
+        logger.info(
+            f"Embedding cache: {len(pending) - len(missing_nodes)} hits, "
+            f"{len(missing_nodes)} misses"
+        )
+
+        if missing_texts:
+            embeddings = embed_model.get_text_embedding_batch(missing_texts)
+            for node, embedding in zip(missing_nodes, embeddings):
+                node.embedding = embedding
+            self.put_many(model_name, missing_texts, embeddings)
+
+        return nodes
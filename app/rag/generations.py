@@ -0,0 +1,97 @@
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class GenerationRegistry:
+    """Index generations and the pointer to the one queries use, kept in Redis
+
+    index:generation:current   generation number served to queries
+    index:generation:counter   last generation number handed out
+    index:generations          hash of generation -> JSON record with status
+                               (building, ready, active, retired, failed) and
+                               timestamps
+    Generation 0 is the pre-generation index, used while no pointer exists.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.current_key = "index:generation:current"
+        self.counter_key = "index:generation:counter"
+        self.records_key = "index:generations"
+
+    def current(self):
+        """Generation currently served to queries"""
+        return int(self.redis_client.get(self.current_key) or 0)
+
+    def get(self, generation):
+        """Record of one generation, None if unknown"""
+        data = self.redis_client.hget(self.records_key, generation)
+        return json.loads(data) if data else None
+
+    def list(self):
+        """Every known generation record, newest first"""
+        records = [json.loads(data) for data in self.redis_client.hvals(self.records_key)]
+        return sorted(records, key=lambda record: record["generation"], reverse=True)
+
+    def _save(self, record):
+        self.redis_client.hset(self.records_key, record["generation"], json.dumps(record))
+
+    def update(self, generation, **fields):
+        """Merge fields into a generation record"""
+        record = self.get(generation) or {"generation": generation}
+        record.update(fields)
+        self._save(record)
+        return record
+
+    def create(self):
+        """Allocate a new generation number for a build"""
+        # Never reuse generation 0, nor a number below the one being served
+        floor = self.current()
+        generation = self.redis_client.incr(self.counter_key)
+        while generation <= floor:
+            generation = self.redis_client.incr(self.counter_key)
+        self.update(generation, status="building", created_at=time.time())
+        logger.info(f"Started index generation {generation}")
+        return generation
+
+    def activate(self, generation, lock):
+        """Point queries at a generation, retiring the previous one
+
+        The pointer is written through the lock's fence so a builder that
+        lost its lease cannot switch generations.
+        """
+        previous = self.current()
+        if not lock.fenced_set(self.current_key, generation):
+            raise RuntimeError(f"Lost lock {lock.name}, not activating generation {generation}")
+        now = time.time()
+        self.update(generation, status="active", activated_at=now)
+        if previous != generation:
+            self.update(previous, status="retired", retired_at=now)
+        logger.info(f"Activated index generation {generation} (previous {previous})")
+        return previous
+
+    def rollback_target(self):
+        """Most recent retired generation that still exists"""
+        current = self.current()
+        retired = [
+            record for record in self.list()
+            if record.get("status") == "retired" and record["generation"] != current
+        ]
+        return retired[0]["generation"] if retired else None
+
+    def expired(self, grace_seconds):
+        """Generations retired or failed longer than the grace period ago"""
+        cutoff = time.time() - grace_seconds
+        current = self.current()
+        return [
+            record["generation"] for record in self.list()
+            if record["generation"] != current
+            and record.get("status") in ("retired", "failed")
+            and record.get("retired_at", record.get("created_at", 0)) <= cutoff
+        ]
+
+    def forget(self, generation):
+        """Drop a generation record once its vectors are gone"""
+        self.redis_client.hdel(self.records_key, generation)
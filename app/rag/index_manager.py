@@ -1,160 +1,390 @@
 import time
 import logging
-from pinecone import Pinecone, ServerlessSpec, DeletionProtection
 from llama_index.core import VectorStoreIndex, StorageContext
-from llama_index.vector_stores.pinecone import PineconeVectorStore
 from llama_index.core.storage.docstore import SimpleDocumentStore
 from llama_index.llms.ollama import Ollama
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core import Settings
 
-import json
 import threading
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llama_index.core.node_parser import get_leaf_nodes
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.types import VectorStoreQuery
 
 from app.core.config import settings
+from app.core.metrics import ERRORS, observe_load, record_ingest
 from app.db.database import SessionLocal
 from app.db.models import Node
-from app.rag.node_store import NodeStore
+from app.rag.node_store import GenerationNodeStores
 from app.rag.redis_manager import RedisManager
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.lazy_docstore import LazyDocumentStore
+from app.rag.distributed_lock import INDEX_MAINTENANCE_LOCK, RedisLeaseLock
+from app.rag.generations import GenerationRegistry
+from app.rag.semantic_cache import SemanticCache
+from app.rag.query_embedding_cache import QueryEmbeddingCache
 from app.rag.query_engine import QueryProcessor
+from app.rag.vector_backends import create_vector_backend
 
 logger = logging.getLogger(__name__)
 
-# Global lock for Redis operations
-redis_lock = threading.Lock()
-
 class IndexManager:
-    def __init__(self):
-        self.api_key = settings.PINECONE_API_KEY
-        self.index_name = settings.PINECONE_INDEX_NAME
-        self.environment = settings.PINECONE_ENVIRONMENT
-        self.pinecone_client = None
-        self.pinecone_index = None
+    def __init__(self, redis_manager=None, llm=None, embed_model=None, node_stores=None):
+        self.vector_backend = None
         self.vector_store = None
         self.storage_context = None
-        self.node_store = NodeStore()
-        self.redis_manager = RedisManager()
+        # Shared with the DocumentProcessor, one BM25 connection per generation and process
+        self.node_stores = node_stores or GenerationNodeStores()
+        self.node_store = None
+        self.node_cache = None
+        self.redis_manager = redis_manager or RedisManager()
+        self.embedding_cache = EmbeddingCache() if settings.EMBEDDING_CACHE_ENABLED else None
+        self.semantic_cache = (
+            SemanticCache(self.redis_manager.redis_client) if settings.SEMANTIC_CACHE_ENABLED else None
+        )
+        # Outlives query processors, query vectors do not depend on the index
+        self.query_embedding_cache = QueryEmbeddingCache(
+            self.redis_manager.redis_client if settings.QUERY_EMBEDDING_CACHE_REDIS else None
+        ) if settings.QUERY_EMBEDDING_CACHE_ENABLED else None
         self._query_processor = None
+        self._query_processor_lock = threading.Lock()
+        self._bm25_lock = threading.Lock()
+        self._bm25_checked_at = time.monotonic()
+        # Index generation served to queries, switched when Redis points elsewhere
+        self.generations = GenerationRegistry(self.redis_manager.redis_client)
+        self.generation = self.generations.current()
+        self._generation_checked_at = time.monotonic()
+        self._stop_generation_gc = threading.Event()
+        self._generation_gc_thread = None
+        # Vector backends of retired generations, kept in step for rollback
+        self._retained_backends = {}
         
-        # Initialize Ollama model and set it globally
-        llm = Ollama(
+        # Initialize Ollama model and set it globally, unless models are passed in
+        llm = llm or Ollama(
             model=os.getenv("OLLAMA_MODEL", "llama3.2"),
             base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
             request_timeout=300.0
         )
-        self.embed_model = OpenAIEmbedding()
+        self.embed_model = embed_model or OpenAIEmbedding()
         Settings.llm = llm
         Settings.embed_model = self.embed_model
         
-        # Initialize Pinecone
-        self._init_pinecone()
+        # Initialize vector backend (Pinecone or local)
+        self._init_generation_stores()
+        self._init_vector_store()
         self._init_storage_context()
     
-    def _init_pinecone(self):
-        """Initialize Pinecone client and index"""
+    def _init_generation_stores(self):
+        """Point the node store and Redis node cache at the generation being served"""
+        self.node_store = self.node_stores.get(self.generation)
+        self.node_cache = self.redis_manager.for_generation(self.generation)
+    
+    def _init_vector_store(self):
+        """Initialize the vector backend selected in settings"""
+        self.vector_backend = create_vector_backend(generation=self.generation)
+        self.vector_store = self.vector_backend.vector_store
+    
+    def refresh_generation(self, force=False, lock_wait_timeout=None):
+        """Switch to the current index generation if another worker activated a new one
+
+        If the new generation's nodes cannot be loaded, e.g. because the node
+        cache lock is busy, the old generation stays in use and the switch is
+        tried again on the next check.
+        """
+        now = time.monotonic()
+        if not force and now - self._generation_checked_at < settings.GENERATION_CHECK_INTERVAL:
+            return False
+        self._generation_checked_at = now
+        generation = self.generations.current()
+        if generation == self.generation:
+            return False
+        
+        logger.info(f"Switching from index generation {self.generation} to {generation}")
+        previous = self.generation
+        self.generation = generation
+        self._init_generation_stores()
+        self._init_vector_store()
         try:
-            self.pinecone_client = Pinecone(api_key=self.api_key)
-            
-            # Check if index exists
-            existing_indexes = [
-                index_info["name"] for index_info in self.pinecone_client.list_indexes()
-            ]
-            
-            # Create index if it doesn't exist
-            if self.index_name not in existing_indexes:
-                logger.info(f"Creating new Pinecone index: {self.index_name}")
-                self.pinecone_client.create_index(
-                    name=self.index_name,
-                    dimension=1536,  # OpenAI text-embedding-ada-002 dimension
-                    metric="cosine",
-                    deletion_protection=DeletionProtection.DISABLED,
-                    spec=ServerlessSpec(
-                        cloud="aws",
-                        region=self.environment
-                    )
-                )
-                # Wait for index to be initialized
-                while not self.pinecone_client.describe_index(self.index_name).status['ready']:
-                    time.sleep(1)
-            
-            # Connect to index
-            self.pinecone_index = self.pinecone_client.Index(self.index_name)
-            
-            # Initialize vector store with OpenAI embedding model
-            self.vector_store = PineconeVectorStore(
-                pinecone_index=self.pinecone_index,
-                text_key="text"
-            )
-            
-            logger.info(f"Connected to Pinecone index: {self.index_name}")
-            
-        except Exception as e:
-            logger.error(f"Error initializing Pinecone: {str(e)}")
+            self._init_storage_context(lock_wait_timeout)
+        except Exception:
+            self.generation = previous
+            self._init_generation_stores()
+            self._init_vector_store()
             raise
+        # In-flight queries finish on the old processor, new ones build a fresh one
+        self._query_processor = None
+        return True
+    
+    def _node_cache_lock(self, wait_timeout=None):
+        """Cross-process lock around writes to the Redis node cache
+
+        wait_timeout defaults to LOCK_WAIT_TIMEOUT; request paths pass a short
+        one so a query fails with LockNotAcquired instead of queueing behind
+        a worker that is loading every node.
+        """
+        return RedisLeaseLock(self.redis_manager.redis_client, "node-cache", wait_timeout=wait_timeout)
     
-    def _init_storage_context(self):
-        """Initialize storage context with existing nodes"""
-        self.storage_context = StorageContext.from_defaults(
+    def _new_storage_context(self):
+        """Storage context with the docstore selected by DOCSTORE_MODE"""
+        if settings.DOCSTORE_MODE == "lazy":
+            docstore = LazyDocumentStore(
+                self.node_store,
+                redis_manager=self.node_cache if settings.DOCSTORE_REDIS_TIER else None,
+                version_source=self.node_cache
+            )
+        else:
+            docstore = SimpleDocumentStore()
+        return StorageContext.from_defaults(
+            docstore=docstore,
             vector_store=self.vector_store
         )
+    
+    def _vector_index(self):
+        """Index over the vector store that looks nodes up in our docstore
+        
+        VectorStoreIndex.from_vector_store drops the storage context it is
+        given and falls back to an empty in-memory docstore.
+        """
+        return VectorStoreIndex(nodes=[], storage_context=self.storage_context)
+    
+    def _init_storage_context(self, lock_wait_timeout=None):
+        """Initialize storage context with existing nodes
+
+        The new context only replaces the current one once its nodes are
+        loaded, so a failed load leaves the previous context in place.
+        """
+        storage_context = self._new_storage_context()
+        if settings.DOCSTORE_MODE == "lazy":
+            # Nodes are fetched on demand, nothing to preload
+            self.storage_context = storage_context
+            return
         
         # Use lock to prevent multiple workers from loading nodes simultaneously
-        with redis_lock:
+        with self._node_cache_lock(lock_wait_timeout):
             # Check if nodes are already in Redis
-            nodes = self.redis_manager.get_nodes()
-            if not nodes:
-                # If not in Redis, load from database and store in Redis
-                nodes = self.node_store.load_nodes()
-                if nodes:
-                    self.redis_manager.store_nodes(nodes)
-                    self.storage_context.docstore.add_documents(nodes)
-                    logger.info(f"Initialized storage context with {len(nodes)} documents")
+            if self.node_cache.has_complete_nodes():
+                # Use nodes from Redis, one page at a time
+                count = 0
+                with observe_load("redis", "load_all"):
+                    for page in self.node_cache.iter_node_pages():
+                        storage_context.docstore.add_documents(page)
+                        count += len(page)
+                logger.info(f"Initialized storage context with {count} documents from Redis")
             else:
-                # Use nodes from Redis
-                self.storage_context.docstore.add_documents(nodes)
-                logger.info(f"Initialized storage context with {len(nodes)} documents from Redis")
+                # If not in Redis, stream from database and store in Redis
+                count = self._load_nodes_from_database(storage_context)
+                if count:
+                    logger.info(f"Initialized storage context with {count} documents")
+        self.storage_context = storage_context
     
-    def get_query_processor(self):
-        """Get or create query processor"""
+    def _load_nodes_from_database(self, storage_context=None):
+        """Stream stored nodes into the docstore and the Redis cache, batch by batch"""
+        storage_context = storage_context or self.storage_context
+        try:
+            self.node_cache.clear_nodes()
+            count = 0
+            with observe_load("database", "load_all"):
+                for batch in self.node_store.iter_node_batches():
+                    storage_context.docstore.add_documents(batch)
+                    self.node_cache.upsert_nodes(batch)
+                    count += len(batch)
+            if count:
+                self.node_cache.mark_nodes_complete()
+            return count
+        except Exception as e:
+            logger.warning(f"Could not load nodes from database: {str(e)}")
+            return 0
+    
+    def _ensure_bm25_index(self, force=True):
+        """Rebuild the BM25 index from the database when it is behind the nodes table
+
+        The BM25 file is local to each instance, while papers are ingested by
+        any of them. It records the node version it was synced at and is
+        rebuilt once nodes changed elsewhere since, or if it was never built.
+        Without force this is checked at most every GENERATION_CHECK_INTERVAL.
+        """
+        bm25_index = self.node_store.bm25_index
+        now = time.monotonic()
+        if not force and now - self._bm25_checked_at < settings.GENERATION_CHECK_INTERVAL:
+            return bm25_index
+        self._bm25_checked_at = now
+        version = self.node_cache.get_nodes_version()
+        if bm25_index.synced_version() == version:
+            return bm25_index
+        with self._bm25_lock:
+            if bm25_index.synced_version() != version:
+                count = bm25_index.rebuild(
+                    (get_leaf_nodes(batch) for batch in self.node_store.iter_node_batches()),
+                    version
+                )
+                logger.info(f"Rebuilt BM25 index from {count} stored nodes (node version {version})")
+        return bm25_index
+    
+    def _bump_nodes_version(self, generation, node_cache):
+        """Tell every worker a generation's nodes changed, after its node cache was updated
+
+        NodeStore already applied the change to the BM25 index here, so that
+        index stays in sync if it was before.
+        """
+        version = node_cache.bump_nodes_version()
+        self.node_stores.get(generation).bm25_index.mark_synced(version, previous=version - 1)
+    
+    def get_query_processor(self, lock_wait_timeout=None):
+        """Get or create query processor
+
+        lock_wait_timeout bounds the wait for the node cache lock, see
+        _node_cache_lock.
+        """
+        with self._query_processor_lock:
+            self.refresh_generation(lock_wait_timeout=lock_wait_timeout)
+        if self._query_processor is not None and self._query_processor.bm25_index is not None:
+            try:
+                self._ensure_bm25_index(force=False)
+            except Exception as e:
+                # Keyword results may miss recent papers until the next check
+                logger.warning(f"Could not sync BM25 index: {str(e)}")
         if self._query_processor is None:
-            index = self.get_index()
-            if index is not None:
-                self._query_processor = QueryProcessor(index)
+            # Concurrent first queries must not each load the reranker
+            with self._query_processor_lock:
+                if self._query_processor is None:
+                    index = self.get_index(lock_wait_timeout)
+                    if index is not None:
+                        bm25_index = self._ensure_bm25_index() if settings.RETRIEVAL_MODE == "hybrid" else None
+                        self._query_processor = QueryProcessor(
+                            index,
+                            bm25_index=bm25_index,
+                            semantic_cache=self.semantic_cache,
+                            query_embedding_cache=self.query_embedding_cache
+                        )
         return self._query_processor
     
-    def index_documents(self, nodes):
-        """Index documents to Pinecone"""
+    def warm_up(self):
+        """Build the query processor now rather than on the first query"""
+        return self.get_query_processor()
+    
+    def has_query_processor(self):
+        """Whether the query processor has been built"""
+        return self._query_processor is not None
+    
+    def _embed_nodes(self, nodes):
+        """Fill node embeddings from the embedding cache, embedding only misses"""
+        if self.embedding_cache is not None:
+            return self.embedding_cache.embed_nodes(nodes, self.embed_model)
+        
+        pending = [node for node in nodes if node.embedding is None]
+        if pending:
+            embeddings = self.embed_model.get_text_embedding_batch([
+                node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending
+            ])
+            for node, embedding in zip(pending, embeddings):
+                node.embedding = embedding
+        return nodes
+    
+    def _invalidate_caches(self):
+        """Forget cached answers once the indexed content changed"""
+        if self.semantic_cache is not None:
+            self.semantic_cache.invalidate()
+    
+    def _with_retry(self, func, *args, **kwargs):
+        """Call func, retrying transient failures with exponential backoff"""
+        attempts = settings.UPSERT_MAX_RETRIES + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == attempts:
+                    raise
+                delay = settings.UPSERT_RETRY_BACKOFF * (2 ** (attempt - 1))
+                logger.warning(f"Attempt {attempt}/{attempts} failed: {str(e)}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+    
+    def _missing_node_ids(self, node_ids, backend=None):
+        """Return the ids that do not have a vector in the vector store yet"""
+        backend = backend or self.vector_backend
+        missing = []
+        batch_size = settings.UPSERT_BATCH_SIZE
+        for start in range(0, len(node_ids), batch_size):
+            batch = node_ids[start:start + batch_size]
+            found = self._with_retry(backend.existing_ids, batch)
+            missing.extend(node_id for node_id in batch if node_id not in found)
+        return missing
+    
+    def _upsert_batch(self, batch, backend=None, lock=None):
+        """Embed one batch of nodes and write it to the vector store"""
+        backend = backend or self.vector_backend
+        self._with_retry(self._embed_nodes, batch)
+        if lock is not None:
+            lock.check()
+        self._with_retry(backend.vector_store.add, batch)
+        return len(batch)
+    
+    def upsert_nodes(self, nodes, only_missing=True, backend=None, lock=None):
+        """Embed and upsert nodes in concurrent batches
+        
+        With only_missing=True nodes that already have a vector are skipped,
+        so calling this with the full corpus only pays for new nodes.
+        Parents of hierarchical chunks are skipped, only leaves get vectors.
+        backend defaults to the generation serving queries. With a lock,
+        each batch is only written while the lease is still held.
+        Returns the number of vectors written.
+        """
         try:
-            # Only create embeddings if the index is empty
-            index_stats = self.pinecone_index.describe_index_stats()
+            nodes = get_leaf_nodes(nodes)
+            if only_missing:
+                missing_ids = set(self._missing_node_ids([node.node_id for node in nodes], backend))
+                nodes = [node for node in nodes if node.node_id in missing_ids]
+            if not nodes:
+                logger.info("All nodes already have vectors, nothing to upsert")
+                return 0
             
-            # Always update storage context with all nodes
-            # self.storage_context.docstore.add_documents(nodes)
+            batch_size = settings.UPSERT_BATCH_SIZE
+            batches = [nodes[start:start + batch_size] for start in range(0, len(nodes), batch_size)]
+            logger.info(
+                f"Upserting {len(nodes)} nodes in {len(batches)} batches "
+                f"with concurrency {settings.UPSERT_CONCURRENCY}"
+            )
+            
+            started = time.perf_counter()
+            done = 0
+            with ThreadPoolExecutor(max_workers=settings.UPSERT_CONCURRENCY) as executor:
+                futures = [executor.submit(self._upsert_batch, batch, backend, lock) for batch in batches]
+                for future in as_completed(futures):
+                    done += future.result()
+                    elapsed = time.perf_counter() - started
+                    logger.info(
+                        f"Upserted {done}/{len(nodes)} vectors "
+                        f"({done / elapsed if elapsed > 0 else 0:.1f} vectors/sec)"
+                    )
             
+            elapsed = time.perf_counter() - started
+            record_ingest("upsert", done, elapsed)
+            logger.info(f"Upserted {done} vectors in {elapsed:.2f}s")
+            if backend is None:
+                # A generation still being built serves no answers yet
+                self._invalidate_caches()
+            return done
+        except Exception as e:
+            ERRORS.labels("upsert").inc()
+            logger.error(f"Error upserting nodes: {str(e)}")
+            raise
+    
+    def index_documents(self, nodes, lock=None):
+        """Index documents into the vector store, embedding only nodes without a vector"""
+        try:
             # Use lock to prevent multiple workers from storing in Redis simultaneously
-            with redis_lock:
+            with self._node_cache_lock():
                 # Store nodes in Redis
-                self.redis_manager.store_nodes(nodes)
+                self.node_cache.store_nodes(nodes)
                 logger.info(f"Added {len(nodes)} nodes to storage context and Redis")
             
-            if index_stats.total_vector_count == 0:
-                logger.info("Index is empty, indexing documents")
-                # Create vector store index with existing storage context
-                index = VectorStoreIndex(
-                    nodes,
-                    storage_context=self.storage_context
-                )
-            else:
-                logger.info("Index already contains vectors, using existing embeddings")
-                # Use existing storage context and vector store
-                index = VectorStoreIndex.from_vector_store(
-                    vector_store=self.vector_store,
-                    storage_context=self.storage_context
-                )
+            self.upsert_nodes(nodes, lock=lock)
+            index = self._vector_index()
             
             # Store index stats in Redis with lock
-            with redis_lock:
+            index_stats = self.vector_backend.stats()
+            with self._node_cache_lock():
                 self.redis_manager.store_index_stats(index_stats)
             
             return index
@@ -163,47 +393,180 @@ class IndexManager:
             logger.error(f"Error indexing documents: {str(e)}")
             raise
     
-    def get_index(self):
-        """Get existing index from Pinecone with Redis caching"""
+    def index_node_batches(self, batches, lock=None):
+        """Index stored nodes batch by batch, never holding the whole corpus
+
+        Like index_documents, the Redis node cache ends up holding exactly
+        these nodes and only nodes without a vector are embedded. Returns
+        the index, None if there were no nodes.
+        """
+        try:
+            # Readers fall back to the database until every batch is cached
+            with self._node_cache_lock():
+                self.node_cache.clear_nodes()
+            count = 0
+            for batch in batches:
+                with self._node_cache_lock():
+                    self.node_cache.upsert_nodes(batch)
+                self.upsert_nodes(batch, lock=lock)
+                count += len(batch)
+            if not count:
+                return None
+            
+            index_stats = self.vector_backend.stats()
+            with self._node_cache_lock():
+                self.node_cache.mark_nodes_complete()
+                self.redis_manager.store_index_stats(index_stats)
+            logger.info(f"Indexed {count} stored nodes")
+            
+            # A memory docstore loads the nodes now cached in Redis
+            self._init_storage_context()
+            return self._vector_index()
+        except Exception as e:
+            logger.error(f"Error indexing stored nodes: {str(e)}")
+            raise
+    
+    def live_generations(self):
+        """Generations queries can be served from: the current one first, then every one a rollback can return to"""
+        current = self.generations.current()
+        return [current] + [
+            record["generation"] for record in self.generations.list()
+            if record.get("status") == "retired" and record["generation"] != current
+        ]
+    
+    def _retained_generations(self):
+        """(generation, vector backend, node cache) of every live generation other than the one served here"""
+        retained = []
+        for generation in self.live_generations():
+            if generation == self.generation:
+                continue
+            backend = self._retained_backends.get(generation)
+            if backend is None:
+                backend = self._retained_backends[generation] = create_vector_backend(generation=generation)
+            retained.append((generation, backend, self.redis_manager.for_generation(generation)))
+        return retained
+    
+    def add_nodes(self, nodes, lock=None):
+        """Embed and upsert new or changed nodes into the existing index
+        
+        Retired generations get the same nodes, so rolling back does not
+        lose papers ingested since. Vectors are embedded once and reused.
+        With a lock, vectors are only written while the lease is still held.
+        """
+        try:
+            # Changed nodes keep their id, so write them even if a vector exists
+            self.upsert_nodes(nodes, only_missing=False, lock=lock)
+            # An id that became a hierarchical parent must not keep its old vector
+            leaf_ids = {node.node_id for node in get_leaf_nodes(nodes)}
+            parent_ids = [node.node_id for node in nodes if node.node_id not in leaf_ids]
+            if parent_ids:
+                if lock is not None:
+                    lock.check()
+                self._with_retry(self.vector_backend.delete_ids, parent_ids)
+            self.storage_context.docstore.add_documents(nodes)
+            
+            # Only the changed nodes are rewritten in the Redis cache, and
+            # other workers drop their in-process copies
+            with self._node_cache_lock():
+                self.node_cache.upsert_nodes(nodes)
+                self._bump_nodes_version(self.generation, self.node_cache)
+            
+            for generation, backend, node_cache in self._retained_generations():
+                self.upsert_nodes(nodes, only_missing=False, backend=backend, lock=lock)
+                if parent_ids:
+                    if lock is not None:
+                        lock.check()
+                    self._with_retry(backend.delete_ids, parent_ids)
+                with self._node_cache_lock():
+                    node_cache.upsert_nodes(nodes)
+                    self._bump_nodes_version(generation, node_cache)
+            logger.info(f"Inserted {len(nodes)} nodes into the index")
+            return self._vector_index()
+        except Exception as e:
+            logger.error(f"Error adding nodes to index: {str(e)}")
+            raise
+    
+    def delete_nodes(self, node_ids, lock=None):
+        """Remove vectors and cached copies of nodes that no longer exist
+        
+        They are removed from retired generations too, so rolling back does
+        not bring deleted papers back. With a lock, vectors are only deleted
+        while the lease is still held.
+        """
+        if not node_ids:
+            return
+        try:
+            if lock is not None:
+                lock.check()
+            self._with_retry(self.vector_backend.delete_ids, node_ids)
+            self._invalidate_caches()
+            for node_id in node_ids:
+                self.storage_context.docstore.delete_document(node_id, raise_error=False)
+            
+            with self._node_cache_lock():
+                self.node_cache.delete_nodes(node_ids)
+                self._bump_nodes_version(self.generation, self.node_cache)
+            
+            for generation, backend, node_cache in self._retained_generations():
+                if lock is not None:
+                    lock.check()
+                self._with_retry(backend.delete_ids, node_ids)
+                with self._node_cache_lock():
+                    node_cache.delete_nodes(node_ids)
+                    self._bump_nodes_version(generation, node_cache)
+            logger.info(f"Deleted {len(node_ids)} nodes from the index")
+        except Exception as e:
+            logger.error(f"Error deleting nodes from index: {str(e)}")
+            raise
+    
+    def delete_paper(self, arxiv_id, node_ids=(), lock=None):
+        """Remove a paper's vectors and cached nodes, found by id and by id prefix"""
+        try:
+            node_ids = set(node_ids)
+            # Catches vectors left behind by earlier, interrupted ingests, and
+            # chunks only a retired generation has
+            for backend in [self.vector_backend] + [backend for _, backend, _ in self._retained_generations()]:
+                node_ids.update(self._with_retry(backend.ids_with_prefix, f"{arxiv_id}:"))
+            self.delete_nodes(sorted(node_ids), lock=lock)
+            return len(node_ids)
+        except Exception as e:
+            logger.error(f"Error deleting paper {arxiv_id} from index: {str(e)}")
+            raise
+    
+    def get_index(self, lock_wait_timeout=None):
+        """Get existing index from the vector store with Redis caching"""
         try:
             # Fast path: Use Redis cache if available
             if self.redis_manager.is_initialized():
                 logger.info("Using cached index from Redis")
-                return VectorStoreIndex.from_vector_store(
-                    vector_store=self.vector_store,
-                    storage_context=self.storage_context
-                )
+                return self._vector_index()
             
-            # Check Pinecone index status
-            index_stats = self.pinecone_index.describe_index_stats()
-            if index_stats.total_vector_count == 0:
-                logger.warning("Pinecone index is empty")
+            # Check vector store status
+            index_stats = self.vector_backend.stats()
+            if index_stats['total_vector_count'] == 0:
+                logger.warning("Vector index is empty")
                 return None
             
             # Rebuild storage context and load nodes
             logger.info("Rebuilding storage context from database")
-            self.storage_context = StorageContext.from_defaults(
-                vector_store=self.vector_store
-            )
-            
-            nodes = self.node_store.load_nodes()
-            if not nodes:
-                logger.warning("No nodes found in database")
-                return None
+            storage_context = self._new_storage_context()
             
-            # Update storage and cache
-            self.storage_context.docstore.add_documents(nodes)
-            with redis_lock:
-                self.redis_manager.store_nodes(nodes)
+            # Update storage and cache, the current context stays if the lock is busy
+            with self._node_cache_lock(lock_wait_timeout):
+                if settings.DOCSTORE_MODE == "lazy":
+                    count = self.node_store.count_nodes()
+                else:
+                    count = self._load_nodes_from_database(storage_context)
+                self.storage_context = storage_context
+                if not count:
+                    logger.warning("No nodes found in database")
+                    return None
                 self.redis_manager.store_index_stats(index_stats)
                 self.redis_manager.mark_initialized()
-                logger.info(f"Loaded {len(nodes)} documents into storage and cache")
+                logger.info(f"Loaded {count} documents into storage and cache")
             
             # Create and return index
-            return VectorStoreIndex.from_vector_store(
-                vector_store=self.vector_store,
-                storage_context=self.storage_context
-            )
+            return self._vector_index()
             
         except Exception as e:
             logger.error(f"Error getting index: {str(e)}")
@@ -224,14 +587,153 @@ class IndexManager:
             raise
 
     def delete_vector_database(self):
-        """Delete the entire Pinecone index"""
+        """Delete every vector and start again from an empty index"""
         try:
-            # Delete the entire index
-            self.pinecone_client.delete_index(self.index_name)
+            # Drop the vectors and reconnect to a fresh, empty index
+            self.vector_backend.reset()
+            self.vector_store = self.vector_backend.vector_store
+            self.storage_context = self._new_storage_context()
+            self._query_processor = None
+            self._invalidate_caches()
             # Clear Redis data with lock
-            with redis_lock:
-                self.redis_manager.clear_all()
-            logger.info(f"Deleted Pinecone index: {self.index_name} and cleared Redis data")
+            with self._node_cache_lock():
+                self.node_cache.clear_all()
+            logger.info("Deleted vector database and cleared Redis data")
         except Exception as e:
-            logger.error(f"Error deleting Pinecone index: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error(f"Error deleting vector database: {str(e)}")
+            raise
+    
+    def _validate_generation(self, backend, expected, probe_node):
+        """Check a built generation holds every vector and answers a query"""
+        deadline = time.monotonic() + settings.GENERATION_VALIDATE_TIMEOUT
+        # Serverless indexes report counts with some delay
+        while backend.vector_count() < expected:
+            if time.monotonic() >= deadline:
+                raise RuntimeError(
+                    f"Generation {backend.generation} has {backend.vector_count()} "
+                    f"of {expected} vectors"
+                )
+            time.sleep(1)
+        result = backend.vector_store.query(
+            VectorStoreQuery(query_embedding=probe_node.embedding, similarity_top_k=1)
+        )
+        if not result.ids:
+            raise RuntimeError(f"Generation {backend.generation} returned no results for a probe query")
+    
+    def build_generation(self, lock, nodes=None):
+        """Build a new index generation beside the live one and switch queries to it
+        
+        nodes defaults to every node of the current generation. The nodes go
+        to the new generation's own nodes table, BM25 index and vectors, so
+        queries keep reading the current generation's text until the new one
+        is fully written and validated; the pointer then moves in one Redis
+        write, through the lock's fence. Each batch of nodes and vectors is
+        only written while the lease is still held.
+        """
+        generation = self.generations.create()
+        backend = create_vector_backend(generation=generation)
+        node_store = self.node_stores.get(generation)
+        try:
+            batches = (
+                [nodes[start:start + settings.NODE_STORE_BATCH_SIZE]
+                 for start in range(0, len(nodes), settings.NODE_STORE_BATCH_SIZE)]
+                if nodes is not None else self.node_store.iter_node_batches()
+            )
+            # The store keeps one vector per id, a node repeated across
+            # batches must only be expected once
+            leaf_ids = set()
+            probe_node = None
+            for batch in batches:
+                lock.check()
+                node_store.store_nodes(batch)
+                written = self.upsert_nodes(batch, only_missing=False, backend=backend, lock=lock)
+                leaf_ids.update(node.node_id for node in get_leaf_nodes(batch))
+                if written and probe_node is None:
+                    probe_node = get_leaf_nodes(batch)[0]
+            expected = len(leaf_ids)
+            if not expected:
+                raise RuntimeError("No nodes to index")
+            
+            self._validate_generation(backend, expected, probe_node)
+            # Built from every node under the maintenance lock, so its BM25 index is current
+            node_store.bm25_index.mark_synced(self.redis_manager.for_generation(generation).get_nodes_version())
+            self.generations.update(generation, status="ready", vector_count=expected)
+            self.generations.activate(generation, lock)
+        except Exception as e:
+            logger.error(f"Error building index generation {generation}: {str(e)}")
+            self.generations.update(generation, status="failed", retired_at=time.time(), error=str(e))
+            try:
+                self._drop_generation(generation, backend)
+            except Exception as drop_error:
+                logger.error(f"Error dropping failed generation {generation}: {str(drop_error)}")
+            raise
+        
+        self.refresh_generation(force=True)
+        self._invalidate_caches()
+        self.collect_generations()
+        return generation
+    
+    def rollback_generation(self, lock):
+        """Switch queries back to the most recent retired generation"""
+        target = self.generations.rollback_target()
+        if target is None:
+            raise ValueError("No previous index generation to roll back to")
+        self.generations.activate(target, lock)
+        self.refresh_generation(force=True)
+        self._invalidate_caches()
+        return target
+    
+    def _drop_generation(self, generation, backend=None):
+        """Delete a generation's vectors, nodes, BM25 index and cached nodes"""
+        backend = self._retained_backends.pop(generation, None) or backend
+        (backend or create_vector_backend(generation=generation)).drop()
+        self.node_stores.drop(generation)
+        with self._node_cache_lock():
+            self.redis_manager.for_generation(generation).clear_nodes()
+    
+    def collect_generations(self):
+        """Delete generations retired for longer than the grace period"""
+        for generation in self.generations.expired(settings.GENERATION_GC_GRACE_SECONDS):
+            try:
+                self._drop_generation(generation)
+                self.generations.forget(generation)
+                logger.info(f"Garbage collected index generation {generation}")
+            except Exception as e:
+                logger.error(f"Error garbage collecting generation {generation}: {str(e)}")
+    
+    def try_collect_generations(self):
+        """Collect expired generations unless another worker holds the maintenance lock"""
+        lock = RedisLeaseLock(self.redis_manager.redis_client, INDEX_MAINTENANCE_LOCK)
+        if lock.acquire(blocking=False) is None:
+            # A build in progress collects once it has switched generations
+            return False
+        try:
+            self.collect_generations()
+            return True
+        finally:
+            lock.release()
+    
+    def _generation_gc_loop(self):
+        while True:
+            try:
+                self.try_collect_generations()
+            except Exception as e:
+                logger.error(f"Error collecting index generations: {str(e)}")
+            if not settings.GENERATION_GC_INTERVAL or self._stop_generation_gc.wait(settings.GENERATION_GC_INTERVAL):
+                return
+    
+    def start_generation_gc(self):
+        """Collect expired generations now, then every GENERATION_GC_INTERVAL seconds in the background"""
+        if self._generation_gc_thread is not None and self._generation_gc_thread.is_alive():
+            return
+        self._stop_generation_gc.clear()
+        self._generation_gc_thread = threading.Thread(
+            target=self._generation_gc_loop,
+            name="generation-gc",
+            daemon=True
+        )
+        self._generation_gc_thread.start()
+    
+    def stop_generation_gc(self):
+        """Stop the background generation collector"""
+        self._stop_generation_gc.set()
@@ -0,0 +1,173 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from app.core.config import settings
+from app.core.metrics import observe_load, record_cache
+
+logger = logging.getLogger(__name__)
+
+class LazyDocumentStore(SimpleDocumentStore):
+    """Docstore that reads nodes on demand instead of holding the corpus
+
+    Lookups go through a bounded in-process LRU, then the Redis node cache
+    (one HMGET per batch), then the nodes table (one IN query per batch).
+    Nodes found further down are written back to the faster tiers. The nodes
+    table stays the source of truth, NodeStore writes it during ingestion,
+    so add/delete here only keep the LRU and Redis in step. Another worker
+    changing nodes bumps a version counter in Redis (version_source,
+    default redis_manager); the LRU is emptied whenever it moves.
+    """
+
+    def __init__(self, node_store, redis_manager=None, cache_size=None, version_source=None):
+        super().__init__()
+        self.node_store = node_store
+        self.redis_manager = redis_manager
+        self.version_source = version_source or redis_manager
+        self.cache_size = cache_size or settings.DOCSTORE_CACHE_SIZE
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._version = self._read_version()
+
+    def _read_version(self):
+        if self.version_source is None:
+            return None
+        try:
+            return self.version_source.get_nodes_version()
+        except Exception as e:
+            # Without the counter the LRU cannot be trusted
+            logger.warning(f"Could not read the node version, emptying the docstore LRU: {str(e)}")
+            return None
+
+    def _check_version(self):
+        """Empty the LRU if nodes changed since it was filled"""
+        if self.version_source is None:
+            return
+        version = self._read_version()
+        with self._cache_lock:
+            if version is None or version != self._version:
+                self._cache.clear()
+                self._version = version
+
+    def _cache_get(self, node_ids) -> Dict[str, BaseNode]:
+        found = {}
+        with self._cache_lock:
+            for node_id in node_ids:
+                node = self._cache.get(node_id)
+                if node is not None:
+                    self._cache.move_to_end(node_id)
+                    found[node_id] = node
+        return found
+
+    def _cache_put(self, nodes):
+        with self._cache_lock:
+            for node in nodes:
+                self._cache[node.node_id] = node
+                self._cache.move_to_end(node.node_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_evict(self, node_ids):
+        with self._cache_lock:
+            for node_id in node_ids:
+                self._cache.pop(node_id, None)
+
+    def _fetch(self, node_ids) -> Dict[str, BaseNode]:
+        """Resolve ids through the LRU, Redis and database tiers"""
+        node_ids = list(dict.fromkeys(node_ids))
+        self._check_version()
+        found = self._cache_get(node_ids)
+        missing = [node_id for node_id in node_ids if node_id not in found]
+        record_cache("docstore", hits=len(found), misses=len(missing))
+
+        if missing and self.redis_manager is not None:
+            with observe_load("redis", "get_nodes_by_ids"):
+                from_redis = [
+                    node for node in self.redis_manager.get_nodes_by_ids(missing) if node is not None
+                ]
+            self._cache_put(from_redis)
+            found.update((node.node_id, node) for node in from_redis)
+            missing = [node_id for node_id in missing if node_id not in found]
+
+        if missing:
+            with observe_load("database", "get_nodes_by_ids"):
+                from_db = list(self.node_store.get_nodes_by_ids(missing).values())
+            self._cache_put(from_db)
+            found.update((node.node_id, node) for node in from_db)
+            if from_db and self.redis_manager is not None:
+                try:
+                    self.redis_manager.upsert_nodes(from_db)
+                except Exception as e:
+                    # Redis is only a cache tier, the nodes were read fine
+                    logger.warning(f"Could not write nodes back to Redis: {str(e)}")
+            logger.debug(f"Loaded {len(from_db)} of {len(missing)} missing nodes from database")
+        return found
+
+    def get_nodes(self, node_ids: List[str], raise_error: bool = True) -> List[BaseNode]:
+        """Fetch nodes in bulk, skipping missing ids unless raise_error is set"""
+        found = self._fetch(node_ids)
+        nodes = []
+        for node_id in node_ids:
+            node = found.get(node_id)
+            if node is None:
+                if raise_error:
+                    raise ValueError(f"Node {node_id} not found")
+                continue
+            nodes.append(node)
+        return nodes
+
+    def get_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        node = self._fetch([doc_id]).get(doc_id)
+        if node is None and raise_error:
+            raise ValueError(f"doc_id {doc_id} not found.")
+        return node
+
+    async def aget_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        return self.get_document(doc_id, raise_error=raise_error)
+
+    async def aget_nodes(self, node_ids: List[str], raise_error: bool = True) -> List[BaseNode]:
+        return self.get_nodes(node_ids, raise_error=raise_error)
+
+    def document_exists(self, doc_id: str) -> bool:
+        return self.get_document(doc_id, raise_error=False) is not None
+
+    async def adocument_exists(self, doc_id: str) -> bool:
+        return self.document_exists(doc_id)
+
+    @property
+    def docs(self) -> Dict[str, BaseNode]:
+        """Every stored node, streamed from the database (expensive, avoid on hot paths)"""
+        return {node.node_id: node for node in self.node_store.iter_nodes()}
+
+    def add_documents(
+        self,
+        docs: Sequence[BaseNode],
+        allow_update: bool = True,
+        batch_size: Optional[int] = None,
+        store_text: bool = True,
+    ) -> None:
+        # Nodes are persisted by NodeStore, only refresh the hot set
+        self._cache_put(docs)
+
+    async def async_add_documents(
+        self,
+        docs: Sequence[BaseNode],
+        allow_update: bool = True,
+        batch_size: Optional[int] = None,
+        store_text: bool = True,
+    ) -> None:
+        self.add_documents(docs, allow_update=allow_update, batch_size=batch_size, store_text=store_text)
+
+    def delete_document(self, doc_id: str, raise_error: bool = True) -> None:
+        self._cache_evict([doc_id])
+
+    async def adelete_document(self, doc_id: str, raise_error: bool = True) -> None:
+        self.delete_document(doc_id, raise_error=raise_error)
+
+    def cache_info(self):
+        """LRU occupancy, for debugging"""
+        with self._cache_lock:
+            return {"size": len(self._cache), "capacity": self.cache_size}
@@ -0,0 +1,496 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, List, Optional, Sequence
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+logger = logging.getLogger(__name__)
+
+# Comparisons for metadata filters, IS_EMPTY is handled separately
+FILTER_OPERATORS = {
+    FilterOperator.EQ: lambda value, target: value == target,
+    FilterOperator.NE: lambda value, target: value != target,
+    FilterOperator.GT: lambda value, target: value > target,
+    FilterOperator.LT: lambda value, target: value < target,
+    FilterOperator.GTE: lambda value, target: value >= target,
+    FilterOperator.LTE: lambda value, target: value <= target,
+    FilterOperator.IN: lambda value, target: value in target,
+    FilterOperator.NIN: lambda value, target: value not in target,
+    FilterOperator.ANY: lambda value, target: any(item in value for item in target),
+    FilterOperator.ALL: lambda value, target: all(item in value for item in target),
+    FilterOperator.CONTAINS: lambda value, target: target in value,
+    FilterOperator.TEXT_MATCH: lambda value, target: target in value,
+    FilterOperator.TEXT_MATCH_INSENSITIVE: lambda value, target: target.lower() in value.lower(),
+    FilterOperator.IS_EMPTY: None,
+}
+
+# Rows reserved when the matrix file is first created
+INITIAL_CAPACITY = 1024
+# IVF needs a few dozen points per list to give meaningful centroids
+IVF_MIN_POINTS_PER_LIST = 39
+IVF_TRAIN_SAMPLE = 50000
+IVF_TRAIN_ITERATIONS = 10
+# Seconds a writer waits for another process to release the write lock
+WRITE_LOCK_TIMEOUT = 60
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """Vector store backed by a memory-mapped float32 matrix on local disk
+
+    Vectors are stored L2-normalized so cosine similarity is a single matrix
+    product. Node payloads, the id to row mapping and the optional IVF list
+    assignment live in a SQLite file next to the matrix. With ivf_lists > 0
+    an inverted-file index is trained once the corpus is large enough and
+    queries only scan the ivf_probes closest lists. Several processes can
+    share one directory: writes hold the SQLite write lock while they
+    allocate rows, and readers reload when the stored version changes.
+    """
+
+    stores_text: bool = True
+    is_embedding_query: bool = True
+
+    persist_dir: str
+    ivf_lists: int = 0
+    ivf_probes: int = 8
+
+    _lock: Any = PrivateAttr()
+    _db: Any = PrivateAttr()
+    _matrix: Any = PrivateAttr(default=None)
+    _dim: int = PrivateAttr(default=0)
+    _capacity: int = PrivateAttr(default=0)
+    _rows: int = PrivateAttr(default=0)
+    _valid: Any = PrivateAttr(default=None)
+    _free_rows: Any = PrivateAttr(default=None)
+    _centroids: Any = PrivateAttr(default=None)
+    _assignments: Any = PrivateAttr(default=None)
+    _trained_at: int = PrivateAttr(default=0)
+    _version: int = PrivateAttr(default=-1)
+
+    def __init__(self, persist_dir: str, ivf_lists: int = 0, ivf_probes: int = 8, **kwargs: Any):
+        super().__init__(persist_dir=persist_dir, ivf_lists=ivf_lists, ivf_probes=ivf_probes, **kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(
+            os.path.join(persist_dir, "nodes.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=WRITE_LOCK_TIMEOUT
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "row INTEGER PRIMARY KEY, node_id TEXT UNIQUE, ref_doc_id TEXT, "
+            "list_id INTEGER, payload TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS vectors_ref_doc_id ON vectors (ref_doc_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._reload()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def _matrix_path(self) -> str:
+        return os.path.join(self.persist_dir, "vectors.f32")
+
+    @property
+    def _centroids_path(self) -> str:
+        return os.path.join(self.persist_dir, "ivf_centroids.npy")
+
+    def _get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value: Any) -> None:
+        self._db.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+
+    def _bump_version(self) -> None:
+        self._version = int(self._get_meta("version", "0")) + 1
+        self._set_meta("version", self._version)
+
+    def _open_matrix(self) -> None:
+        """Map the matrix file, growing it to the current capacity"""
+        size = self._capacity * self._dim * 4
+        with open(self._matrix_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._matrix = np.memmap(
+            self._matrix_path, dtype=np.float32, mode="r+", shape=(self._capacity, self._dim)
+        )
+
+    def _reload(self) -> None:
+        """Rebuild in-memory row bookkeeping from disk"""
+        with self._lock:
+            self._version = int(self._get_meta("version", "0"))
+            self._dim = int(self._get_meta("dim", "0"))
+            self._capacity = int(self._get_meta("capacity", "0"))
+            self._rows = int(self._get_meta("rows", "0"))
+            self._matrix = None
+            self._valid = np.zeros(self._capacity, dtype=bool)
+            self._assignments = np.full(self._capacity, -1, dtype=np.int32)
+            if self._dim and self._capacity:
+                self._open_matrix()
+            for row, list_id in self._db.execute("SELECT row, list_id FROM vectors"):
+                self._valid[row] = True
+                if list_id is not None:
+                    self._assignments[row] = list_id
+            self._free_rows = [int(row) for row in np.flatnonzero(~self._valid[:self._rows])]
+            self._centroids = None
+            self._trained_at = int(self._get_meta("ivf_trained_at", "0"))
+            if self.ivf_lists and os.path.exists(self._centroids_path):
+                self._centroids = np.load(self._centroids_path)
+
+    def _refresh(self) -> None:
+        """Pick up writes made by other processes since the last read"""
+        if int(self._get_meta("version", "0")) != self._version:
+            self._reload()
+
+    @contextmanager
+    def _write(self):
+        """Run a write under the SQLite write lock with bookkeeping refreshed
+
+        BEGIN IMMEDIATE takes the lock before anything is read, so processes
+        sharing the directory allocate rows one after the other and each sees
+        the rows and free list the others committed. A failed write is rolled
+        back and the bookkeeping reloaded from disk.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                yield
+                self._bump_version()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                self._reload()
+                raise
+
+    def _ensure_capacity(self, needed_rows: int) -> None:
+        if needed_rows <= self._capacity:
+            return
+        capacity = max(self._capacity, INITIAL_CAPACITY)
+        while capacity < needed_rows:
+            capacity *= 2
+        if self._matrix is not None:
+            self._matrix.flush()
+        self._capacity = capacity
+        self._open_matrix()
+        self._valid = np.concatenate([self._valid, np.zeros(capacity - len(self._valid), dtype=bool)])
+        self._assignments = np.concatenate([
+            self._assignments, np.full(capacity - len(self._assignments), -1, dtype=np.int32)
+        ])
+        self._set_meta("capacity", capacity)
+
+    def _assign_lists(self, vectors: np.ndarray) -> Optional[np.ndarray]:
+        if self._centroids is None:
+            return None
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Add or overwrite node vectors, the last node wins for repeated ids"""
+        if not nodes:
+            return []
+        node_ids = [node.node_id for node in nodes]
+        nodes = list({node.node_id: node for node in nodes}.values())
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._write():
+            if not self._dim:
+                self._dim = vectors.shape[1]
+                self._set_meta("dim", self._dim)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Expected {self._dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            existing = self._rows_for_ids([node.node_id for node in nodes])
+            rows = []
+            for node in nodes:
+                if node.node_id in existing:
+                    rows.append(existing[node.node_id])
+                elif self._free_rows:
+                    rows.append(self._free_rows.pop())
+                else:
+                    rows.append(self._rows)
+                    self._rows += 1
+            self._ensure_capacity(self._rows)
+
+            rows_array = np.asarray(rows)
+            self._matrix[rows_array] = vectors
+            self._matrix.flush()
+            self._valid[rows_array] = True
+            list_ids = self._assign_lists(vectors)
+            if list_ids is not None:
+                self._assignments[rows_array] = list_ids
+
+            self._db.executemany(
+                "INSERT INTO vectors (row, node_id, ref_doc_id, list_id, payload) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(node_id) DO UPDATE SET row = excluded.row, ref_doc_id = excluded.ref_doc_id, "
+                "list_id = excluded.list_id, payload = excluded.payload",
+                [
+                    (
+                        row,
+                        node.node_id,
+                        node.ref_doc_id,
+                        int(list_ids[i]) if list_ids is not None else None,
+                        json.dumps(node_to_metadata_dict(node, remove_text=False, flat_metadata=False))
+                    )
+                    for i, (row, node) in enumerate(zip(rows, nodes))
+                ]
+            )
+            self._set_meta("rows", self._rows)
+
+        with self._lock:
+            # (Re)train the IVF index once the corpus doubled since last time
+            live = int(self._valid.sum())
+            if self.ivf_lists and live >= self.ivf_lists * IVF_MIN_POINTS_PER_LIST and live >= 2 * self._trained_at:
+                self._train_ivf()
+
+        return node_ids
+
+    def _rows_for_ids(self, node_ids: List[str]) -> dict:
+        rows = {}
+        for start in range(0, len(node_ids), 500):
+            batch = node_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for node_id, row in self._db.execute(
+                f"SELECT node_id, row FROM vectors WHERE node_id IN ({placeholders})", batch
+            ):
+                rows[node_id] = row
+        return rows
+
+    def existing_ids(self, node_ids: List[str]) -> set:
+        """Return the subset of node_ids that have a stored vector"""
+        with self._lock:
+            return set(self._rows_for_ids(list(node_ids)))
+
+    def ids_with_prefix(self, prefix: str) -> set:
+        """Return the ids of stored vectors whose node id starts with prefix"""
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self._lock:
+            self._refresh()
+            return {node_id for (node_id,) in self._db.execute(
+                "SELECT node_id FROM vectors WHERE node_id LIKE ? ESCAPE '\\'", (escaped + "%",)
+            )}
+
+    def _delete_rows(self, rows: List[int]) -> None:
+        if not rows:
+            return
+        self._valid[np.asarray(rows)] = False
+        self._free_rows.extend(rows)
+        self._db.executemany("DELETE FROM vectors WHERE row = ?", [(row,) for row in rows])
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Delete all vectors that came from a reference document"""
+        with self._write():
+            rows = [row for (row,) in self._db.execute(
+                "SELECT row FROM vectors WHERE ref_doc_id = ?", (ref_doc_id,)
+            )]
+            self._delete_rows(rows)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        """Delete vectors by node id, metadata filters or both
+
+        With both, only the given nodes that match the filters are deleted.
+        """
+        if node_ids is None and filters is None:
+            return
+        with self._write():
+            if node_ids is not None:
+                rows = self._rows_for_ids(list(node_ids)).values()
+            else:
+                rows = [row for (row,) in self._db.execute("SELECT row FROM vectors")]
+            if filters is not None:
+                rows = [
+                    row for row, payload in self._payloads(list(rows)).items()
+                    if self._matches(metadata_dict_to_node(json.loads(payload)).metadata, filters)
+                ]
+            self._delete_rows(list(rows))
+
+    def clear(self) -> None:
+        """Delete every vector and the IVF index"""
+        with self._write():
+            self._db.execute("DELETE FROM vectors")
+            for key in ("dim", "capacity", "rows", "ivf_trained_at"):
+                self._db.execute("DELETE FROM meta WHERE key = ?", (key,))
+            self._matrix = None
+            for path in (self._matrix_path, self._centroids_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._reload()
+
+    def close(self) -> None:
+        """Release the matrix and the SQLite connection"""
+        with self._lock:
+            self._matrix = None
+            self._db.close()
+
+    def count(self) -> int:
+        """Number of stored vectors"""
+        with self._lock:
+            self._refresh()
+            return int(self._valid.sum())
+
+    def _train_ivf(self) -> None:
+        """Train IVF centroids with spherical k-means and assign every row"""
+        with self._write():
+            self._train_ivf_rows()
+
+    def _train_ivf_rows(self) -> None:
+        live_rows = np.flatnonzero(self._valid)
+        rng = np.random.default_rng(0)
+        sample_rows = live_rows
+        if len(sample_rows) > IVF_TRAIN_SAMPLE:
+            sample_rows = np.sort(rng.choice(live_rows, IVF_TRAIN_SAMPLE, replace=False))
+        sample = np.asarray(self._matrix[sample_rows])
+
+        centroids = sample[rng.choice(len(sample), self.ivf_lists, replace=False)]
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(self.ivf_lists):
+                members = sample[labels == list_id]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[list_id] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        self._centroids = centroids.astype(np.float32)
+        np.save(self._centroids_path, self._centroids)
+        assignments = self._assign_lists(np.asarray(self._matrix[live_rows]))
+        self._assignments[live_rows] = assignments
+        self._db.executemany(
+            "UPDATE vectors SET list_id = ? WHERE row = ?",
+            [(int(list_id), int(row)) for row, list_id in zip(live_rows, assignments)]
+        )
+        self._trained_at = len(live_rows)
+        self._set_meta("ivf_trained_at", self._trained_at)
+        logger.info(f"Trained IVF index with {self.ivf_lists} lists on {len(live_rows)} vectors")
+
+    def _candidate_rows(self, query_vector: np.ndarray, query: VectorStoreQuery) -> np.ndarray:
+        mask = self._valid[:self._rows].copy()
+        if self._centroids is not None:
+            probes = np.argsort(-(self._centroids @ query_vector))[:self.ivf_probes]
+            mask &= np.isin(self._assignments[:self._rows], probes)
+        restrict_ids = query.node_ids or query.doc_ids
+        if restrict_ids:
+            column = "node_id" if query.node_ids else "ref_doc_id"
+            allowed = np.zeros_like(mask)
+            for start in range(0, len(restrict_ids), 500):
+                batch = list(restrict_ids[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                for (row,) in self._db.execute(
+                    f"SELECT row FROM vectors WHERE {column} IN ({placeholders})", batch
+                ):
+                    allowed[row] = True
+            mask &= allowed
+        return np.flatnonzero(mask)
+
+    def _payloads(self, rows: List[int]) -> dict:
+        payloads = {}
+        for start in range(0, len(rows), 500):
+            batch = [int(row) for row in rows[start:start + 500]]
+            placeholders = ",".join("?" * len(batch))
+            payloads.update(self._db.execute(
+                f"SELECT row, payload FROM vectors WHERE row IN ({placeholders})", batch
+            ))
+        return payloads
+
+    def _matches(self, metadata: dict, filters: Optional[MetadataFilters]) -> bool:
+        if filters is None or not filters.filters:
+            return True
+        results = []
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters):
+                results.append(self._matches(metadata, metadata_filter))
+                continue
+            if metadata_filter.operator not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {metadata_filter.operator}")
+            value = metadata.get(metadata_filter.key)
+            if metadata_filter.operator == FilterOperator.IS_EMPTY:
+                results.append(value is None or value == "" or value == [])
+            elif value is None:
+                results.append(metadata_filter.operator in (FilterOperator.NE, FilterOperator.NIN))
+            else:
+                try:
+                    results.append(bool(FILTER_OPERATORS[metadata_filter.operator](value, metadata_filter.value)))
+                except TypeError:
+                    # Values that cannot be compared, e.g. a string against a number
+                    results.append(False)
+        if filters.condition == FilterCondition.OR:
+            return any(results)
+        if filters.condition == FilterCondition.NOT:
+            return not any(results)
+        return all(results)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Cosine top-k over the candidate rows"""
+        with self._lock:
+            self._refresh()
+            if self._matrix is None or query.query_embedding is None:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+            query_vector = np.array(query.query_embedding, dtype=np.float32)
+            query_vector /= max(np.linalg.norm(query_vector), 1e-12)
+            rows = self._candidate_rows(query_vector, query)
+            if len(rows) == 0:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+            scores = np.asarray(self._matrix[rows]) @ query_vector
+            top_k = query.similarity_top_k
+            if query.filters is not None:
+                # Filters are applied after scoring, so rank everything
+                order = np.argsort(-scores)
+            else:
+                k = min(top_k, len(rows))
+                top = np.argpartition(-scores, k - 1)[:k]
+                order = top[np.argsort(-scores[top])]
+
+            nodes, similarities, ids = [], [], []
+            for start in range(0, len(order), max(top_k, 1)):
+                chunk = order[start:start + max(top_k, 1)]
+                chunk_rows = [int(rows[i]) for i in chunk]
+                payloads = self._payloads(chunk_rows)
+                for i, row in zip(chunk, chunk_rows):
+                    if row not in payloads:
+                        # Deleted by another process since the last refresh
+                        continue
+                    node = metadata_dict_to_node(json.loads(payloads[row]))
+                    if not self._matches(node.metadata, query.filters):
+                        continue
+                    nodes.append(node)
+                    similarities.append(float(scores[i]))
+                    ids.append(node.node_id)
+                    if len(nodes) == top_k:
+                        break
+                if len(nodes) == top_k:
+                    break
+
+            return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
@@ -0,0 +1,111 @@
+import logging
+import json
+from app.db.database import SessionLocal, engine
+from app.db.models import PaperManifest
+
+logger = logging.getLogger(__name__)
+
+class ManifestStore:
+    """Per-file ingestion manifest persisted alongside the nodes table"""
+
+    def __init__(self):
+        # The manifest table was added after the nodes table, so make sure it
+        # exists even when init_db was skipped because Redis says it already ran
+        PaperManifest.__table__.create(bind=engine, checkfirst=True)
+
+    def _entry_dict(self, row):
+        return {
+            'arxiv_id': row.arxiv_id,
+            'content_hash': row.content_hash,
+            'file_size': row.file_size,
+            'mtime': row.mtime,
+            'chunker_config': row.chunker_config,
+            'node_ids': json.loads(row.node_ids) if row.node_ids else []
+        }
+
+    def load_entries(self):
+        """Load all manifest entries keyed by filename"""
+        try:
+            with SessionLocal() as db:
+                return {row.filename: self._entry_dict(row) for row in db.query(PaperManifest).all()}
+        except Exception as e:
+            logger.error(f"Error loading paper manifest: {str(e)}")
+            raise
+
+    def get_entry(self, filename):
+        """Manifest entry of one file, None if it was never ingested"""
+        try:
+            with SessionLocal() as db:
+                row = db.query(PaperManifest).filter(PaperManifest.filename == filename).first()
+                return self._entry_dict(row) if row is not None else None
+        except Exception as e:
+            logger.error(f"Error loading manifest entry for {filename}: {str(e)}")
+            raise
+
+    def find_by_arxiv_id(self, arxiv_id):
+        """Manifest entries of a paper keyed by filename"""
+        try:
+            with SessionLocal() as db:
+                rows = db.query(PaperManifest).filter(PaperManifest.arxiv_id == arxiv_id).all()
+                return {row.filename: self._entry_dict(row) for row in rows}
+        except Exception as e:
+            logger.error(f"Error loading manifest entries for {arxiv_id}: {str(e)}")
+            raise
+
+    def upsert_entry(self, filename, arxiv_id, content_hash, file_size, mtime, chunker_config, node_ids):
+        """Create or update the manifest entry for a file"""
+        try:
+            with SessionLocal() as db:
+                entry = db.query(PaperManifest).filter(
+                    PaperManifest.filename == filename
+                ).first()
+                if entry is None:
+                    entry = PaperManifest(filename=filename)
+                    db.add(entry)
+                entry.arxiv_id = arxiv_id
+                entry.content_hash = content_hash
+                entry.file_size = file_size
+                entry.mtime = mtime
+                entry.chunker_config = chunker_config
+                entry.node_ids = json.dumps(node_ids)
+                db.commit()
+        except Exception as e:
+            logger.error(f"Error updating manifest entry for {filename}: {str(e)}")
+            raise
+
+    def touch_entry(self, filename, mtime):
+        """Record a new mtime for a file whose content did not change"""
+        try:
+            with SessionLocal() as db:
+                db.query(PaperManifest).filter(
+                    PaperManifest.filename == filename
+                ).update({PaperManifest.mtime: mtime}, synchronize_session=False)
+                db.commit()
+        except Exception as e:
+            logger.error(f"Error touching manifest entry for {filename}: {str(e)}")
+            raise
+
+    def delete_entries(self, filenames):
+        """Delete manifest entries for the given files"""
+        if not filenames:
+            return
+        try:
+            with SessionLocal() as db:
+                db.query(PaperManifest).filter(
+                    PaperManifest.filename.in_(filenames)
+                ).delete(synchronize_session=False)
+                db.commit()
+        except Exception as e:
+            logger.error(f"Error deleting manifest entries: {str(e)}")
+            raise
+
+    def delete_all_entries(self):
+        """Delete the whole manifest so the next run reprocesses every file"""
+        try:
+            with SessionLocal() as db:
+                db.query(PaperManifest).delete(synchronize_session=False)
+                db.commit()
+                logger.info("Deleted all entries from paper manifest")
+        except Exception as e:
+            logger.error(f"Error deleting paper manifest: {str(e)}")
+            raise
@@ -1,16 +1,40 @@
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import json
-import re
-from app.db.database import SessionLocal
-from app.db.models import Node
+import time
+import threading
+from app.core.config import settings
+from app.core.metrics import record_ingest
+from app.db.database import SessionLocal, engine
+from app.db.models import node_model
+from app.rag.bm25_index import BM25Index, generation_index_path
 from llama_index.core import Document as LlamaDocument
+from llama_index.core.node_parser import get_leaf_nodes
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
 
 logger = logging.getLogger(__name__)
 
+# Metadata key holding the links between hierarchical chunks, the nodes table
+# only has text and metadata columns
+HIERARCHY_KEY = "_hierarchy"
+
 class NodeStore:
-    def __init__(self):
+    """Nodes of one index generation in the database, plus their BM25 index
+
+    Every generation keeps its own nodes table and BM25 file, so building
+    or rolling back a generation never changes the text another one serves.
+    """
+
+    def __init__(self, generation=0):
         self.storage_context = None
+        self.generation = generation
+        self.model = node_model(generation)
+        if generation:
+            self.model.__table__.create(bind=engine, checkfirst=True)
+        # Keyword index kept in step with the nodes table for hybrid retrieval
+        self.bm25_index = BM25Index(path=generation_index_path(generation))
     
     def _sanitize_text(self, text):
         """Sanitize text by removing problematic Unicode characters"""
@@ -34,88 +58,288 @@ class NodeStore:
                 sanitized[key] = value
         return sanitized
     
-    def store_nodes(self, nodes):
-        """Store nodes in database"""
+    def _node_hierarchy(self, node):
+        """Parent, child and sibling ids of a hierarchical chunk, None for flat chunks"""
+        if node.parent_node is None and node.child_nodes is None:
+            return None
+        hierarchy = {
+            "parent": node.parent_node.node_id if node.parent_node else None,
+            "children": [child.node_id for child in node.child_nodes or []],
+            "prev": node.prev_node.node_id if node.prev_node else None,
+            "next": node.next_node.node_id if node.next_node else None
+        }
+        return {key: value for key, value in hierarchy.items() if value}
+    
+    def _node_relationships(self, hierarchy):
+        """Rebuild node relationships from a stored hierarchy entry"""
+        relationships = {}
+        if hierarchy.get("parent"):
+            relationships[NodeRelationship.PARENT] = RelatedNodeInfo(node_id=hierarchy["parent"])
+        if hierarchy.get("children"):
+            relationships[NodeRelationship.CHILD] = [
+                RelatedNodeInfo(node_id=child_id) for child_id in hierarchy["children"]
+            ]
+        if hierarchy.get("prev"):
+            relationships[NodeRelationship.PREVIOUS] = RelatedNodeInfo(node_id=hierarchy["prev"])
+        if hierarchy.get("next"):
+            relationships[NodeRelationship.NEXT] = RelatedNodeInfo(node_id=hierarchy["next"])
+        return relationships
+    
+    def _node_row(self, node):
+        """Sanitized column values for a node"""
+        # Sanitize text and metadata to handle Unicode issues
+        sanitized_metadata = self._sanitize_metadata(node.metadata)
+        hierarchy = self._node_hierarchy(node)
+        if hierarchy:
+            sanitized_metadata[HIERARCHY_KEY] = hierarchy
+        return {
+            "node_id": node.node_id,
+            "node_text": self._sanitize_text(node.text),
+            "node_metadata": json.dumps(sanitized_metadata) if sanitized_metadata else None
+        }
+    
+    def _upsert_batch(self, db, rows):
+        """Write one batch of rows, returning (inserted, updated)"""
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            # One round trip per batch, xmax is 0 only for freshly inserted rows
+            statement = pg_insert(self.model).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=[self.model.node_id],
+                set_={
+                    "node_text": statement.excluded.node_text,
+                    "node_metadata": statement.excluded.node_metadata
+                }
+            ).returning(literal_column("(xmax = 0)"))
+            flags = [row[0] for row in db.execute(statement)]
+            inserted = sum(1 for flag in flags if flag)
+            return inserted, len(flags) - inserted
+        
+        node_ids = [row["node_id"] for row in rows]
+        existing = set(db.scalars(select(self.model.node_id).where(self.model.node_id.in_(node_ids))))
+        if dialect == "sqlite":
+            statement = sqlite_insert(self.model).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=[self.model.node_id],
+                set_={
+                    "node_text": statement.excluded.node_text,
+                    "node_metadata": statement.excluded.node_metadata
+                }
+            )
+            db.execute(statement)
+        else:
+            # Other databases: one bulk insert and one bulk update per batch
+            ids_by_node_id = dict(db.execute(
+                select(self.model.node_id, self.model.id).where(self.model.node_id.in_(existing))
+            ).all()) if existing else {}
+            db.bulk_insert_mappings(self.model, [row for row in rows if row["node_id"] not in existing])
+            db.bulk_update_mappings(self.model, [
+                dict(row, id=ids_by_node_id[row["node_id"]]) for row in rows if row["node_id"] in existing
+            ])
+        updated = len(set(node_ids) & existing)
+        return len(rows) - updated, updated
+    
+    def store_nodes(self, nodes, batch_size=None, commit_interval=None):
+        """Bulk upsert nodes into the database, returning inserted and updated counts"""
+        batch_size = batch_size or settings.NODE_STORE_BATCH_SIZE
+        commit_interval = commit_interval or settings.NODE_STORE_COMMIT_INTERVAL
         try:
+            # A node id repeated within the call keeps its last version
+            nodes = list({node.node_id: node for node in nodes}.values())
+            started = time.perf_counter()
+            rows = [self._node_row(node) for node in nodes]
+            inserted = updated = 0
             with SessionLocal() as db:
-                for node in nodes:
-                    logger.info(f"Storing node {node.node_id}")
-                    logger.info(f"Node metadata before storage: {node.metadata}")
-                    
-                    # Sanitize text and metadata to handle Unicode issues
-                    sanitized_text = self._sanitize_text(node.text)
-                    sanitized_metadata = self._sanitize_metadata(node.metadata)
-                    
-                    existing_doc = db.query(Node).filter(
-                        Node.node_id == node.node_id
-                    ).first()
-                    
-                    if existing_doc:
-                        existing_doc.node_text = sanitized_text
-                        existing_doc.node_metadata = json.dumps(sanitized_metadata) if sanitized_metadata else None
-                        logger.info(f"Updated existing doc {node.node_id} with sanitized metadata")
-                    else:
-                        doc = Node(
-                            node_id=node.node_id,
-                            node_text=sanitized_text,
-                            node_metadata=json.dumps(sanitized_metadata) if sanitized_metadata else None
-                        )
-                        db.add(doc)
-                        logger.info(f"Created new doc {node.node_id} with sanitized metadata")
+                for batch_number, start in enumerate(range(0, len(rows), batch_size), start=1):
+                    batch_inserted, batch_updated = self._upsert_batch(db, rows[start:start + batch_size])
+                    inserted += batch_inserted
+                    updated += batch_updated
+                    if batch_number % commit_interval == 0:
+                        db.commit()
                 db.commit()
-                logger.info(f"Stored {len(nodes)} nodes in database")
-                return True
+            record_ingest("store", len(rows), time.perf_counter() - started)
+            logger.info(f"Stored {len(rows)} nodes in database ({inserted} inserted, {updated} updated)")
+            # Parents of hierarchical chunks are only reached by merging
+            self.bm25_index.add_nodes(get_leaf_nodes(nodes))
+            return {"inserted": inserted, "updated": updated}
         except Exception as e:
             logger.error(f"Error storing nodes: {str(e)}")
             raise
 
-    def load_nodes(self):
-        """Load nodes from database into storage context"""
+    def _matches_arxiv_id(self, node_id, node_metadata, arxiv_id):
+        """Exact check behind the LIKE prefilter in iter_rows"""
+        if node_id.startswith(f"{arxiv_id}:"):
+            return True
+        metadata = json.loads(node_metadata) if node_metadata else {}
+        return metadata.get("arxiv_id") == arxiv_id
+    
+    def _row_to_document(self, row):
+        """Build the llama-index document for a node row"""
+        metadata = json.loads(row["node_metadata"]) if row["node_metadata"] else {}
+        hierarchy = metadata.pop(HIERARCHY_KEY, None)
+        return LlamaDocument(
+            doc_id=row["node_id"],
+            text=row["node_text"],
+            metadata=metadata,
+            relationships=self._node_relationships(hierarchy) if hierarchy else {}
+        )
+    
+    def iter_rows(self, columns=None, arxiv_id=None, since=None, batch_size=None):
+        """Stream node rows as dicts of the requested columns, batch_size rows at a time"""
+        columns = list(columns or ["node_id", "node_text", "node_metadata"])
+        batch_size = batch_size or settings.NODE_STORE_BATCH_SIZE
+        # node_id and node_metadata are needed for the exact arxiv_id check
+        fetched = list(dict.fromkeys(
+            columns + (["node_id", "node_metadata"] if arxiv_id else [])
+        ))
+        query = select(*[getattr(self.model, column) for column in fetched]).order_by(self.model.id)
+        if arxiv_id:
+            query = query.where(
+                self.model.node_id.startswith(f"{arxiv_id}:", autoescape=True)
+                | self.model.node_metadata.contains(f'"arxiv_id": {json.dumps(arxiv_id)}', autoescape=True)
+            )
+        if since is not None:
+            query = query.where(self.model.created_at >= since)
+        
+        with SessionLocal() as db:
+            # yield_per streams from a server-side cursor where the driver supports it
+            result = db.execute(query.execution_options(yield_per=batch_size))
+            for partition in result.partitions():
+                for row in partition:
+                    row = row._asdict()
+                    if arxiv_id and not self._matches_arxiv_id(row["node_id"], row["node_metadata"], arxiv_id):
+                        continue
+                    yield {column: row[column] for column in columns}
+    
+    def iter_node_batches(self, arxiv_id=None, since=None, batch_size=None):
+        """Stream stored nodes as lists of at most batch_size documents"""
+        batch_size = batch_size or settings.NODE_STORE_BATCH_SIZE
+        batch = []
+        for row in self.iter_rows(arxiv_id=arxiv_id, since=since, batch_size=batch_size):
+            batch.append(self._row_to_document(row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def iter_nodes(self, arxiv_id=None, since=None, batch_size=None):
+        """Stream stored nodes one document at a time"""
+        for batch in self.iter_node_batches(arxiv_id=arxiv_id, since=since, batch_size=batch_size):
+            yield from batch
+    
+    def get_nodes_by_ids(self, node_ids, batch_size=None):
+        """Fetch stored nodes by id with one query per batch, as a dict keyed by id"""
+        batch_size = batch_size or settings.NODE_STORE_BATCH_SIZE
+        node_ids = list(node_ids)
+        nodes = {}
         try:
             with SessionLocal() as db:
-                try:
-                    stored_docs = db.query(Node).all()
-                    nodes = []
-                    for doc in stored_docs:
-                        logger.info(f"Loading doc {doc.node_id}")
-                        logger.info(f"Raw metadata from DB: {doc.node_metadata}")
-                        metadata = json.loads(doc.node_metadata) if doc.node_metadata else {}
-                        logger.info(f"Parsed metadata: {metadata}")
-                        llama_doc = LlamaDocument(
-                            doc_id=doc.node_id,
-                            text=doc.node_text,
-                            metadata=metadata
-                        )
-                        nodes.append(llama_doc)
-                    logger.info(f"Loaded {len(nodes)} nodes from database")
-                    return nodes
-                except Exception as e:
-                    logger.warning(f"Could not load nodes from database: {str(e)}")
-                    return []  # Return empty list if table doesn't exist or other error
+                for start in range(0, len(node_ids), batch_size):
+                    rows = db.execute(
+                        select(self.model.node_id, self.model.node_text, self.model.node_metadata)
+                        .where(self.model.node_id.in_(node_ids[start:start + batch_size]))
+                    )
+                    for row in rows:
+                        nodes[row.node_id] = self._row_to_document(row._asdict())
+            return nodes
         except Exception as e:
-            logger.error(f"Error loading nodes: {str(e)}")
+            logger.error(f"Error fetching nodes by id: {str(e)}")
             raise
+    
+    def load_nodes(self, arxiv_id=None, since=None):
+        """Load nodes from database into storage context"""
+        try:
+            nodes = list(self.iter_nodes(arxiv_id=arxiv_id, since=since))
+            logger.info(f"Loaded {len(nodes)} nodes from database")
+            return nodes
+        except Exception as e:
+            logger.warning(f"Could not load nodes from database: {str(e)}")
+            return []  # Return empty list if table doesn't exist or other error
 
     def cleanup_nodes(self, doc_ids):
         """Remove nodes that no longer exist"""
         try:
             with SessionLocal() as db:
-                db.query(Node).filter(
-                    Node.node_id.notin_(doc_ids)
+                db.query(self.model).filter(
+                    self.model.node_id.notin_(doc_ids)
                 ).delete(synchronize_session=False)
                 db.commit()
                 logger.info("Cleaned up old nodes from database")
+            self.bm25_index.retain_nodes(doc_ids)
         except Exception as e:
             logger.error(f"Error cleaning up nodes: {str(e)}")
             raise 
 
+    def delete_nodes(self, node_ids):
+        """Delete the given nodes from database"""
+        if not node_ids:
+            return
+        try:
+            with SessionLocal() as db:
+                db.query(self.model).filter(
+                    self.model.node_id.in_(node_ids)
+                ).delete(synchronize_session=False)
+                db.commit()
+                logger.info(f"Deleted {len(node_ids)} nodes from database")
+            self.bm25_index.remove_nodes(node_ids)
+        except Exception as e:
+            logger.error(f"Error deleting nodes: {str(e)}")
+            raise
+
+    def count_nodes(self):
+        """Count nodes stored in database"""
+        try:
+            with SessionLocal() as db:
+                return db.query(self.model).count()
+        except Exception as e:
+            logger.warning(f"Could not count nodes in database: {str(e)}")
+            return 0
+
     def delete_all_nodes(self):
         """Delete all nodes from database"""
         try:
             with SessionLocal() as db:
-                db.query(Node).delete(synchronize_session=False)
+                db.query(self.model).delete(synchronize_session=False)
                 db.commit()
                 logger.info("Deleted all nodes from database")
+            self.bm25_index.clear()
         except Exception as e:
             logger.error(f"Error deleting all nodes: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def drop(self):
+        """Delete this generation's nodes table and BM25 index"""
+        try:
+            if self.generation:
+                self.model.__table__.drop(bind=engine, checkfirst=True)
+            else:
+                # The nodes table itself belongs to the schema
+                self.delete_all_nodes()
+            self.bm25_index.drop()
+            logger.info(f"Dropped nodes of index generation {self.generation}")
+        except Exception as e:
+            logger.error(f"Error dropping nodes of generation {self.generation}: {str(e)}")
+            raise
+
+
+class GenerationNodeStores:
+    """The NodeStore of each index generation, opened once per process"""
+
+    def __init__(self):
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def get(self, generation=0):
+        """NodeStore of a generation, creating its table on first use"""
+        with self._lock:
+            store = self._stores.get(generation)
+            if store is None:
+                store = self._stores[generation] = NodeStore(generation)
+            return store
+
+    def drop(self, generation):
+        """Delete a generation's nodes and BM25 index"""
+        with self._lock:
+            store = self._stores.pop(generation, None)
+        (store or NodeStore(generation)).drop()
\ No newline at end of file
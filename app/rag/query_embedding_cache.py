@@ -0,0 +1,163 @@
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from app.core.config import settings
+from app.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+class QueryEmbeddingCache:
+    """Query embeddings keyed by model name, embedding mode and normalized query text
+
+    The mode is "query" for the model's query path and "text" for queries
+    embedded through its text path, which some models embed differently.
+    Lookups go through a bounded in-process LRU, then Redis (one MGET per
+    batch) when a client is given. Redis hits are copied into the LRU, and
+    new embeddings are written to both tiers. Entries in Redis expire after
+    the TTL. Query vectors only depend on the model, so nothing here has to
+    be invalidated when the index changes.
+    """
+
+    def __init__(self, redis_client=None, max_entries=None, ttl=None):
+        self.redis_client = redis_client
+        self.max_entries = max_entries or settings.QUERY_EMBEDDING_CACHE_SIZE
+        self.ttl = ttl or settings.QUERY_EMBEDDING_CACHE_TTL
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _normalize(self, text):
+        """Collapse whitespace so formatting-only differences share an entry"""
+        return " ".join(text.split())
+
+    def _cache_key(self, model_name, mode, text):
+        text_hash = hashlib.sha256(self._normalize(text).encode('utf-8')).hexdigest()
+        return f"qembed:{model_name}:{mode}:{text_hash}"
+
+    def _cache_put(self, entries):
+        with self._cache_lock:
+            for cache_key, vector in entries.items():
+                self._cache[cache_key] = vector
+                self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def get_many(self, model_name, mode, texts):
+        """Return cached embeddings of the given texts, keyed by text"""
+        text_keys = {text: self._cache_key(model_name, mode, text) for text in texts}
+        keys = list(dict.fromkeys(text_keys.values()))
+        found = {}
+        with self._cache_lock:
+            for cache_key in keys:
+                vector = self._cache.get(cache_key)
+                if vector is not None:
+                    self._cache.move_to_end(cache_key)
+                    found[cache_key] = vector
+        missing = [cache_key for cache_key in keys if cache_key not in found]
+        record_cache("query_embedding_lru", hits=len(found), misses=len(missing))
+
+        if missing and self.redis_client is not None:
+            try:
+                from_redis = {
+                    cache_key: np.frombuffer(raw, dtype=np.float32)
+                    for cache_key, raw in zip(missing, self.redis_client.mget(missing))
+                    if raw is not None
+                }
+            except Exception as e:
+                # Redis is only a cache tier, the model can still embed
+                logger.warning(f"Could not read query embeddings from Redis: {str(e)}")
+                from_redis = {}
+            record_cache("query_embedding_redis", hits=len(from_redis), misses=len(missing) - len(from_redis))
+            self._cache_put(from_redis)
+            found.update(from_redis)
+
+        return {text: found[cache_key].tolist() for text, cache_key in text_keys.items() if cache_key in found}
+
+    def put_many(self, model_name, mode, texts, embeddings):
+        """Store embeddings for the given texts in both tiers"""
+        entries = {
+            self._cache_key(model_name, mode, text): np.asarray(embedding, dtype=np.float32)
+            for text, embedding in zip(texts, embeddings)
+        }
+        self._cache_put(entries)
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for cache_key, vector in entries.items():
+                    pipe.set(cache_key, vector.tobytes(), ex=self.ttl)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Could not write query embeddings to Redis: {str(e)}")
+
+
+class CachedQueryEmbedding(BaseEmbedding):
+    """Embedding model whose query embeddings go through a QueryEmbeddingCache
+
+    Text (node) embeddings are passed straight to the wrapped model. Without
+    a cache every call is passed through.
+    """
+
+    _embed_model: Any = PrivateAttr()
+    _cache: Any = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: QueryEmbeddingCache = None):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            callback_manager=embed_model.callback_manager
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedQueryEmbedding"
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries, calling the model once for all cache misses
+
+        Embedding models only batch their text path, and OpenAI embeds
+        queries and texts with the same model. Misses are embedded as one
+        text batch and cached in "text" mode, which the single query path
+        never reads. Lookups take "query" mode entries first.
+        """
+        if self._cache is None:
+            return self._embed_model.get_text_embedding_batch(queries)
+
+        cached = self._cache.get_many(self.model_name, "query", queries)
+        missing = list(dict.fromkeys(query for query in queries if query not in cached))
+        if missing:
+            cached.update(self._cache.get_many(self.model_name, "text", missing))
+            missing = [query for query in missing if query not in cached]
+        if missing:
+            embeddings = self._embed_model.get_text_embedding_batch(missing)
+            self._cache.put_many(self.model_name, "text", missing, embeddings)
+            cached.update(zip(missing, embeddings))
+        return [cached[query] for query in queries]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        if self._cache is None:
+            return self._embed_model.get_query_embedding(query)
+
+        embedding = self._cache.get_many(self.model_name, "query", [query]).get(query)
+        if embedding is None:
+            embedding = self._embed_model.get_query_embedding(query)
+            self._cache.put_many(self.model_name, "query", [query], [embedding])
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed_model.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await self._embed_model.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_model.get_text_embedding_batch(texts)
@@ -1,32 +1,97 @@
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llama_index.core import Settings
+from llama_index.core.schema import MetadataMode, QueryBundle
 from llama_index.core.postprocessor import SentenceTransformerRerank
 from llama_index.core.query_engine import RetrieverQueryEngine
 
+from app.core.config import settings
+from app.core.metrics import ERRORS, LLM_TOKENS, QUERY_STAGE_SECONDS, count_tokens, observe_stage, record_cache
+from app.rag.query_embedding_cache import CachedQueryEmbedding
+from app.rag.retrievers import BatchedAutoMergingRetriever, BM25Retriever, HybridRetriever, TimedRetriever
+from app.rag.rerank_batcher import BatchedSentenceTransformerRerank
+
 logger = logging.getLogger(__name__)
 
 class QueryProcessor:
-    def __init__(self, index):
+    def __init__(self, index, bm25_index=None, semantic_cache=None, similarity_top_k=None, rerank_top_n=None,
+                 query_embedding_cache=None):
         self.index = index
+        self.bm25_index = bm25_index
+        self.semantic_cache = semantic_cache
+        # Query embeddings, up front and in the dense retriever, go through the cache
+        self.embed_model = CachedQueryEmbedding(Settings.embed_model, query_embedding_cache)
+        # Candidates handed to the reranker (dense top_k, or fused top_k in
+        # hybrid mode) and nodes it keeps, settings unless given
+        self.similarity_top_k = similarity_top_k
+        self.rerank_top_n = rerank_top_n or settings.RERANK_TOP_N
+        self.retriever = self._build_retriever()
+        self.node_postprocessors = [self._build_reranker()]
         self.query_engine = self._build_query_engine()
+        self.streaming_query_engine = self._build_query_engine(streaming=True)
     
-    def _build_query_engine(self):
-        """Build the query engine with reranking but without auto-merging"""
-        try:
-            # Create base retriever with higher top_k
-            retriever = self.index.as_retriever(
-                similarity_top_k=12
+    def _build_retriever(self):
+        """Build the leaf retriever, merging leaves into their parents in hierarchical mode"""
+        retriever = self._build_leaf_retriever()
+        if settings.CHUNKING_MODE == "hierarchical":
+            return BatchedAutoMergingRetriever(
+                retriever,
+                self.index.storage_context,
+                simple_ratio_thresh=settings.AUTO_MERGE_RATIO
             )
-            
-            # Create reranker
-            rerank = SentenceTransformerRerank(
-                top_n=6, 
+        return retriever
+    
+    def _build_leaf_retriever(self):
+        """Build the dense retriever, fused with BM25 in hybrid mode"""
+        if settings.RETRIEVAL_MODE == "hybrid" and self.bm25_index is not None:
+            # Keyword hits cover exact ids and acronyms, so dense top_k can be smaller
+            return HybridRetriever(
+                TimedRetriever(
+                    self.index.as_retriever(similarity_top_k=settings.HYBRID_VECTOR_TOP_K, embed_model=self.embed_model),
+                    "vector_search"
+                ),
+                TimedRetriever(
+                    BM25Retriever(
+                        self.bm25_index,
+                        self.index.docstore,
+                        similarity_top_k=settings.HYBRID_BM25_TOP_K
+                    ),
+                    "bm25_search"
+                ),
+                similarity_top_k=self.similarity_top_k or settings.HYBRID_TOP_K,
+                rrf_k=settings.HYBRID_RRF_K
+            )
+        
+        # Create base retriever with higher top_k
+        return TimedRetriever(
+            self.index.as_retriever(
+                similarity_top_k=self.similarity_top_k or settings.SIMILARITY_TOP_K,
+                embed_model=self.embed_model
+            ),
+            "vector_search"
+        )
+    
+    def _build_reranker(self):
+        """Create reranker, micro-batched across concurrent queries if enabled"""
+        if settings.RERANK_MICRO_BATCHING:
+            return BatchedSentenceTransformerRerank(
+                top_n=self.rerank_top_n,
                 model="BAAI/bge-reranker-base"
             )
-            
-            # Create query engine without auto-merging
+        return SentenceTransformerRerank(
+            top_n=self.rerank_top_n, 
+            model="BAAI/bge-reranker-base"
+        )
+    
+    def _build_query_engine(self, streaming=False):
+        """Build the query engine with reranking, auto-merging happens in the retriever"""
+        try:
+            # Both engines share the same retriever and reranker instances
             query_engine = RetrieverQueryEngine.from_args(
-                retriever, 
-                node_postprocessors=[rerank]
+                self.retriever, 
+                node_postprocessors=self.node_postprocessors,
+                streaming=streaming
             )
             
             logger.info("Query engine built successfully")
@@ -36,56 +101,301 @@ class QueryProcessor:
             logger.error(f"Error building query engine: {str(e)}")
             raise
     
+    def _format_source_nodes(self, source_nodes):
+        """Convert retrieved nodes into the API source node dicts"""
+        return [
+            {
+                "text": node.node.get_text() if hasattr(node, 'node') and hasattr(node.node, 'get_text') else str(node),
+                "score": node.score if hasattr(node, 'score') else None,
+                "doc_id": node.node.metadata.get('arxiv_id') if hasattr(node, 'node') and hasattr(node.node, 'metadata') and isinstance(node.node.metadata, dict) else None,
+                "arxiv_url": node.node.metadata.get('arxiv_url') if hasattr(node, 'node') and hasattr(node.node, 'metadata') and isinstance(node.node.metadata, dict) else None,
+                "filename": node.node.metadata.get('filename') if hasattr(node, 'node') and hasattr(node.node, 'metadata') and isinstance(node.node.metadata, dict) else None,
+                "arxiv_id": node.node.metadata.get('arxiv_id') if hasattr(node, 'node') and hasattr(node.node, 'metadata') and isinstance(node.node.metadata, dict) else None
+            }
+            for node in source_nodes
+        ]
+    
+    def _embed_query(self, query_bundle):
+        """Embed the query once, up front
+        
+        The embedding stays on the query bundle, so the semantic cache and
+        the dense retriever share it and embedding is timed on its own.
+        """
+        with observe_stage("embed_query"):
+            query_bundle.embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+    
+    def _lookup_cache(self, query_bundle):
+        """Look the query up in the semantic cache
+        
+        Paraphrases of a recent question reuse its answer.
+        """
+        if self.semantic_cache is None:
+            return None
+        cached = self.semantic_cache.lookup(query_bundle.embedding)
+        record_cache("semantic", hits=int(cached is not None), misses=int(cached is None))
+        return cached
+    
+    def _retrieve_candidates(self, query_bundle):
+        """Retrieve the candidate nodes of a query, before reranking"""
+        with observe_stage("retrieve"):
+            return self.retriever.retrieve(query_bundle)
+    
+    def _count_context(self, nodes):
+        """Count the context tokens the LLM will be sent"""
+        LLM_TOKENS.labels("context").inc(sum(
+            count_tokens(node.node.get_content(metadata_mode=MetadataMode.LLM)) for node in nodes
+        ))
+    
+    def _retrieve(self, query_bundle):
+        """Retrieve and rerank the context nodes of a query, timing each stage"""
+        nodes = self._retrieve_candidates(query_bundle)
+        with observe_stage("rerank"):
+            for postprocessor in self.node_postprocessors:
+                nodes = postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+        self._count_context(nodes)
+        return nodes
+    
+    def _rerank_batch(self, query_bundles, node_lists):
+        """Rerank the candidates of many queries, sharing cross-encoder passes where possible"""
+        with observe_stage("batch_rerank"):
+            for postprocessor in self.node_postprocessors:
+                if hasattr(postprocessor, "postprocess_batch"):
+                    node_lists = postprocessor.postprocess_batch(node_lists, query_bundles)
+                else:
+                    node_lists = [
+                        postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+                        for nodes, query_bundle in zip(node_lists, query_bundles)
+                    ]
+        for nodes in node_lists:
+            self._count_context(nodes)
+        return node_lists
+    
+    def _answer(self, query_bundle, nodes):
+        """Generate the answer to a query from its reranked nodes"""
+        with observe_stage("synthesize"):
+            response = self.query_engine.synthesize(query_bundle, nodes)
+        LLM_TOKENS.labels("completion").inc(count_tokens(str(response)))
+        result = {
+            "answer": str(response),
+            "source_nodes": self._format_source_nodes(response.source_nodes)
+        }
+        self._store_cache(query_bundle, result)
+        return result
+    
+    def _embed_batch(self, query_bundles):
+        """Embed the queries of a batch, one by one if the batched call fails
+        
+        A query that cannot be embedded gets its exception in place of the
+        embedding.
+        """
+        query_texts = [query_bundle.query_str for query_bundle in query_bundles]
+        try:
+            return self.embed_model.get_query_embedding_batch(query_texts)
+        except Exception as e:
+            logger.warning(f"Batched query embedding failed, embedding queries one by one: {str(e)}")
+        embeddings = []
+        for query_text in query_texts:
+            try:
+                embeddings.append(self.embed_model.get_query_embedding(query_text))
+            except Exception as e:
+                embeddings.append(e)
+        return embeddings
+    
+    def _batch_error(self, query_bundle, error):
+        ERRORS.labels("batch_query").inc()
+        logger.error(f"Error processing batch query {query_bundle.query_str!r}: {str(error)}")
+        return {"error": f"Error processing query: {str(error)}"}
+    
+    def _store_cache(self, query_bundle, result):
+        """Remember a fresh result in the semantic cache"""
+        if self.semantic_cache is not None:
+            self.semantic_cache.store(query_bundle.embedding, result)
+    
     def process_query(self, query_text):
         """Process a query and return results"""
         try:
             logger.info(f"Processing query: {query_text}")
-            logger.info("Attempting to query the engine...")
-            response = self.query_engine.query(query_text)
+            
+            with observe_stage("query"):
+                query_bundle = QueryBundle(query_str=query_text)
+                self._embed_query(query_bundle)
+                cached = self._lookup_cache(query_bundle)
+                if cached is not None:
+                    return cached
+                
+                logger.info("Attempting to query the engine...")
+                nodes = self._retrieve(query_bundle)
+                # Same synthesis, token counting and caching as batch answers
+                result = self._answer(query_bundle, nodes)
             logger.info("Query completed successfully")
-
-            if hasattr(response, 'source_nodes'):
-                logger.info(f"Number of source nodes: {len(response.source_nodes)}")
-                for idx, node in enumerate(response.source_nodes):
-                    logger.info(f"Source node {idx + 1}:")
-                    # Handle different node types
-                    if hasattr(node, 'node'):
-                        text = node.node.get_text() if hasattr(node.node, 'text') else str(node.node)
-                        logger.info(f"  Text: {text[:200]}...")  # First 200 chars
-                    if hasattr(node, 'score'):
-                        logger.info(f"  Score: {node.score}")
-                    if hasattr(node, 'node') and hasattr(node.node, 'node_id'):
-                        logger.info(f"  Node ID: {node.node.node_id}")
-                    elif hasattr(node, 'node') and hasattr(node.node, 'doc_id'):
-                        logger.info(f"  Doc ID: {node.node.doc_id}")
-                    if hasattr(node, 'node') and hasattr(node.node, 'metadata'):
-                        logger.info(f"  Has metadata: True")
-                        logger.info(f"  Metadata keys: {list(node.node.metadata.keys())}")
-                        if 'arxiv_id' in node.node.metadata:
-                            logger.info(f"  arXiv ID: {node.node.metadata['arxiv_id']}")
-                        if 'arxiv_url' in node.node.metadata:
-                            logger.info(f"  arXiv URL: {node.node.metadata['arxiv_url']}")
-                    else:
-                        logger.info("  No metadata found")
-
-            return {
-                "answer": str(response),
-                "source_nodes": [
-                    {
-                        "text": node.node.get_text() if hasattr(node, 'node') and hasattr(node.node, 'get_text') else str(node),
-                        "score": node.score if hasattr(node, 'score') else None,
-                        "doc_id": node.node.metadata.get('arxiv_id') if hasattr(node, 'node') and hasattr(node.node, 'metadata') and isinstance(node.node.metadata, dict) else None,
-                        "arxiv_url": node.node.metadata.get('arxiv_url') if hasattr(node, 'node') and hasattr(node.node, 'metadata') and isinstance(node.node.metadata, dict) else None,
-                        "filename": node.node.metadata.get('filename') if hasattr(node, 'node') and hasattr(node.node, 'metadata') and isinstance(node.node.metadata, dict) else None,
-                        "arxiv_id": node.node.metadata.get('arxiv_id') if hasattr(node, 'node') and hasattr(node.node, 'metadata') and isinstance(node.node.metadata, dict) else None
-                    }
-                    for node in response.source_nodes
-                ]
-            }
+            
+            logger.info(f"Number of source nodes: {len(result['source_nodes'])}")
+            for idx, source_node in enumerate(result["source_nodes"]):
+                logger.info(
+                    f"Source node {idx + 1}: score {source_node['score']}, "
+                    f"arXiv ID {source_node['arxiv_id']}, text {source_node['text'][:200]}..."
+                )
+            
+            return result
             
         except Exception as e:
+            ERRORS.labels("query").inc()
             logger.error(f"Error processing query: {str(e)}")
             logger.error(f"Error type: {type(e).__name__}")
             import traceback
             logger.error(f"Full traceback: {traceback.format_exc()}")
-            raise 
\ No newline at end of file
+            raise
+    
+    def process_batch(self, query_texts, generation_concurrency=None):
+        """Answer many queries, yielding (positions, result) pairs as answers finish
+        
+        Duplicate queries are answered once, positions lists every index in
+        query_texts a result belongs to. The queries are embedded in one
+        batched call, retrieved concurrently and reranked together, then
+        answered with at most generation_concurrency (default
+        BATCH_QUERY_GENERATION_CONCURRENCY) generations in flight. A query
+        that fails yields {"error": ...} as its result. Closing the generator
+        cancels work not yet started and waits for running generations.
+        """
+        positions = {}
+        for position, query_text in enumerate(query_texts):
+            positions.setdefault(query_text.strip(), []).append(position)
+        query_bundles = [QueryBundle(query_str=query_text) for query_text in positions]
+        logger.info(f"Processing batch of {len(query_texts)} queries ({len(query_bundles)} distinct)")
+        
+        # One embedding request for every query the cache does not know
+        with observe_stage("batch_embed"):
+            embeddings = self._embed_batch(query_bundles)
+        pending = []
+        for query_bundle, embedding in zip(query_bundles, embeddings):
+            if isinstance(embedding, Exception):
+                yield positions[query_bundle.query_str], self._batch_error(query_bundle, embedding)
+                continue
+            query_bundle.embedding = embedding
+            try:
+                cached = self._lookup_cache(query_bundle)
+            except Exception as e:
+                yield positions[query_bundle.query_str], self._batch_error(query_bundle, e)
+                continue
+            if cached is not None:
+                yield positions[query_bundle.query_str], cached
+            else:
+                pending.append(query_bundle)
+        if not pending:
+            return
+        
+        # Vector searches are round trips to the backend, run them side by side
+        retrieved = []
+        with ThreadPoolExecutor(
+            max_workers=settings.BATCH_QUERY_RETRIEVE_CONCURRENCY,
+            thread_name_prefix="batch-retrieve"
+        ) as executor:
+            futures = [executor.submit(self._retrieve_candidates, query_bundle) for query_bundle in pending]
+            for query_bundle, future in zip(pending, futures):
+                try:
+                    retrieved.append((query_bundle, future.result()))
+                except Exception as e:
+                    yield positions[query_bundle.query_str], self._batch_error(query_bundle, e)
+        if not retrieved:
+            return
+        
+        query_bundles = [query_bundle for query_bundle, _ in retrieved]
+        try:
+            node_lists = self._rerank_batch(query_bundles, [nodes for _, nodes in retrieved])
+        except Exception as e:
+            # Rerank one query at a time, so a bad query only fails itself
+            logger.warning(f"Batched rerank failed, reranking queries one by one: {str(e)}")
+            node_lists = []
+            for query_bundle, nodes in retrieved:
+                try:
+                    node_lists.append(self._rerank_batch([query_bundle], [nodes])[0])
+                except Exception as e:
+                    node_lists.append(e)
+        answerable = []
+        for query_bundle, nodes in zip(query_bundles, node_lists):
+            if isinstance(nodes, Exception):
+                yield positions[query_bundle.query_str], self._batch_error(query_bundle, nodes)
+            else:
+                answerable.append((query_bundle, nodes))
+        
+        # Answers go out in the order they finish. Closing the generator
+        # cancels generations that have not started and waits for the rest,
+        # so the caller's query slots cover every generation
+        executor = ThreadPoolExecutor(
+            max_workers=generation_concurrency or settings.BATCH_QUERY_GENERATION_CONCURRENCY,
+            thread_name_prefix="batch-generate"
+        )
+        try:
+            futures = {
+                executor.submit(self._answer, query_bundle, nodes): query_bundle
+                for query_bundle, nodes in answerable
+            }
+            for future in as_completed(futures):
+                query_bundle = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = self._batch_error(query_bundle, e)
+                yield positions[query_bundle.query_str], result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def stream_query(self, query_text):
+        """Process a query, yielding (event, data) pairs as results become available
+        
+        Emits a "sources" event once retrieval and reranking are done, one
+        "token" event per generated chunk and a final "done" event with
+        per-stage timings in milliseconds.
+        """
+        try:
+            yield from self._stream_query(query_text)
+        except Exception:
+            ERRORS.labels("stream_query").inc()
+            raise
+    
+    def _stream_query(self, query_text):
+        started = time.perf_counter()
+        logger.info(f"Streaming query: {query_text}")
+        
+        query_bundle = QueryBundle(query_str=query_text)
+        self._embed_query(query_bundle)
+        cached = self._lookup_cache(query_bundle)
+        if cached is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            QUERY_STAGE_SECONDS.labels("query").observe(elapsed_ms / 1000)
+            yield "sources", {"source_nodes": cached["source_nodes"]}
+            yield "token", {"text": cached["answer"]}
+            yield "done", {"cached": True, "timings": {"retrieval_ms": elapsed_ms, "total_ms": elapsed_ms}}
+            return
+        
+        # Retrieval and reranking, the sources go out before generation starts
+        nodes = self._retrieve(query_bundle)
+        retrieval_ms = (time.perf_counter() - started) * 1000
+        source_nodes = self._format_source_nodes(nodes)
+        yield "sources", {"source_nodes": source_nodes}
+        
+        synthesis_started = time.perf_counter()
+        response = self.streaming_query_engine.synthesize(query_bundle, nodes)
+        first_token_ms = None
+        tokens = []
+        for token in response.response_gen:
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - started) * 1000
+            tokens.append(token)
+            yield "token", {"text": token}
+        
+        answer = "".join(tokens)
+        total_ms = (time.perf_counter() - started) * 1000
+        QUERY_STAGE_SECONDS.labels("synthesize").observe(time.perf_counter() - synthesis_started)
+        QUERY_STAGE_SECONDS.labels("query").observe(total_ms / 1000)
+        LLM_TOKENS.labels("completion").inc(count_tokens(answer))
+        self._store_cache(query_bundle, {"answer": answer, "source_nodes": source_nodes})
+        logger.info(f"Streamed query in {total_ms:.0f} ms (retrieval {retrieval_ms:.0f} ms)")
+        yield "done", {
+            "cached": False,
+            "timings": {
+                "retrieval_ms": retrieval_ms,
+                "first_token_ms": first_token_ms,
+                "total_ms": total_ms
+            }
+        }
@@ -1,12 +1,31 @@
 import redis
-import pickle
+import copy
+import json
+import zlib
 import logging
 import os
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
 from llama_index.core.schema import Node
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Bump when the per-node encoding changes, old entries are then ignored
+NODES_FORMAT_VERSION = 2
+
+def encode_node(node) -> bytes:
+    """Serialize a node as zlib-compressed JSON, without its embedding"""
+    data = doc_to_json(node)
+    # Vectors live in the vector store, the docstore copy never needs them
+    data["__data__"]["embedding"] = None
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+def decode_node(data: bytes):
+    """Inverse of encode_node"""
+    return json_to_doc(json.loads(zlib.decompress(data)))
+
 class RedisManager:
     # def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0):
     #     self.redis_client = redis.Redis(
@@ -20,55 +39,174 @@ class RedisManager:
     #     self.index_stats_key = "index_stats"
 
 
-    def __init__(self):
-        redis_url = os.getenv("REDIS_URL")
-        if not redis_url:
-            raise ValueError("REDIS_URL environment variable is not set")
+    def __init__(self, redis_client=None):
+        if redis_client is None:
+            redis_url = os.getenv("REDIS_URL")
+            if not redis_url:
+                raise ValueError("REDIS_URL environment variable is not set")
             
-        self.redis_client = redis.from_url(
-            redis_url,
-            decode_responses=False  # Keep binary data as is
-        )
+            redis_client = redis.from_url(
+                redis_url,
+                decode_responses=False  # Keep binary data as is
+            )
+        # A client can be passed in, e.g. a fakeredis one for offline benchmarks
+        self.redis_client = redis_client
         self.initialization_key = "initialization_complete"
-        self.nodes_key = "nodes"
+        # Pickled node list of earlier versions, only ever deleted now
+        self.legacy_nodes_key = "nodes"
+        # Hash of node id -> encoded node, plus a flag set once it holds the whole corpus
+        self.nodes_key = f"nodes:v{NODES_FORMAT_VERSION}:data"
+        self.nodes_complete_key = f"nodes:v{NODES_FORMAT_VERSION}:complete"
+        # Bumped whenever nodes change, so in-process copies elsewhere can tell they are stale
+        self.nodes_version_key = f"nodes:v{NODES_FORMAT_VERSION}:version"
         self.index_stats_key = "index_stats"
+        self.batch_size = settings.REDIS_NODE_BATCH_SIZE
+
+    def for_generation(self, generation: int) -> "RedisManager":
+        """Manager whose node cache belongs to an index generation
+
+        Generation 0 uses the original keys. The client, the initialization
+        flag and the index stats stay shared.
+        """
+        if not generation:
+            return self
+        manager = copy.copy(self)
+        manager.nodes_key = f"nodes:v{NODES_FORMAT_VERSION}:gen-{generation}:data"
+        manager.nodes_complete_key = f"nodes:v{NODES_FORMAT_VERSION}:gen-{generation}:complete"
+        manager.nodes_version_key = f"nodes:v{NODES_FORMAT_VERSION}:gen-{generation}:version"
+        return manager
 
     def is_initialized(self) -> bool:
         """Check if the system has been initialized"""
         return bool(self.redis_client.get(self.initialization_key))
 
-    def mark_initialized(self):
-        """Mark the system as initialized"""
-        self.redis_client.set(self.initialization_key, "true")
+    def mark_initialized(self, lock=None):
+        """Mark the system as initialized, only while still holding lock if given"""
+        if lock is not None:
+            if not lock.fenced_set(self.initialization_key, "true"):
+                logger.warning(f"Not marking system as initialized, lock {lock.name} was lost")
+                return False
+        else:
+            self.redis_client.set(self.initialization_key, "true")
         logger.info("Marked system as initialized in Redis")
+        return True
+
+    def _write_nodes(self, nodes: List[Node]):
+        """Write encoded nodes in pipelined batches"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for start in range(0, len(nodes), self.batch_size):
+            batch = nodes[start:start + self.batch_size]
+            pipe.hset(self.nodes_key, mapping={node.node_id: encode_node(node) for node in batch})
+            pipe.execute()
 
     def store_nodes(self, nodes: List[Node]):
-        """Store nodes in Redis"""
+        """Replace the cached nodes with the full corpus"""
         try:
-            serialized_nodes = pickle.dumps(nodes)
-            self.redis_client.set(self.nodes_key, serialized_nodes)
+            # Readers fall back to the database until the whole corpus is written
+            self.redis_client.delete(self.nodes_complete_key, self.nodes_key, self.legacy_nodes_key)
+            self._write_nodes(nodes)
+            self.mark_nodes_complete()
             logger.info(f"Stored {len(nodes)} nodes in Redis")
         except Exception as e:
             logger.error(f"Error storing nodes in Redis: {str(e)}")
             raise
 
+    def upsert_nodes(self, nodes: List[Node]):
+        """Add or overwrite individual cached nodes"""
+        try:
+            self._write_nodes(nodes)
+            logger.info(f"Upserted {len(nodes)} nodes in Redis")
+        except Exception as e:
+            logger.error(f"Error upserting nodes in Redis: {str(e)}")
+            raise
+
+    def delete_nodes(self, node_ids: List[str]):
+        """Remove individual cached nodes"""
+        try:
+            node_ids = list(node_ids)
+            pipe = self.redis_client.pipeline(transaction=False)
+            for start in range(0, len(node_ids), self.batch_size):
+                pipe.hdel(self.nodes_key, *node_ids[start:start + self.batch_size])
+                pipe.execute()
+            logger.info(f"Deleted {len(node_ids)} nodes from Redis")
+        except Exception as e:
+            logger.error(f"Error deleting nodes from Redis: {str(e)}")
+            raise
+
+    def mark_nodes_complete(self):
+        """Flag the cached nodes as the whole corpus, after a batched load"""
+        self.redis_client.set(self.nodes_complete_key, "true")
+
+    def has_complete_nodes(self) -> bool:
+        """Whether the cached nodes cover the whole corpus"""
+        return bool(self.redis_client.get(self.nodes_complete_key))
+
+    def bump_nodes_version(self) -> int:
+        """Mark in-process copies of nodes, in every worker, as stale"""
+        return self.redis_client.incr(self.nodes_version_key)
+
+    def get_nodes_version(self) -> int:
+        """Counter bumped by bump_nodes_version, 0 until nodes first change"""
+        return int(self.redis_client.get(self.nodes_version_key) or 0)
+
+    def count_nodes(self) -> int:
+        """Number of cached nodes"""
+        return self.redis_client.hlen(self.nodes_key)
+
+    def iter_node_pages(self, page_size: Optional[int] = None) -> Iterator[List[Node]]:
+        """Yield cached nodes page by page, without holding the corpus in memory"""
+        cursor = 0
+        page_size = page_size or self.batch_size
+        while True:
+            cursor, page = self.redis_client.hscan(self.nodes_key, cursor, count=page_size)
+            if page:
+                yield [decode_node(data) for data in page.values()]
+            if cursor == 0:
+                return
+
+    def get_nodes_by_ids(self, node_ids: List[str]) -> List[Optional[Node]]:
+        """Fetch cached nodes by id, None for ids that are not cached"""
+        try:
+            node_ids = list(node_ids)
+            nodes = []
+            for start in range(0, len(node_ids), self.batch_size):
+                values = self.redis_client.hmget(self.nodes_key, node_ids[start:start + self.batch_size])
+                nodes.extend(decode_node(data) if data is not None else None for data in values)
+            return nodes
+        except Exception as e:
+            logger.error(f"Error retrieving nodes from Redis: {str(e)}")
+            return [None] * len(node_ids)
+
     def get_nodes(self) -> Optional[List[Node]]:
-        """Retrieve nodes from Redis"""
+        """Retrieve all nodes from Redis, None unless the full corpus is cached"""
         try:
-            data = self.redis_client.get(self.nodes_key)
-            if data:
-                nodes = pickle.loads(data)
-                logger.info(f"Retrieved {len(nodes)} nodes from Redis")
-                return nodes
-            return None
+            if not self.has_complete_nodes():
+                return None
+            # HSCAN may repeat entries while the hash is rehashed
+            nodes = {}
+            for page in self.iter_node_pages():
+                nodes.update((node.node_id, node) for node in page)
+            logger.info(f"Retrieved {len(nodes)} nodes from Redis")
+            return list(nodes.values()) or None
         except Exception as e:
             logger.error(f"Error retrieving nodes from Redis: {str(e)}")
             return None
 
+    def clear_nodes(self):
+        """Drop cached nodes so the next load reads them from the database"""
+        try:
+            self.redis_client.delete(
+                self.nodes_complete_key, self.nodes_key, self.legacy_nodes_key, self.nodes_version_key
+            )
+            logger.info("Cleared cached nodes in Redis")
+        except Exception as e:
+            logger.error(f"Error clearing nodes in Redis: {str(e)}")
+            raise
+
     def store_index_stats(self, stats: Dict[str, Any]):
         """Store index statistics in Redis"""
         try:
-            self.redis_client.set(self.index_stats_key, pickle.dumps(stats))
+            self.redis_client.set(self.index_stats_key, json.dumps(stats))
             # logger.info("Stored index stats in Redis")
         except Exception as e:
             logger.error(f"Error storing index stats in Redis: {str(e)}")
@@ -79,7 +217,7 @@ class RedisManager:
         try:
             data = self.redis_client.get(self.index_stats_key)
             if data:
-                return pickle.loads(data)
+                return json.loads(data)
             return None
         except Exception as e:
             logger.error(f"Error retrieving index stats from Redis: {str(e)}")
@@ -88,7 +226,13 @@ class RedisManager:
     def clear_all(self):
         """Clear all Redis data"""
         try:
-            self.redis_client.delete(self.initialization_key, self.nodes_key, self.index_stats_key)
+            self.redis_client.delete(
+                self.initialization_key,
+                self.nodes_complete_key,
+                self.nodes_key,
+                self.legacy_nodes_key,
+                self.index_stats_key
+            )
             logger.info("Cleared all Redis data")
         except Exception as e:
             logger.error(f"Error clearing Redis data: {str(e)}")
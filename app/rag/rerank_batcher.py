@@ -0,0 +1,163 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, List, Optional
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Same limit SentenceTransformerRerank uses for the cross-encoder
+CROSS_ENCODER_MAX_LENGTH = 512
+
+class RerankBatcher:
+    """Process-wide cross-encoder that scores pairs from concurrent queries together
+
+    Callers submit their (query, text) pairs and block on a future. A single
+    worker thread takes the first pending request, keeps collecting more for
+    up to max_wait_ms or until max_batch_pairs pairs are queued, runs one
+    forward pass over all of them and hands each caller its own slice.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, model, device=None, max_batch_pairs=None, max_wait_ms=None):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            raise ImportError(
+                "Cannot import sentence-transformers or torch package,",
+                "please `pip install torch sentence-transformers`",
+            )
+        self.model_name = model
+        self.max_batch_pairs = max_batch_pairs or settings.RERANK_MAX_BATCH_PAIRS
+        wait_ms = settings.RERANK_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        self.max_wait = wait_ms / 1000.0
+        self._model = CrossEncoder(model, max_length=CROSS_ENCODER_MAX_LENGTH, device=device)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Started rerank batcher for {model} "
+            f"(max {self.max_batch_pairs} pairs, {wait_ms} ms window)"
+        )
+
+    @classmethod
+    def shared(cls, model, device=None):
+        """Return the batcher for a model, creating it on first use"""
+        with cls._instances_lock:
+            if model not in cls._instances:
+                cls._instances[model] = cls(model, device=device)
+            return cls._instances[model]
+
+    def submit(self, pairs):
+        """Queue (query, text) pairs for scoring, returning a future of their scores"""
+        future = Future()
+        if not pairs:
+            future.set_result([])
+            return future
+        self._queue.put((pairs, future))
+        return future
+
+    def score(self, pairs):
+        """Score (query, text) pairs, blocking until their batch has run"""
+        return self.submit(pairs).result()
+
+    def _collect(self):
+        """Gather requests for one batch, starting with the next pending one"""
+        batch = [self._queue.get()]
+        pair_count = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while pair_count < self.max_batch_pairs:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            pair_count += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            all_pairs = [pair for pairs, _ in batch for pair in pairs]
+            try:
+                scores = self._model.predict(
+                    all_pairs,
+                    batch_size=len(all_pairs),
+                    show_progress_bar=False
+                )
+            except Exception as e:
+                logger.error(f"Error scoring rerank batch: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            logger.debug(f"Reranked {len(all_pairs)} pairs from {len(batch)} requests")
+            offset = 0
+            for pairs, future in batch:
+                future.set_result([float(score) for score in scores[offset:offset + len(pairs)]])
+                offset += len(pairs)
+
+
+class BatchedSentenceTransformerRerank(BaseNodePostprocessor):
+    """Drop-in SentenceTransformerRerank that scores through the shared RerankBatcher"""
+
+    model: str = Field(description="Cross-encoder model name.")
+    top_n: int = Field(description="Number of nodes to return sorted by score.")
+    device: Optional[str] = Field(default=None, description="Device for the cross-encoder.")
+    _batcher: Any = PrivateAttr()
+
+    def __init__(self, top_n: int = 2, model: str = "BAAI/bge-reranker-base", device: Optional[str] = None):
+        super().__init__(top_n=top_n, model=model, device=device)
+        self._batcher = RerankBatcher.shared(model, device=device)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchedSentenceTransformerRerank"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if len(nodes) == 0:
+            return []
+
+        return self._apply_scores(nodes, self._batcher.score(self._pairs(nodes, query_bundle)))
+
+    def postprocess_batch(
+        self,
+        node_lists: List[List[NodeWithScore]],
+        query_bundles: List[QueryBundle],
+    ) -> List[List[NodeWithScore]]:
+        """Rerank the nodes of many queries, queueing all their pairs at once
+
+        The batcher then fills each forward pass with pairs of several queries.
+        """
+        futures = [
+            self._batcher.submit(self._pairs(nodes, query_bundle))
+            for nodes, query_bundle in zip(node_lists, query_bundles)
+        ]
+        return [self._apply_scores(nodes, future.result()) for nodes, future in zip(node_lists, futures)]
+
+    def _pairs(self, nodes, query_bundle):
+        return [
+            (query_bundle.query_str, node.node.get_content(metadata_mode=MetadataMode.EMBED))
+            for node in nodes
+        ]
+
+    def _apply_scores(self, nodes, scores):
+        for node, score in zip(nodes, scores):
+            node.score = score
+
+        return sorted(nodes, key=lambda x: -x.score if x.score else 0)[:self.top_n]
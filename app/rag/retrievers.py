@@ -0,0 +1,130 @@
+import logging
+from collections import defaultdict
+from llama_index.core.retrievers import AutoMergingRetriever, BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+from app.core.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+class TimedRetriever(BaseRetriever):
+    """Pass-through retriever recording its latency as a query stage"""
+
+    def __init__(self, retriever, stage):
+        super().__init__()
+        self.retriever = retriever
+        self.stage = stage
+
+    def _retrieve(self, query_bundle):
+        with observe_stage(self.stage):
+            return self.retriever.retrieve(query_bundle)
+
+
+class BM25Retriever(BaseRetriever):
+    """Keyword retriever over the persisted BM25 index"""
+
+    def __init__(self, bm25_index, docstore, similarity_top_k=8):
+        super().__init__()
+        self.bm25_index = bm25_index
+        self.docstore = docstore
+        self.similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle):
+        hits = self.bm25_index.search(query_bundle.query_str, top_k=self.similarity_top_k)
+        if not hits:
+            return []
+        # Missing ids are skipped, so match nodes back to hits by id
+        nodes = self.docstore.get_nodes([node_id for node_id, _ in hits], raise_error=False)
+        nodes_by_id = {node.node_id: node for node in nodes}
+        return [
+            NodeWithScore(node=nodes_by_id[node_id], score=score)
+            for node_id, score in hits
+            if node_id in nodes_by_id
+        ]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuse dense and BM25 results with reciprocal rank fusion"""
+
+    def __init__(self, vector_retriever, bm25_retriever, similarity_top_k=10, rrf_k=60):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.bm25_retriever = bm25_retriever
+        self.similarity_top_k = similarity_top_k
+        self.rrf_k = rrf_k
+
+    def _retrieve(self, query_bundle):
+        fused = {}
+        scores = {}
+        for retriever in (self.vector_retriever, self.bm25_retriever):
+            for rank, result in enumerate(retriever.retrieve(query_bundle)):
+                node_id = result.node.node_id
+                # Prefer the dense hit's node, it carries the vector store payload
+                fused.setdefault(node_id, result.node)
+                scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [
+            NodeWithScore(node=fused[node_id], score=score)
+            for node_id, score in ranked[:self.similarity_top_k]
+        ]
+
+
+class BatchedAutoMergingRetriever(AutoMergingRetriever):
+    """Auto-merging retriever that resolves parents and gaps with one docstore lookup per pass
+
+    The stock retriever calls docstore.get_document once per parent and per
+    filled-in gap, a database round trip each with the lazy docstore.
+    """
+
+    def _get_parents_and_merge(self, nodes):
+        children_by_parent = defaultdict(list)
+        for node in nodes:
+            if node.node.parent_node is not None:
+                children_by_parent[node.node.parent_node.node_id].append(node)
+        if not children_by_parent:
+            return nodes, False
+        
+        parents = self._storage_context.docstore.get_nodes(list(children_by_parent), raise_error=False)
+        merged_ids = set()
+        merged_parents = []
+        for parent in parents:
+            children = children_by_parent[parent.node_id]
+            ratio = len(children) / max(len(parent.child_nodes or []), 1)
+            if ratio > self._simple_ratio_thresh:
+                merged_ids.update(child.node.node_id for child in children)
+                # Parent score is the average of its retrieved children
+                score = sum(child.get_score() or 0.0 for child in children) / len(children)
+                merged_parents.append(NodeWithScore(node=parent, score=score))
+        if merged_parents:
+            logger.info(f"Merged {len(merged_ids)} chunks into {len(merged_parents)} parents")
+        
+        merged = [node for node in nodes if node.node.node_id not in merged_ids]
+        merged.extend(merged_parents)
+        return merged, bool(merged_ids)
+
+    def _fill_in_nodes(self, nodes):
+        # Neighbours with exactly one chunk between them get that chunk filled in
+        gaps = [
+            (index, node.node.next_node.node_id)
+            for index, node in enumerate(nodes[:-1])
+            if node.node.next_node is not None
+            and nodes[index + 1].node.prev_node is not None
+            # Compared by id, stored links do not carry the node hashes
+            and node.node.next_node.node_id == nodes[index + 1].node.prev_node.node_id
+        ]
+        if not gaps:
+            return nodes, False
+        
+        found = self._storage_context.docstore.get_nodes([node_id for _, node_id in gaps], raise_error=False)
+        found_by_id = {node.node_id: node for node in found}
+        fill_ins = {
+            index: found_by_id[node_id] for index, node_id in gaps if node_id in found_by_id
+        }
+        filled = []
+        for index, node in enumerate(nodes):
+            filled.append(node)
+            if index in fill_ins:
+                score = ((node.get_score() or 0.0) + (nodes[index + 1].get_score() or 0.0)) / 2
+                filled.append(NodeWithScore(node=fill_ins[index], score=score))
+        return filled, bool(fill_ins)
@@ -0,0 +1,137 @@
+import json
+import time
+import uuid
+import logging
+import threading
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """Answer cache in Redis keyed by query embedding similarity
+
+    Layout per index generation:
+      semcache:{gen}:lru        sorted set of entry ids scored by last access
+      semcache:{gen}:vectors    hash of entry id -> float32 query embedding
+      semcache:{gen}:entry:{id} JSON answer payload with an idle TTL
+    Bumping semcache:generation invalidates every entry at once. Vectors
+    are mirrored in-process so a lookup only transfers ids and new vectors.
+    """
+
+    def __init__(self, redis_client, threshold=None, ttl=None, max_entries=None):
+        self.redis_client = redis_client
+        self.threshold = threshold if threshold is not None else settings.SEMANTIC_CACHE_THRESHOLD
+        self.ttl = ttl or settings.SEMANTIC_CACHE_TTL
+        self.max_entries = max_entries or settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self.generation_key = "semcache:generation"
+        self._lock = threading.Lock()
+        self._local_generation = None
+        self._local_vectors = {}
+
+    def _keys(self, generation):
+        prefix = f"semcache:{generation}"
+        return f"{prefix}:lru", f"{prefix}:vectors", f"{prefix}:entry:"
+
+    def _generation(self):
+        return int(self.redis_client.get(self.generation_key) or 0)
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _sync_vectors(self, generation, lru_key, vectors_key):
+        """Mirror the vectors of live entries, fetching only unknown ids"""
+        entry_ids = [entry_id.decode() for entry_id in self.redis_client.zrange(lru_key, 0, -1)]
+        with self._lock:
+            if generation != self._local_generation:
+                self._local_generation = generation
+                self._local_vectors = {}
+            missing = [entry_id for entry_id in entry_ids if entry_id not in self._local_vectors]
+        if missing:
+            for entry_id, raw in zip(missing, self.redis_client.hmget(vectors_key, missing)):
+                if raw is not None:
+                    with self._lock:
+                        self._local_vectors[entry_id] = np.frombuffer(raw, dtype=np.float32)
+        with self._lock:
+            live = set(entry_ids)
+            self._local_vectors = {
+                entry_id: vector for entry_id, vector in self._local_vectors.items() if entry_id in live
+            }
+            return dict(self._local_vectors)
+
+    def lookup(self, embedding):
+        """Return the cached result of the most similar prior query, if close enough"""
+        try:
+            generation = self._generation()
+            lru_key, vectors_key, entry_prefix = self._keys(generation)
+            vectors = self._sync_vectors(generation, lru_key, vectors_key)
+            if not vectors:
+                return None
+
+            entry_ids = list(vectors)
+            similarities = np.stack([vectors[entry_id] for entry_id in entry_ids]) @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry_id = entry_ids[best]
+            entry_key = f"{entry_prefix}{entry_id}"
+            payload = self.redis_client.get(entry_key)
+            if payload is None:
+                # Entry idled out, drop its leftovers
+                self.redis_client.zrem(lru_key, entry_id)
+                self.redis_client.hdel(vectors_key, entry_id)
+                return None
+
+            pipe = self.redis_client.pipeline()
+            pipe.zadd(lru_key, {entry_id: time.time()})
+            pipe.expire(entry_key, self.ttl)
+            pipe.execute()
+            logger.info(f"Semantic cache hit (similarity {similarities[best]:.3f})")
+            return json.loads(payload)
+        except Exception as e:
+            # The cache is an optimization, never fail a query because of it
+            logger.warning(f"Semantic cache lookup failed: {str(e)}")
+            return None
+
+    def store(self, embedding, result):
+        """Cache a query result under its query embedding"""
+        try:
+            generation = self._generation()
+            lru_key, vectors_key, entry_prefix = self._keys(generation)
+            entry_id = uuid.uuid4().hex
+            now = time.time()
+
+            pipe = self.redis_client.pipeline()
+            pipe.set(f"{entry_prefix}{entry_id}", json.dumps(result), ex=self.ttl)
+            pipe.hset(vectors_key, entry_id, self._normalize(embedding).tobytes())
+            pipe.zadd(lru_key, {entry_id: now})
+            pipe.execute()
+
+            # Entries idle longer than the TTL have expired, then trim to size (LRU)
+            stale = self.redis_client.zrangebyscore(lru_key, "-inf", now - self.ttl)
+            overflow = self.redis_client.zcard(lru_key) - len(stale) - self.max_entries
+            if overflow > 0:
+                stale += self.redis_client.zrange(lru_key, len(stale), len(stale) + overflow - 1)
+            if stale:
+                pipe = self.redis_client.pipeline()
+                pipe.zrem(lru_key, *stale)
+                pipe.hdel(vectors_key, *stale)
+                pipe.delete(*[f"{entry_prefix}{entry_id.decode()}" for entry_id in stale])
+                pipe.execute()
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {str(e)}")
+
+    def invalidate(self):
+        """Drop every cached answer, called whenever the index changes"""
+        try:
+            old_generation = self._generation()
+            self.redis_client.incr(self.generation_key)
+            lru_key, vectors_key, _ = self._keys(old_generation)
+            # Payload keys of the old generation expire on their own
+            self.redis_client.delete(lru_key, vectors_key)
+            logger.info("Invalidated semantic cache")
+        except Exception as e:
+            logger.warning(f"Semantic cache invalidation failed: {str(e)}")
@@ -0,0 +1,199 @@
+import os
+import time
+import shutil
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# OpenAI text-embedding-ada-002 dimension
+EMBEDDING_DIMENSION = 1536
+
+def generation_namespace(generation):
+    """Pinecone namespace of an index generation, 0 is the default namespace"""
+    return f"gen-{generation}" if generation else ""
+
+class PineconeBackend:
+    """Vectors stored in a Pinecone serverless index, one namespace per generation"""
+
+    name = "pinecone"
+
+    def __init__(self, generation=0):
+        self.api_key = settings.PINECONE_API_KEY
+        self.index_name = settings.PINECONE_INDEX_NAME
+        self.environment = settings.PINECONE_ENVIRONMENT
+        self.generation = generation
+        self.namespace = generation_namespace(generation)
+        self.client = None
+        self.index = None
+        self.vector_store = None
+        self._connect()
+
+    def _connect(self):
+        """Initialize Pinecone client and index"""
+        from pinecone import Pinecone, ServerlessSpec, DeletionProtection
+        from llama_index.vector_stores.pinecone import PineconeVectorStore
+
+        try:
+            self.client = Pinecone(api_key=self.api_key)
+
+            # Check if index exists
+            existing_indexes = [
+                index_info["name"] for index_info in self.client.list_indexes()
+            ]
+
+            # Create index if it doesn't exist
+            if self.index_name not in existing_indexes:
+                logger.info(f"Creating new Pinecone index: {self.index_name}")
+                self.client.create_index(
+                    name=self.index_name,
+                    dimension=EMBEDDING_DIMENSION,
+                    metric="cosine",
+                    deletion_protection=DeletionProtection.DISABLED,
+                    spec=ServerlessSpec(
+                        cloud="aws",
+                        region=self.environment
+                    )
+                )
+                # Wait for index to be initialized
+                while not self.client.describe_index(self.index_name).status['ready']:
+                    time.sleep(1)
+
+            # Connect to index
+            self.index = self.client.Index(self.index_name)
+
+            # Initialize vector store with OpenAI embedding model
+            self.vector_store = PineconeVectorStore(
+                pinecone_index=self.index,
+                namespace=self.namespace or None,
+                text_key="text"
+            )
+
+            logger.info(f"Connected to Pinecone index: {self.index_name} (generation {self.generation})")
+
+        except Exception as e:
+            logger.error(f"Error initializing Pinecone: {str(e)}")
+            raise
+
+    def stats(self):
+        """Index statistics as a plain dict"""
+        index_stats = self.index.describe_index_stats()
+        return {
+            'backend': self.name,
+            'generation': self.generation,
+            'total_vector_count': self._namespace_count(index_stats),
+            'dimension': index_stats.dimension
+        }
+
+    def _namespace_count(self, index_stats):
+        namespace = index_stats.namespaces.get(self.namespace)
+        return namespace.vector_count if namespace is not None else 0
+
+    def vector_count(self):
+        """Number of vectors in this generation's namespace"""
+        return self._namespace_count(self.index.describe_index_stats())
+
+    def existing_ids(self, node_ids):
+        """Return the subset of node_ids that already have a vector"""
+        response = self.index.fetch(ids=list(node_ids), namespace=self.namespace)
+        return set(response.vectors.keys())
+
+    def ids_with_prefix(self, prefix):
+        """Return the ids of vectors whose id starts with prefix"""
+        # Listing by id prefix is supported on serverless indexes
+        ids = set()
+        for page in self.index.list(prefix=prefix, namespace=self.namespace):
+            ids.update(page)
+        return ids
+
+    def delete_ids(self, node_ids):
+        """Delete vectors by id"""
+        # Pinecone accepts at most 1000 ids per delete request
+        for start in range(0, len(node_ids), 1000):
+            self.index.delete(ids=node_ids[start:start + 1000], namespace=self.namespace)
+
+    def drop(self):
+        """Delete every vector of this generation"""
+        self.index.delete(delete_all=True, namespace=self.namespace)
+        logger.info(f"Dropped Pinecone namespace '{self.namespace}' (generation {self.generation})")
+
+    def reset(self):
+        """Delete every vector of this generation, other generations share the index"""
+        self.drop()
+
+
+class LocalBackend:
+    """Vectors stored in a memory-mapped matrix on local disk, one directory per generation"""
+
+    name = "local"
+
+    def __init__(self, generation=0):
+        from app.rag.local_vector_store import LocalVectorStore
+
+        self.generation = generation
+        # Generation 0 keeps the original location so existing stores stay valid
+        self.persist_dir = (
+            os.path.join(settings.LOCAL_VECTOR_DIR, f"gen-{generation}") if generation
+            else settings.LOCAL_VECTOR_DIR
+        )
+        self.vector_store = LocalVectorStore(
+            persist_dir=self.persist_dir,
+            ivf_lists=settings.LOCAL_VECTOR_IVF_LISTS,
+            ivf_probes=settings.LOCAL_VECTOR_IVF_PROBES
+        )
+        logger.info(f"Opened local vector store at {self.persist_dir}")
+
+    def stats(self):
+        """Index statistics as a plain dict"""
+        return {
+            'backend': self.name,
+            'generation': self.generation,
+            'total_vector_count': self.vector_store.count(),
+            'dimension': EMBEDDING_DIMENSION
+        }
+
+    def vector_count(self):
+        """Number of vectors in the store"""
+        return self.vector_store.count()
+
+    def existing_ids(self, node_ids):
+        """Return the subset of node_ids that already have a vector"""
+        return self.vector_store.existing_ids(node_ids)
+
+    def ids_with_prefix(self, prefix):
+        """Return the ids of vectors whose id starts with prefix"""
+        return self.vector_store.ids_with_prefix(prefix)
+
+    def delete_ids(self, node_ids):
+        """Delete vectors by id"""
+        self.vector_store.delete_nodes(node_ids)
+
+    def drop(self):
+        """Delete every vector of this generation"""
+        if self.generation:
+            self.vector_store.close()
+            shutil.rmtree(self.persist_dir, ignore_errors=True)
+        else:
+            self.vector_store.clear()
+        logger.info(f"Dropped local vector store at {self.persist_dir}")
+
+    def reset(self):
+        """Delete every vector in the store"""
+        self.vector_store.clear()
+        logger.info(f"Cleared local vector store at {self.persist_dir}")
+
+
+VECTOR_BACKENDS = {
+    PineconeBackend.name: PineconeBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+def create_vector_backend(name=None, generation=0):
+    """Instantiate the vector backend selected in settings for an index generation"""
+    name = (name or settings.VECTOR_BACKEND).lower()
+    if name not in VECTOR_BACKENDS:
+        raise ValueError(
+            f"Unknown VECTOR_BACKEND '{name}', expected one of {sorted(VECTOR_BACKENDS)}"
+        )
+    return VECTOR_BACKENDS[name](generation=generation)
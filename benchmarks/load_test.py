@@ -0,0 +1,293 @@
+"""HTTP load test of one app worker, reporting throughput, latency percentiles and saturation
+
+Replays the questions in generated_questions.text against
+POST /api/v1/queries/, mixed with PDF uploads to POST /api/v1/papers/upload/,
+at each level of a load ramp. Every level is either a number of concurrent
+users (closed loop, each user sends its next request when the previous one
+returns) or an arrival rate in requests per second (open loop, Poisson
+arrivals, so queueing delay shows up in the latencies).
+
+Without --url a stubbed server (stub_server.py) is started on a free port
+and stopped afterwards:
+
+    python benchmarks/load_test.py --concurrency 1,2,4,8,16,32 --duration 20
+    python benchmarks/load_test.py --rates 1,2,5,10 --llm-token-delay-ms 20
+    python benchmarks/load_test.py --url http://localhost:8000 --concurrency 4
+
+The saturation curve is the throughput and p99 latency per level. The last
+level whose p99 and error rate stay within --slo-p99-ms and
+--slo-error-rate is reported as the capacity of the worker.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stand_ins
+
+QUERY_PATH = "/api/v1/queries/"
+UPLOAD_PATH = "/api/v1/papers/upload/"
+
+
+def load_questions(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Workload:
+    """Next request to send: a question, or now and then a PDF upload"""
+
+    def __init__(self, questions, upload_ratio, seed=0):
+        self.questions = questions
+        self.upload_ratio = upload_ratio
+        self.rng = random.Random(seed)
+        self.uploads = 0
+        self._pdf = None
+
+    def _upload_body(self):
+        if self._pdf is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".load_test_upload.pdf")
+            stand_ins.write_pdf(path, [stand_ins.synthetic_text(random.Random(0), 350) for _ in range(2)])
+            with open(path, "rb") as f:
+                self._pdf = f.read()
+            os.remove(path)
+        return self._pdf
+
+    def next_request(self):
+        if self.upload_ratio and self.rng.random() < self.upload_ratio:
+            self.uploads += 1
+            filename = f"2499.{self.uploads:05d}v1.pdf"
+            return "upload", UPLOAD_PATH, {"files": {"file": (filename, self._upload_body(), "application/pdf")}}
+        return "query", QUERY_PATH, {"json": {"query": self.rng.choice(self.questions)}}
+
+
+async def _send(client, workload, records, timeout):
+    kind, path, kwargs = workload.next_request()
+    started = time.perf_counter()
+    try:
+        response = await client.post(path, timeout=timeout, **kwargs)
+        status = response.status_code
+    except httpx.TimeoutException:
+        status = "timeout"
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    records.append((kind, status, time.perf_counter() - started))
+
+
+async def run_closed_loop(client, workload, users, duration, timeout):
+    """users concurrent users, each sending back to back for duration seconds"""
+    records = []
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        while time.perf_counter() < deadline:
+            await _send(client, workload, records, timeout)
+
+    await asyncio.gather(*(user() for _ in range(users)))
+    return records
+
+
+async def run_open_loop(client, workload, rate, duration, timeout, seed=0):
+    """Poisson arrivals at rate requests per second for duration seconds"""
+    records = []
+    rng = random.Random(seed)
+    tasks = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        tasks.append(asyncio.ensure_future(_send(client, workload, records, timeout)))
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    return records
+
+
+def summarize(records, elapsed):
+    """Throughput, latency percentiles and errors of one load level"""
+    summary = {"requests": len(records), "elapsed_seconds": elapsed, "endpoints": {}}
+    ok = [record for record in records if record[1] == 200]
+    summary["throughput_rps"] = len(ok) / elapsed if elapsed > 0 else 0
+    summary["error_rate"] = 1 - len(ok) / len(records) if records else 0
+    summary["statuses"] = {str(status): count for status, count in Counter(record[1] for record in records).items()}
+    for kind in sorted({record[0] for record in records}):
+        latencies = sorted(record[2] * 1000 for record in records if record[0] == kind and record[1] == 200)
+        kind_records = [record for record in records if record[0] == kind]
+        summary["endpoints"][kind] = {
+            "requests": len(kind_records),
+            "errors": sum(1 for record in kind_records if record[1] != 200),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": latencies[-1] if latencies else None,
+        }
+    return summary
+
+
+async def run_ramp(args, base_url):
+    questions = load_questions(args.questions)
+    mode, levels = ("rate", args.rates) if args.rates else ("concurrency", args.concurrency)
+    levels = [float(level) if mode == "rate" else int(level) for level in levels.split(",")]
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        for index, level in enumerate(levels):
+            workload = Workload(questions, args.upload_ratio, seed=args.seed + index)
+            if args.warmup:
+                if mode == "rate":
+                    await run_open_loop(client, workload, level, args.warmup, args.timeout, seed=args.seed)
+                else:
+                    await run_closed_loop(client, workload, level, args.warmup, args.timeout)
+            started = time.perf_counter()
+            if mode == "rate":
+                records = await run_open_loop(client, workload, level, args.duration, args.timeout, seed=args.seed)
+            else:
+                records = await run_closed_loop(client, workload, level, args.duration, args.timeout)
+            summary = summarize(records, time.perf_counter() - started)
+            summary[mode] = level
+            results.append(summary)
+            query = summary["endpoints"].get("query", {})
+            print(
+                f"{mode} {level}: {summary['throughput_rps']:.1f} req/s, "
+                f"query p50/p95/p99 {_ms(query.get('p50_ms'))}/{_ms(query.get('p95_ms'))}/{_ms(query.get('p99_ms'))} ms, "
+                f"errors {summary['error_rate']:.1%}",
+                file=sys.stderr
+            )
+    return mode, results
+
+
+def _ms(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def capacity(mode, results, slo_p99_ms, slo_error_rate):
+    """Highest load level that met the latency and error SLOs"""
+    within = None
+    for summary in results:
+        p99 = summary["endpoints"].get("query", {}).get("p99_ms")
+        if p99 is None or p99 > slo_p99_ms or summary["error_rate"] > slo_error_rate:
+            break
+        within = summary
+    if within is None:
+        return None
+    return {mode: within[mode], "throughput_rps": within["throughput_rps"]}
+
+
+def print_report(mode, results, slo):
+    print(f"{mode:>12}{'req/s':>9}{'errors':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'upload p99':>12}")
+    for summary in results:
+        query = summary["endpoints"].get("query", {})
+        upload = summary["endpoints"].get("upload", {})
+        print(
+            f"{summary[mode]:>12}{summary['throughput_rps']:>9.1f}{summary['error_rate']:>9.1%}"
+            f"{_ms(query.get('p50_ms')):>9}{_ms(query.get('p95_ms')):>9}{_ms(query.get('p99_ms')):>9}"
+            f"{_ms(upload.get('p99_ms')):>12}"
+        )
+    if slo is None:
+        print("No load level met the SLO")
+    else:
+        print(f"Capacity within SLO: {mode} {slo[mode]} at {slo['throughput_rps']:.1f} req/s")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(args):
+    """Start stub_server.py and wait until /ready answers 200"""
+    port = _free_port()
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_server.py"),
+        "--port", str(port),
+        "--papers", str(args.papers),
+        "--embed-delay-ms", str(args.embed_delay_ms),
+        "--llm-token-delay-ms", str(args.llm_token_delay_ms),
+        "--max-tokens", str(args.max_tokens),
+    ]
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    server = subprocess.Popen(command, stdout=log, stderr=log)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("Stub server exited during startup, see --server-log")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return server, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"Stub server not ready after {args.startup_timeout}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="app to load, a stubbed one is started when omitted")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="closed-loop levels: concurrent users")
+    parser.add_argument("--rates", help="open-loop levels in requests per second, instead of --concurrency")
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured per level")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of unmeasured load before each level")
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--upload-ratio", type=float, default=0.0, help="share of requests that upload a PDF")
+    parser.add_argument("--questions", default=os.path.join(stand_ins.REPO_ROOT, "generated_questions.text"))
+    parser.add_argument("--slo-p99-ms", type=float, default=2000, help="p99 query latency objective")
+    parser.add_argument("--slo-error-rate", type=float, default=0.01, help="error rate objective")
+    parser.add_argument("--output", default="load_test_results.json", help="where to write the JSON report")
+    parser.add_argument("--seed", type=int, default=0)
+    # Stub server options
+    parser.add_argument("--papers", type=int, default=20)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--embed-delay-ms", type=float, default=0)
+    parser.add_argument("--llm-token-delay-ms", type=float, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--server-log", help="file receiving the stub server's output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, base_url = start_stub_server(args)
+    try:
+        mode, results = asyncio.run(run_ramp(args, base_url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    slo = capacity(mode, results, args.slo_p99_ms, args.slo_error_rate)
+    report = {
+        "url": args.url or "stub",
+        "mode": mode,
+        "slo": {"p99_ms": args.slo_p99_ms, "error_rate": args.slo_error_rate, "capacity": slo},
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "server_log")},
+        "levels": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(mode, results, slo)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""Offline benchmark of the ingestion and query pipeline, stage by stage
+
+Runs every corpus size in its own process against the stand-ins in
+stand_ins.py, writes the timings as JSON and optionally compares them with
+a baseline file from an earlier run:
+
+    python benchmarks/pipeline_bench.py --sizes 1000,10000,100000 \
+        --output bench.json --baseline baseline.json
+
+Stages are compared by seconds per item, so runs on different sizes of the
+PDF sample stay comparable. The exit code is 1 when a stage got slower than
+the baseline by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import platform
+import subprocess
+import statistics
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stand_ins
+
+
+def _summary(items, seconds, samples=None):
+    result = {
+        "items": items,
+        "seconds": seconds,
+        "items_per_second": items / seconds if seconds > 0 else None,
+    }
+    if samples:
+        samples_ms = sorted(sample * 1000 for sample in samples)
+        result.update({
+            "p50_ms": _percentile(samples_ms, 50),
+            "p95_ms": _percentile(samples_ms, 95),
+            "mean_ms": statistics.fmean(samples_ms),
+        })
+    return result
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    value = func(*args, **kwargs)
+    return value, time.perf_counter() - started
+
+
+def run_size(args):
+    """Benchmark one corpus size, in a process of its own"""
+    workdir = stand_ins.configure_environment(args.workdir)
+
+    from llama_index.core import Document, SimpleDirectoryReader
+    from llama_index.core.schema import QueryBundle
+    from app.db.database import Base, engine
+    from app.rag.document_processor import build_splitter, clean_text, split_document
+    from app.rag.node_store import NodeStore
+    from app.rag.redis_manager import RedisManager, decode_node, encode_node
+
+    Base.metadata.create_all(bind=engine)
+    size = args.size
+    stages = {}
+    nodes = stand_ins.synthetic_nodes(size, words=args.chunk_words, seed=args.seed)
+
+    # PDF parse, clean and split run on a page sample: they scale per page
+    pages = [node.text for node in nodes[:min(size, args.max_pdf_pages)]]
+    pdf_path = os.path.join(workdir, "2401.99999v1.pdf")
+    stand_ins.write_pdf(pdf_path, pages)
+    documents, seconds = _timed(SimpleDirectoryReader(input_files=[pdf_path]).load_data)
+    stages["pdf_parse"] = _summary(len(documents), seconds)
+
+    texts = [node.text for node in nodes[:min(size, args.max_split_pages)]]
+    _, seconds = _timed(lambda: [clean_text(text) for text in texts])
+    stages["clean"] = _summary(len(texts), seconds)
+
+    splitter = build_splitter({
+        "splitter": "SentenceSplitter",
+        "chunk_size": 512,
+        "chunk_overlap": 10,
+    })
+    split_docs = [
+        Document(text=text, metadata={"file_path": pdf_path}) for text in texts
+    ]
+    split_nodes, seconds = _timed(
+        lambda: [node for index, doc in enumerate(split_docs) for node in split_document(doc, splitter, index)]
+    )
+    stages["split"] = _summary(len(split_docs), seconds)
+    stages["split"]["chunks"] = len(split_nodes)
+    del split_docs, split_nodes
+
+    # Node table: bulk write, full streaming read and batched lookups by id
+    node_store = NodeStore()
+    _, seconds = _timed(node_store.store_nodes, nodes)
+    stages["node_store_write"] = _summary(size, seconds)
+
+    read, seconds = _timed(lambda: sum(1 for _ in node_store.iter_nodes()))
+    stages["node_store_read"] = _summary(read, seconds)
+
+    rng = random.Random(args.seed)
+    sample_ids = [node.node_id for node in rng.sample(nodes, min(size, args.lookup_sample))]
+    found, seconds = _timed(node_store.get_nodes_by_ids, sample_ids)
+    stages["node_store_lookup"] = _summary(len(found), seconds)
+
+    # Redis node cache: encoding alone, then pipelined writes and reads
+    encoded, seconds = _timed(lambda: [encode_node(node) for node in nodes])
+    stages["redis_serialize"] = _summary(size, seconds)
+    stages["redis_serialize"]["bytes"] = sum(len(data) for data in encoded)
+    _, seconds = _timed(lambda: [decode_node(data) for data in encoded])
+    stages["redis_deserialize"] = _summary(size, seconds)
+    del encoded
+
+    redis_manager = RedisManager(redis_client=stand_ins.make_redis_client())
+    _, seconds = _timed(redis_manager.store_nodes, nodes)
+    stages["redis_write"] = _summary(size, seconds)
+    read, seconds = _timed(lambda: sum(len(page) for page in redis_manager.iter_node_pages()))
+    stages["redis_read"] = _summary(read, seconds)
+    found, seconds = _timed(redis_manager.get_nodes_by_ids, sample_ids)
+    stages["redis_lookup"] = _summary(len(found), seconds)
+
+    # Vectors: embed with the stand-in model and write to the local store
+    index_manager = stand_ins.make_index_manager(
+        redis_manager=redis_manager,
+        embed_dim=args.embed_dim,
+        max_tokens=args.max_tokens
+    )
+    written, seconds = _timed(index_manager.upsert_nodes, nodes, only_missing=False)
+    stages["vector_upsert"] = _summary(written, seconds)
+    redis_manager.mark_initialized()
+
+    # Queries: each stage of QueryProcessor timed on its own
+    query_processor = index_manager.get_query_processor()
+    queries = stand_ins.synthetic_queries(nodes, args.queries, seed=args.seed)
+    samples = {"embed_query": [], "retrieve": [], "rerank": [], "synthesize": []}
+    for query in queries:
+        query_bundle = QueryBundle(query_str=query)
+        _, seconds = _timed(query_processor._embed_query, query_bundle)
+        samples["embed_query"].append(seconds)
+        retrieved, seconds = _timed(query_processor.retriever.retrieve, query_bundle)
+        samples["retrieve"].append(seconds)
+        started = time.perf_counter()
+        reranked = retrieved
+        for postprocessor in query_processor.node_postprocessors:
+            reranked = postprocessor.postprocess_nodes(reranked, query_bundle=query_bundle)
+        samples["rerank"].append(time.perf_counter() - started)
+        _, seconds = _timed(query_processor.query_engine.synthesize, query_bundle, reranked)
+        samples["synthesize"].append(seconds)
+    for stage, stage_samples in samples.items():
+        stages[stage] = _summary(len(stage_samples), sum(stage_samples), stage_samples)
+
+    return stages
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=stand_ins.REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Stages whose seconds per item grew by more than tolerance against the baseline"""
+    regressions = []
+    for size, stages in results["sizes"].items():
+        for stage, current in stages.items():
+            previous = baseline.get("sizes", {}).get(size, {}).get(stage)
+            if not previous or not previous.get("items") or not current.get("items"):
+                continue
+            current_cost = current["seconds"] / current["items"]
+            previous_cost = previous["seconds"] / previous["items"]
+            if previous_cost > 0 and current_cost / previous_cost > 1 + tolerance:
+                regressions.append({
+                    "size": size,
+                    "stage": stage,
+                    "baseline_items_per_second": previous["items_per_second"],
+                    "items_per_second": current["items_per_second"],
+                    "slowdown": current_cost / previous_cost,
+                })
+    return regressions
+
+
+def _print_table(results):
+    print(f"{'size':>8}  {'stage':<20}{'items':>9}{'seconds':>11}{'items/s':>13}{'p50 ms':>10}{'p95 ms':>10}")
+    for size, stages in results["sizes"].items():
+        for stage, summary in stages.items():
+            latencies = "".join(
+                f"{summary[key]:>10.2f}" if key in summary else f"{'-':>10}" for key in ("p50_ms", "p95_ms")
+            )
+            print(
+                f"{size:>8}  {stage:<20}{summary['items']:>9}{summary['seconds']:>11.3f}"
+                f"{summary['items_per_second'] or 0:>13.1f}{latencies}"
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated corpus sizes in chunks")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown per item before a stage counts as regressed")
+    parser.add_argument("--queries", type=int, default=50, help="queries timed per corpus size")
+    parser.add_argument("--chunk-words", type=int, default=350, help="words per synthetic chunk")
+    parser.add_argument("--embed-dim", type=int, default=384, help="dimension of the stand-in embeddings")
+    parser.add_argument("--max-tokens", type=int, default=64, help="tokens the stand-in LLM generates")
+    parser.add_argument("--max-pdf-pages", type=int, default=200, help="pages in the PDF parse sample")
+    parser.add_argument("--max-split-pages", type=int, default=2000, help="pages in the clean/split sample")
+    parser.add_argument("--lookup-sample", type=int, default=1000, help="ids fetched in the lookup stages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.size:
+        # Child process: benchmark one size and hand the stages back as JSON
+        with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+            args.workdir = workdir
+            print(json.dumps(run_size(args)))
+        return 0
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("size", "workdir", "baseline", "output")},
+        "sizes": {},
+    }
+    child_args = list(argv if argv is not None else sys.argv[1:])
+    for size in [int(size) for size in args.sizes.split(",") if size]:
+        print(f"Benchmarking {size} chunks...", file=sys.stderr)
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *child_args, "--size", str(size)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            sys.stderr.write(completed.stderr)
+            raise RuntimeError(f"Benchmark for {size} chunks failed")
+        results["sizes"][str(size)] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    _print_table(results)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        results["regressions"] = regressions
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['size']} {regression['stage']}: "
+                f"{regression['slowdown']:.2f}x slower per item than the baseline"
+            )
+        if regressions:
+            return 1
+        print(f"No stage slower than the baseline by more than {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
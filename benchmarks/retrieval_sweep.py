@@ -0,0 +1,320 @@
+"""Sweep the retrieval knobs over labeled questions and report quality against cost
+
+Each question is labeled with the arXiv ids of the papers that answer it.
+For every combination of chunk size, chunk overlap, retrieval depth
+(SIMILARITY_TOP_K, or HYBRID_TOP_K in hybrid mode) and rerank depth
+(RERANK_TOP_N) the report gives:
+
+    recall@k      share of relevant papers among the retrieved candidates
+    recall@n      share of relevant papers in the reranked context
+    MRR           reciprocal rank of the first relevant paper after reranking
+    tokens        context tokens sent to the LLM per question
+    latency       p50/p95 of embed_query, retrieve, rerank (and synthesize)
+
+Configurations no other one beats on recall@n, MRR, tokens and p50 latency
+at once form the Pareto front, marked with * in the table. Set the chosen
+values with SIMILARITY_TOP_K, RERANK_TOP_N, CHUNK_SIZE and CHUNK_OVERLAP.
+
+Without --labels, synthetic papers and questions are generated and the
+stand-ins of stand_ins.py are used, so the run is offline:
+
+    python benchmarks/retrieval_sweep.py --top-k 4,8,12,20 --top-n 2,4,6 --chunk-sizes 256,512,1024
+
+With your own papers and labels (JSON lines {"question": ..., "arxiv_ids":
+[...]}) and the configured OpenAI embeddings and cross-encoder:
+
+    python benchmarks/retrieval_sweep.py --papers-dir uploads --labels labels.jsonl --models configured
+
+Each chunking configuration is ingested in its own process.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stand_ins
+from pipeline_bench import _git_commit, _percentile
+
+OBJECTIVES = (("recall_at_n", 1), ("mrr", 1), ("context_tokens", -1), ("query_p50_ms", -1))
+
+
+def load_labels(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _ints(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def _latency(samples):
+    samples_ms = sorted(sample * 1000 for sample in samples)
+    return {
+        "p50_ms": _percentile(samples_ms, 50),
+        "p95_ms": _percentile(samples_ms, 95),
+        "mean_ms": statistics.fmean(samples_ms) if samples_ms else None,
+    }
+
+
+def ranked_papers(nodes):
+    """arXiv ids of the nodes in rank order, each kept at its first occurrence"""
+    papers = []
+    for node in nodes:
+        arxiv_id = node.node.metadata.get("arxiv_id")
+        if arxiv_id and arxiv_id not in papers:
+            papers.append(arxiv_id)
+    return papers
+
+
+def recall(papers, relevant):
+    return len(set(papers) & relevant) / len(relevant) if relevant else 0.0
+
+
+def reciprocal_rank(papers, relevant):
+    for rank, arxiv_id in enumerate(papers, start=1):
+        if arxiv_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def build_index(args):
+    """Ingest the papers with this process's chunking settings, return the index manager"""
+    from app.db.database import Base, engine
+    from app.rag.document_processor import DocumentProcessor
+    from app.rag.redis_manager import RedisManager
+
+    Base.metadata.create_all(bind=engine)
+    redis_manager = RedisManager(redis_client=stand_ins.make_redis_client())
+    if args.models == "stand-in":
+        index_manager = stand_ins.make_index_manager(
+            redis_manager=redis_manager,
+            max_tokens=args.max_tokens,
+            embed_model=stand_ins.make_hashing_embed_model(args.embed_dim)
+        )
+    else:
+        from app.rag.index_manager import IndexManager
+        index_manager = IndexManager(redis_manager=redis_manager)
+
+    nodes = DocumentProcessor().sync_directory(full=True).nodes
+    index_manager.upsert_nodes(nodes, only_missing=False)
+    redis_manager.mark_initialized()
+    return index_manager, len(nodes)
+
+
+def run_chunking(args):
+    """Evaluate every top_k and top_n for one chunk size and overlap, in a process of its own"""
+    stand_ins.configure_environment(
+        args.workdir,
+        cross_encoder=args.models == "stand-in",
+        UPLOAD_DIR=args.papers_dir,
+        CHUNK_SIZE=args.chunk_size,
+        CHUNK_OVERLAP=args.chunk_overlap,
+        RETRIEVAL_MODE=args.retrieval_mode,
+    )
+
+    from llama_index.core import Settings
+    from llama_index.core.schema import MetadataMode, QueryBundle
+    from app.core.metrics import count_tokens
+    from app.rag.query_engine import QueryProcessor
+
+    index_manager, node_count = build_index(args)
+    index = index_manager.get_index()
+    bm25_index = index_manager._ensure_bm25_index() if args.retrieval_mode == "hybrid" else None
+    labels = load_labels(args.labels)
+    top_ns = _ints(args.top_n)
+
+    # The query embedding does not depend on the knobs, embed each question once
+    bundles = []
+    embed_samples = []
+    for label in labels:
+        bundle = QueryBundle(query_str=label["question"])
+        started = time.perf_counter()
+        bundle.embedding = Settings.embed_model.get_query_embedding(bundle.query_str)
+        embed_samples.append(time.perf_counter() - started)
+        bundles.append(bundle)
+
+    configs = []
+    for top_k in _ints(args.top_k):
+        # The reranker sorts every candidate, so its top n for a smaller n is
+        # a prefix of the largest: rerank once and evaluate each n on prefixes
+        query_processor = QueryProcessor(
+            index,
+            bm25_index=bm25_index,
+            similarity_top_k=top_k,
+            rerank_top_n=max(top_ns)
+        )
+        per_query = []
+        for label, bundle, embed_seconds in zip(labels, bundles, embed_samples):
+            started = time.perf_counter()
+            candidates = query_processor.retriever.retrieve(bundle)
+            retrieve_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            reranked = candidates
+            for postprocessor in query_processor.node_postprocessors:
+                reranked = postprocessor.postprocess_nodes(reranked, query_bundle=bundle)
+            rerank_seconds = time.perf_counter() - started
+            per_query.append((set(label["arxiv_ids"]), bundle, embed_seconds, retrieve_seconds, rerank_seconds, candidates, reranked))
+
+        for top_n in top_ns:
+            recalls_k, recalls_n, reciprocal_ranks, tokens, totals = [], [], [], [], []
+            stage_samples = {"embed_query": [], "retrieve": [], "rerank": [], "synthesize": []}
+            for relevant, bundle, embed_seconds, retrieve_seconds, rerank_seconds, candidates, reranked in per_query:
+                context = reranked[:top_n]
+                papers = ranked_papers(context)
+                recalls_k.append(recall(ranked_papers(candidates), relevant))
+                recalls_n.append(recall(papers, relevant))
+                reciprocal_ranks.append(reciprocal_rank(papers, relevant))
+                tokens.append(sum(count_tokens(node.node.get_content(metadata_mode=MetadataMode.LLM)) for node in context))
+                stage_samples["embed_query"].append(embed_seconds)
+                stage_samples["retrieve"].append(retrieve_seconds)
+                stage_samples["rerank"].append(rerank_seconds)
+                total = embed_seconds + retrieve_seconds + rerank_seconds
+                if args.synthesize:
+                    started = time.perf_counter()
+                    query_processor.query_engine.synthesize(bundle, context)
+                    synthesize_seconds = time.perf_counter() - started
+                    stage_samples["synthesize"].append(synthesize_seconds)
+                    total += synthesize_seconds
+                totals.append(total)
+
+            configs.append({
+                "chunk_size": args.chunk_size,
+                "chunk_overlap": args.chunk_overlap,
+                "top_k": top_k,
+                "top_n": top_n,
+                "nodes": node_count,
+                "questions": len(per_query),
+                "recall_at_k": statistics.fmean(recalls_k),
+                "recall_at_n": statistics.fmean(recalls_n),
+                "mrr": statistics.fmean(reciprocal_ranks),
+                "context_tokens": statistics.fmean(tokens),
+                "query_p50_ms": _latency(totals)["p50_ms"],
+                "stages": {stage: _latency(samples) for stage, samples in stage_samples.items() if samples},
+            })
+    return configs
+
+
+def pareto_front(configs):
+    """Mark the configurations no other one matches or beats on every objective"""
+    def dominates(a, b):
+        better_or_equal = all(a[key] * sign >= b[key] * sign for key, sign in OBJECTIVES)
+        return better_or_equal and any(a[key] * sign > b[key] * sign for key, sign in OBJECTIVES)
+
+    for config in configs:
+        config["pareto"] = not any(dominates(other, config) for other in configs if other is not config)
+    return [config for config in configs if config["pareto"]]
+
+
+def _print_table(configs):
+    print(
+        f"  {'chunk':>6}{'overlap':>8}{'top_k':>6}{'top_n':>6}{'R@k':>7}{'R@n':>7}{'MRR':>7}"
+        f"{'tokens':>9}{'embed':>8}{'retr.':>8}{'rerank':>8}{'synth.':>8}{'p50 ms':>9}"
+    )
+    ordered = sorted(configs, key=lambda config: (-config["recall_at_n"], -config["mrr"], config["context_tokens"]))
+    for config in ordered:
+        stages = "".join(
+            f"{config['stages'][stage]['p50_ms']:>8.1f}" if stage in config["stages"] else f"{'-':>8}"
+            for stage in ("embed_query", "retrieve", "rerank", "synthesize")
+        )
+        print(
+            f"{'*' if config['pareto'] else ' '} {config['chunk_size']:>6}{config['chunk_overlap']:>8}"
+            f"{config['top_k']:>6}{config['top_n']:>6}{config['recall_at_k']:>7.3f}{config['recall_at_n']:>7.3f}"
+            f"{config['mrr']:>7.3f}{config['context_tokens']:>9.0f}{stages}{config['query_p50_ms']:>9.1f}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top-k", default="4,8,12,20", help="candidates retrieved for reranking")
+    parser.add_argument("--top-n", default="2,4,6", help="nodes kept after reranking")
+    parser.add_argument("--chunk-sizes", default="256,512,1024", help="chunk sizes in tokens")
+    parser.add_argument("--chunk-overlaps", default="10", help="chunk overlaps in tokens")
+    parser.add_argument("--retrieval-mode", choices=("vector", "hybrid"), default="vector")
+    parser.add_argument("--labels", help="JSON lines of questions and the arxiv_ids answering them")
+    parser.add_argument("--papers-dir", help="PDFs the labels refer to, required with --labels")
+    parser.add_argument("--models", choices=("stand-in", "configured"), default="stand-in",
+                        help="stand-in models, or the configured OpenAI embeddings and cross-encoder")
+    parser.add_argument("--synthesize", action="store_true", help="also time answer generation")
+    parser.add_argument("--output", default="retrieval_sweep.json", help="where to write the JSON report")
+    # Synthetic corpus options, used without --labels
+    parser.add_argument("--papers", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--questions-per-paper", type=int, default=3)
+    parser.add_argument("--embed-dim", type=int, default=384)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--chunk-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--chunk-overlap", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if bool(args.labels) != bool(args.papers_dir):
+        raise SystemExit("--labels and --papers-dir go together")
+
+    if args.chunk_size:
+        # Child process: evaluate one chunking configuration, hand the results back as JSON
+        with tempfile.TemporaryDirectory(prefix="rag-sweep-") as workdir:
+            args.workdir = workdir
+            print(json.dumps(run_chunking(args)))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="rag-sweep-") as corpus_dir:
+        labels_path, papers_dir = args.labels, args.papers_dir
+        if labels_path is None:
+            labels_path = os.path.join(corpus_dir, "labels.jsonl")
+            papers_dir = os.path.join(corpus_dir, "papers")
+            stand_ins.write_labeled_papers(
+                papers_dir, labels_path, args.papers,
+                pages=args.pages, questions_per_paper=args.questions_per_paper, seed=args.seed
+            )
+        child_args = [
+            "--top-k", args.top_k, "--top-n", args.top_n, "--retrieval-mode", args.retrieval_mode,
+            "--labels", os.path.abspath(labels_path), "--papers-dir", os.path.abspath(papers_dir),
+            "--models", args.models, "--embed-dim", str(args.embed_dim), "--max-tokens", str(args.max_tokens),
+        ] + (["--synthesize"] if args.synthesize else [])
+
+        configs = []
+        for chunk_size in _ints(args.chunk_sizes):
+            for chunk_overlap in _ints(args.chunk_overlaps):
+                print(f"Evaluating chunk size {chunk_size}, overlap {chunk_overlap}...", file=sys.stderr)
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), *child_args,
+                     "--chunk-size", str(chunk_size), "--chunk-overlap", str(chunk_overlap)],
+                    capture_output=True, text=True
+                )
+                if completed.returncode != 0:
+                    sys.stderr.write(completed.stderr)
+                    raise RuntimeError(f"Sweep for chunk size {chunk_size}, overlap {chunk_overlap} failed")
+                configs.extend(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    front = pareto_front(configs)
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "workdir", "chunk_size", "chunk_overlap")},
+        "objectives": {key: "max" if sign > 0 else "min" for key, sign in OBJECTIVES},
+        "configs": configs,
+        "pareto_front": [
+            {key: config[key] for key in ("chunk_size", "chunk_overlap", "top_k", "top_n")} for config in front
+        ],
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    _print_table(configs)
+    print(f"{len(front)} of {len(configs)} configurations on the Pareto front (*)")
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""Offline stand-ins for the services the pipeline talks to
+
+Benchmarks and load tests import this module before anything from app, so
+settings pick up a throwaway SQLite database, a local vector store and a
+work directory, and no request ever leaves the machine:
+
+    embeddings   MockEmbedding (constant vectors, no OpenAI calls), or
+                 hashed bags of words when retrieval quality matters
+    LLM          MockLLM (echoes a fixed number of tokens, no Ollama)
+                 both can sleep per call/token to mimic the real latencies
+    vector store the local backend (memory-mapped matrix on disk)
+    Redis        fakeredis
+    reranker     token-overlap cross-encoder in place of sentence-transformers
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import types
+import random
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fixed vocabulary with a skewed word distribution, so BM25 and the
+# splitters see text that behaves roughly like prose
+_VOCABULARY = [
+    "attention", "transformer", "embedding", "retrieval", "gradient", "dataset",
+    "benchmark", "latency", "token", "encoder", "decoder", "layer", "network",
+    "training", "inference", "model", "vector", "index", "query", "document",
+    "paper", "result", "method", "approach", "baseline", "accuracy", "loss",
+    "optimizer", "parameter", "sequence", "context", "window", "chunk", "score",
+    "ranking", "corpus", "language", "generation", "evaluation", "metric",
+    "the", "of", "and", "to", "in", "a", "is", "for", "we", "that", "with", "on",
+    "this", "are", "by", "as", "our", "from", "be", "which", "can", "an", "it",
+]
+_WEIGHTS = [1.0 / (rank + 1) ** 0.8 for rank in range(len(_VOCABULARY))]
+
+
+def configure_environment(workdir=None, cross_encoder=True, **overrides):
+    """Point the app's settings at a scratch directory, before app is imported
+
+    Returns the work directory. Extra keyword arguments are set as
+    environment variables, e.g. CHUNKING_MODE="hierarchical". Pass
+    cross_encoder=False to rerank with the real sentence-transformers model.
+    """
+    if "app.core.config" in sys.modules:
+        raise RuntimeError("configure_environment must run before app is imported")
+    workdir = workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    environment = {
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'app.db')}",
+        "REDIS_URL": "redis://stand-in",
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_DIR": os.path.join(workdir, "vectors"),
+        "UPLOAD_DIR": os.path.join(workdir, "papers"),
+        "BM25_INDEX_PATH": os.path.join(workdir, "bm25_index.sqlite"),
+        # Repeated questions must exercise the pipeline, not the caches
+        "SEMANTIC_CACHE_ENABLED": "false",
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "QUERY_EMBEDDING_CACHE_ENABLED": "false",
+        "OPENAI_API_KEY": "stand-in",
+    }
+    environment.update({key: str(value) for key, value in overrides.items()})
+    os.environ.update(environment)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    if cross_encoder:
+        install_cross_encoder()
+    return workdir
+
+
+class TokenOverlapCrossEncoder:
+    """Deterministic cross-encoder stand-in scoring pairs by shared words"""
+
+    def __init__(self, model_name=None, max_length=None, device=None, **kwargs):
+        self.model_name = model_name
+
+    def predict(self, pairs, *args, **kwargs):
+        import numpy as np
+
+        return np.array([
+            float(len(set(query.lower().split()) & set(text.lower().split())))
+            for query, text in pairs
+        ])
+
+
+def install_cross_encoder():
+    """Register the stand-in as sentence_transformers.CrossEncoder"""
+    module = types.ModuleType("sentence_transformers")
+    module.CrossEncoder = TokenOverlapCrossEncoder
+    sys.modules["sentence_transformers"] = module
+
+
+def make_embed_model(embed_dim=384, delay_ms=0):
+    """MockEmbedding, optionally sleeping delay_ms per call like a remote API"""
+    from llama_index.core.embeddings import MockEmbedding
+
+    class DelayedMockEmbedding(MockEmbedding):
+        delay: float = 0.0
+
+        def _get_query_embedding(self, query):
+            time.sleep(self.delay)
+            return super()._get_query_embedding(query)
+
+        def _get_text_embeddings(self, texts):
+            time.sleep(self.delay)
+            return super()._get_text_embeddings(texts)
+
+    embed_model = DelayedMockEmbedding(embed_dim=embed_dim)
+    embed_model.delay = delay_ms / 1000
+    return embed_model
+
+
+def make_hashing_embed_model(embed_dim=384):
+    """Embeddings hashing each word into a dimension, so similar texts score high"""
+    import numpy as np
+    from llama_index.core.embeddings import BaseEmbedding
+
+    class HashingEmbedding(BaseEmbedding):
+        embed_dim: int = 384
+
+        def _embed(self, text):
+            vector = np.zeros(self.embed_dim, dtype=np.float32)
+            for word in text.lower().replace(".", " ").replace("?", " ").split():
+                vector[zlib.crc32(word.encode()) % self.embed_dim] += 1.0
+            norm = np.linalg.norm(vector)
+            return (vector / norm if norm else vector).tolist()
+
+        def _get_query_embedding(self, query):
+            return self._embed(query)
+
+        async def _aget_query_embedding(self, query):
+            return self._embed(query)
+
+        def _get_text_embedding(self, text):
+            return self._embed(text)
+
+    return HashingEmbedding(embed_dim=embed_dim, model_name="hashing")
+
+
+def make_llm(max_tokens=64, token_delay_ms=0):
+    """MockLLM, optionally sleeping token_delay_ms per generated token like Ollama"""
+    from llama_index.core.llms import MockLLM
+
+    class DelayedMockLLM(MockLLM):
+        token_delay: float = 0.0
+
+        def complete(self, prompt, formatted=False, **kwargs):
+            time.sleep(self.token_delay * (self.max_tokens or 0))
+            return super().complete(prompt, formatted=formatted, **kwargs)
+
+        def stream_complete(self, prompt, formatted=False, **kwargs):
+            for response in super().stream_complete(prompt, formatted=formatted, **kwargs):
+                time.sleep(self.token_delay)
+                yield response
+
+    llm = DelayedMockLLM(max_tokens=max_tokens)
+    llm.token_delay = token_delay_ms / 1000
+    return llm
+
+
+def make_redis_client():
+    import fakeredis
+
+    return fakeredis.FakeRedis(decode_responses=False)
+
+
+def make_index_manager(redis_manager=None, embed_dim=384, max_tokens=64, embed_delay_ms=0, token_delay_ms=0, embed_model=None):
+    """IndexManager wired to the stand-in models and Redis"""
+    from app.rag.index_manager import IndexManager
+    from app.rag.redis_manager import RedisManager
+
+    return IndexManager(
+        redis_manager=redis_manager or RedisManager(redis_client=make_redis_client()),
+        llm=make_llm(max_tokens, token_delay_ms=token_delay_ms),
+        embed_model=embed_model or make_embed_model(embed_dim, delay_ms=embed_delay_ms),
+    )
+
+
+def synthetic_text(rng, words):
+    """Sentences of vocabulary words, deterministic for a seeded rng"""
+    return _sentences(rng.choices(_VOCABULARY, weights=_WEIGHTS, k=words))
+
+
+def _sentences(tokens):
+    sentences = [" ".join(tokens[start:start + 15]) for start in range(0, len(tokens), 15)]
+    return ". ".join(sentence.capitalize() for sentence in sentences) + "."
+
+
+def synthetic_nodes(count, words=350, seed=0, papers=None):
+    """count text nodes shaped like stored chunks, ids and metadata included"""
+    from llama_index.core.schema import TextNode
+
+    rng = random.Random(seed)
+    papers = papers or max(1, count // 40)
+    nodes = []
+    for index in range(count):
+        arxiv_id = f"2401.{index % papers:05d}v1"
+        nodes.append(TextNode(
+            id_=f"{arxiv_id}:{index // papers}:0",
+            text=synthetic_text(rng, words),
+            metadata={
+                "arxiv_url": f"https://arxiv.org/pdf/{arxiv_id}",
+                "filename": f"{arxiv_id}.pdf",
+                "arxiv_id": arxiv_id,
+            },
+        ))
+    return nodes
+
+
+def synthetic_queries(nodes, count, words=8, seed=1):
+    """Questions built from words of random chunks, so they have real matches"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        node = rng.choice(nodes)
+        node_words = node.text.replace(".", "").lower().split()
+        queries.append(" ".join(rng.sample(node_words, min(words, len(node_words)))))
+    return queries
+
+
+def _pseudo_word(rng):
+    return "".join(rng.choice("bcdfgklmnprstvz") + rng.choice("aeiou") for _ in range(3)) + rng.choice("nrsx")
+
+
+def write_labeled_papers(upload_dir, labels_path, papers, pages=4, words=350, questions_per_paper=3, seed=0):
+    """Synthetic PDFs plus questions labeled with the paper that answers them
+
+    Every page mentions a few made-up topic terms, one of them shared with
+    another paper, and each question asks about the terms of one or two
+    pages. Questions go to labels_path as JSON lines
+    {"question": ..., "arxiv_ids": [...]}.
+    """
+    rng = random.Random(seed)
+    os.makedirs(upload_dir, exist_ok=True)
+    shared = [_pseudo_word(rng) for _ in range(max(1, papers // 2))]
+    labels = []
+    for number in range(papers):
+        arxiv_id = f"2401.{number:05d}v1"
+        page_topics = []
+        texts = []
+        for _ in range(pages):
+            topic = [_pseudo_word(rng), _pseudo_word(rng), rng.choice(shared)]
+            tokens = rng.choices(_VOCABULARY, weights=_WEIGHTS, k=words)
+            for word in topic * 3:
+                tokens.insert(rng.randrange(len(tokens) + 1), word)
+            page_topics.append(topic)
+            texts.append(_sentences(tokens))
+        write_pdf(os.path.join(upload_dir, f"{arxiv_id}.pdf"), texts)
+        for _ in range(questions_per_paper):
+            terms = []
+            for topic in rng.sample(page_topics, min(len(page_topics), rng.choice((1, 2)))):
+                terms.extend(rng.sample(topic, 2))
+            common = rng.sample(_VOCABULARY[:40], 3)
+            labels.append({"question": f"How does the {' '.join(common)} relate to {' and '.join(terms)}?", "arxiv_ids": [arxiv_id]})
+    with open(labels_path, "w") as f:
+        for label in labels:
+            f.write(json.dumps(label) + "\n")
+    return labels
+
+
+def write_pdf(path, pages, line_length=90):
+    """Write a minimal text-only PDF with one page per string"""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = len(objects) + 1 + 2 * len(pages)
+    page_ids = []
+    for text in pages:
+        text = text.replace("\\", "").replace("(", "").replace(")", "")
+        lines = [text[start:start + line_length] for start in range(0, len(text), line_length)]
+        content = ("BT /F1 8 Tf 30 810 Td 10 TL " + " ".join(f"({line}) '" for line in lines) + " ET").encode("latin-1", "replace")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /Resources << /Font << /F1 %d 0 R >> >> "
+            b"/MediaBox [0 0 612 842] /Contents %d 0 R >>" % (pages_id, font, content_id)
+        ))
+    add(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % page_id for page_id in page_ids) + b"] /Count %d >>" % len(page_ids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(output)
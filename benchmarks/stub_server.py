@@ -0,0 +1,76 @@
+"""Run app.main:app on one worker with Pinecone, OpenAI, Ollama and Redis stubbed out
+
+The stand-ins from stand_ins.py are swapped in through the service
+container before the app starts. Synthetic papers are written to the
+upload directory, so the normal startup path ingests and indexes them.
+
+    python benchmarks/stub_server.py --port 8765 --papers 20 --llm-token-delay-ms 20
+"""
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stand_ins
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workdir", help="scratch directory, a temporary one by default")
+    parser.add_argument("--papers", type=int, default=20, help="synthetic papers ingested at startup")
+    parser.add_argument("--pages", type=int, default=8, help="pages per synthetic paper")
+    parser.add_argument("--embed-dim", type=int, default=384)
+    parser.add_argument("--max-tokens", type=int, default=64, help="tokens the stand-in LLM generates")
+    parser.add_argument("--embed-delay-ms", type=float, default=0, help="simulated embedding API latency per call")
+    parser.add_argument("--llm-token-delay-ms", type=float, default=0, help="simulated generation time per token")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def write_papers(upload_dir, papers, pages, seed=0):
+    """Synthetic PDFs named like arXiv papers"""
+    rng = random.Random(seed)
+    os.makedirs(upload_dir, exist_ok=True)
+    for number in range(papers):
+        stand_ins.write_pdf(
+            os.path.join(upload_dir, f"2401.{number:05d}v1.pdf"),
+            [stand_ins.synthetic_text(rng, 350) for _ in range(pages)]
+        )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = stand_ins.configure_environment(args.workdir)
+    write_papers(os.environ["UPLOAD_DIR"], args.papers, args.pages, seed=args.seed)
+
+    import uvicorn
+    from app.core.container import container
+    from app.db.database import Base, engine
+    from app.main import app
+    from app.rag.redis_manager import RedisManager
+
+    Base.metadata.create_all(bind=engine)
+    redis_manager = RedisManager(redis_client=stand_ins.make_redis_client())
+    index_manager = stand_ins.make_index_manager(
+        redis_manager=redis_manager,
+        embed_dim=args.embed_dim,
+        max_tokens=args.max_tokens,
+        embed_delay_ms=args.embed_delay_ms,
+        token_delay_ms=args.llm_token_delay_ms
+    )
+    container.override(
+        redis_manager=redis_manager,
+        node_stores=index_manager.node_stores,
+        index_manager=index_manager
+    )
+    print(f"Serving stubbed app from {workdir} on http://{args.host}:{args.port}", file=sys.stderr)
+    uvicorn.run(app, host=args.host, port=args.port, workers=1, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,10 @@
 import uvicorn
 import os
 
+from app.core.metrics import clear_multiprocess_dir
+
 if __name__ == "__main__":
+    # Workers write metric samples there, start without those of the last run
+    clear_multiprocess_dir()
     port = int(os.getenv("PORT", 8000))
     uvicorn.run("app.main:app", host="0.0.0.0", port=port, workers=1) 
\ No newline at end of file
@@ -0,0 +1,40 @@
+import os
+import tempfile
+
+# Settings are read when app modules are imported, point them at a scratch
+# directory before any test module imports the app
+_scratch = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_scratch, "papers")
+os.environ["BM25_INDEX_PATH"] = os.path.join(_scratch, "bm25_index.sqlite")
+os.environ["LOCAL_VECTOR_DIR"] = os.path.join(_scratch, "vector_store")
+os.environ["VECTOR_BACKEND"] = "local"
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+import fakeredis
+import pytest
+
+from app.db.database import Base, engine
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def database():
+    """Fresh tables for each test"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def node_store(database):
+    from app.rag.node_store import NodeStore
+
+    store = NodeStore()
+    yield store
+    store.drop()
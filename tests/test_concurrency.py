@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import types
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.concurrency import QueryLimiter
+from app.rag.query_engine import QueryProcessor
+
+
+def test_full_queue_is_rejected_and_long_waits_time_out():
+    limiter = QueryLimiter(max_concurrent=1, max_queue=1, queue_timeout=0.2)
+
+    async def run():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["waiting"] == 1
+        with pytest.raises(HTTPException) as rejected:
+            await limiter.acquire()
+        assert rejected.value.status_code == 429
+        with pytest.raises(HTTPException) as timed_out:
+            await waiter
+        assert timed_out.value.status_code == 503
+        assert limiter.stats()["waiting"] == 0
+
+    asyncio.run(run())
+
+
+def test_released_slots_go_to_waiting_requests():
+    limiter = QueryLimiter(max_concurrent=2, max_queue=2, queue_timeout=1)
+
+    async def run():
+        assert await limiter.run(lambda: "done") == "done"
+        slot = await limiter.lease(2)
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        slot.release()
+        await waiter
+        assert limiter.stats()["in_flight"] == 1
+        limiter.release()
+        assert limiter.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_iterate_closes_a_stream_abandoned_mid_step():
+    limiter = QueryLimiter(max_concurrent=2, max_queue=2, queue_timeout=1)
+    started = threading.Event()
+    resume = threading.Event()
+    closed = threading.Event()
+
+    def tokens():
+        try:
+            yield "first"
+            started.set()
+            resume.wait(5)
+            yield "second"
+        finally:
+            closed.set()
+
+    async def consume():
+        stream = limiter.iterate(tokens())
+        assert await stream.__anext__() == "first"
+        step = asyncio.ensure_future(stream.__anext__())
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        # Cancelled like a disconnected client while next() is still running
+        step.cancel()
+        await asyncio.gather(step, return_exceptions=True)
+
+    asyncio.run(consume())
+    assert not closed.is_set()
+    resume.set()
+    assert closed.wait(5)
+
+
+def test_batches_leave_a_slot_for_interactive_queries():
+    limiter = QueryLimiter(max_concurrent=3, max_queue=2, queue_timeout=0.2)
+
+    async def run():
+        batch = await limiter.lease_batch(5)
+        assert batch.slots == 2
+        # A second batch finds the batch share taken and times out
+        with pytest.raises(HTTPException) as error:
+            await limiter.lease_batch(1)
+        assert error.value.status_code == 503
+        async with limiter.slot():
+            assert limiter.stats()["in_flight"] == 3
+        batch.release()
+        batch.release()
+        assert limiter.stats()["in_flight"] == 0
+        second = await limiter.lease_batch(2)
+        second.release()
+
+    asyncio.run(run())
+
+
+class FakeSemanticCache:
+    """Answers every query from its embedding, recording the lookups"""
+
+    def __init__(self):
+        self.lookups = []
+
+    def lookup(self, embedding):
+        self.lookups.append(embedding)
+        return {"answer": f"answer {embedding[0]}", "source_nodes": []}
+
+
+def test_process_batch_answers_duplicates_once_for_every_position():
+    processor = QueryProcessor.__new__(QueryProcessor)
+    processor.embed_model = types.SimpleNamespace(
+        get_query_embedding_batch=lambda texts: [[float(len(text))] for text in texts]
+    )
+    processor.semantic_cache = FakeSemanticCache()
+
+    results = list(processor.process_batch(["ab", "abc", " ab ", "ab"]))
+
+    assert processor.semantic_cache.lookups == [[2.0], [3.0]]
+    assert results == [
+        ([0, 2, 3], {"answer": "answer 2.0", "source_nodes": []}),
+        ([1], {"answer": "answer 3.0", "source_nodes": []})
+    ]
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from app.rag.distributed_lock import LockLost, LockNotAcquired, RedisLeaseLock, run_as_leader
+
+
+def _lease(redis_client, ttl=0.3, wait_timeout=0):
+    return RedisLeaseLock(redis_client, "test", ttl=ttl, wait_timeout=wait_timeout, retry_interval=0.01)
+
+
+def test_fencing_tokens_increase_per_acquisition(redis_client):
+    first = _lease(redis_client)
+    assert first.acquire() == 1
+    first.release()
+    second = _lease(redis_client)
+    assert second.acquire() == 2
+    second.release()
+
+
+def test_held_lease_is_exclusive(redis_client):
+    holder = _lease(redis_client)
+    holder.acquire()
+    other = _lease(redis_client)
+    assert other.acquire(blocking=False) is None
+    with pytest.raises(LockNotAcquired):
+        with other:
+            pass
+    holder.release()
+    assert other.acquire(blocking=False) is not None
+    other.release()
+
+
+def test_renewal_keeps_the_lease_past_its_ttl(redis_client):
+    holder = _lease(redis_client, ttl=0.2)
+    holder.acquire()
+    time.sleep(0.6)
+    assert holder.is_held()
+    assert not holder.lost
+    holder.check()
+    assert _lease(redis_client).acquire(blocking=False) is None
+    holder.release()
+
+
+def test_expired_lease_is_taken_over_and_fences_the_old_holder(redis_client):
+    stale = _lease(redis_client, ttl=0.2)
+    stale.acquire()
+    # A holder that stopped renewing, e.g. one stuck in a long GC pause
+    stale._stop_renewal.set()
+    time.sleep(0.3)
+
+    successor = _lease(redis_client)
+    assert successor.acquire(blocking=False) == stale.token + 1
+    with pytest.raises(LockLost):
+        stale.check()
+    assert not stale.fenced_set("pointer", "stale")
+    assert successor.fenced_set("pointer", "fresh")
+
+    # Releasing the expired lease must not free the successor's
+    stale.release()
+    assert successor.is_held()
+    assert redis_client.get("pointer") == b"fresh"
+    successor.release()
+
+
+def test_renewal_notices_a_lost_lease(redis_client):
+    holder = _lease(redis_client, ttl=0.15)
+    holder.acquire()
+    redis_client.delete(holder.key)
+    time.sleep(0.2)
+    assert holder.lost
+    with pytest.raises(LockLost):
+        holder.check()
+    holder.release()
+
+
+def test_run_as_leader_runs_once_while_followers_wait(redis_client):
+    done = threading.Event()
+    calls = []
+
+    def build(lock):
+        calls.append(lock.token)
+        time.sleep(0.2)
+        done.set()
+        return "built"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            run_as_leader(redis_client, "test", build, is_ready=done.is_set, wait_timeout=5)
+        ))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results.count("built") == 1
+    assert results.count(None) == 3
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+from llama_index.core.schema import TextNode
+
+import app.rag.document_processor as document_processor
+from app.rag.document_processor import DocumentProcessor, paper_arxiv_id
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """Parse "PDFs" that hold one chunk of plain text per line, recording the parsed files"""
+    files = []
+
+    def parse_pdf(file_path, chunker_config):
+        files.append(os.path.basename(file_path))
+        arxiv_id = paper_arxiv_id(file_path)
+        with open(file_path) as f:
+            lines = f.read().splitlines()
+        return [
+            TextNode(id_=f"{arxiv_id}:0:{i}", text=line, metadata={"arxiv_id": arxiv_id})
+            for i, line in enumerate(lines)
+        ]
+
+    monkeypatch.setattr(document_processor, "parse_pdf", parse_pdf)
+    return files
+
+
+@pytest.fixture
+def processor(database, tmp_path):
+    processor = DocumentProcessor(workers=1)
+    processor.upload_dir = str(tmp_path)
+    yield processor
+    processor.node_stores.drop(0)
+
+
+def _write(processor, name, lines, mtime=None):
+    path = os.path.join(processor.upload_dir, name)
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_sync_only_processes_new_changed_and_removed_files(processor, parsed):
+    _write(processor, "2401.00001.pdf", ["alpha", "beta", "gamma"], mtime=1000)
+    _write(processor, "2401.00002.pdf", ["delta"], mtime=1000)
+    result = processor.sync_directory()
+    assert sorted(node.node_id for node in result.nodes) == [
+        "2401.00001:0:0", "2401.00001:0:1", "2401.00001:0:2", "2401.00002:0:0"
+    ]
+    assert set(processor.manifest_store.load_entries()) == {"2401.00001.pdf", "2401.00002.pdf"}
+
+    # Nothing changed, nothing is parsed
+    parsed.clear()
+    result = processor.sync_directory()
+    assert (result.nodes, result.removed_node_ids, result.unchanged) == ([], [], 2)
+    assert parsed == []
+
+    # A new mtime with the same content is only recorded
+    _write(processor, "2401.00002.pdf", ["delta"], mtime=2000)
+    result = processor.sync_directory()
+    assert (result.nodes, result.unchanged) == ([], 2)
+    assert processor.manifest_store.get_entry("2401.00002.pdf")["mtime"] == 2000
+    assert parsed == []
+
+    # A shorter paper drops its trailing chunk, a removed file all of its chunks
+    _write(processor, "2401.00001.pdf", ["alpha", "beta v2"], mtime=3000)
+    os.remove(os.path.join(processor.upload_dir, "2401.00002.pdf"))
+    result = processor.sync_directory()
+    assert parsed == ["2401.00001.pdf"]
+    assert [node.node_id for node in result.nodes] == ["2401.00001:0:0", "2401.00001:0:1"]
+    assert sorted(result.removed_node_ids) == ["2401.00001:0:2", "2401.00002:0:0"]
+    assert set(processor.manifest_store.load_entries()) == {"2401.00001.pdf"}
+
+    node_store = processor.node_stores.get(0)
+    assert sorted(node_store.get_nodes_by_ids(["2401.00001:0:1", "2401.00001:0:2", "2401.00002:0:0"])) == [
+        "2401.00001:0:1"
+    ]
+
+
+def test_a_wiped_nodes_table_makes_the_manifest_stale(processor, parsed):
+    _write(processor, "2401.00001.pdf", ["alpha"], mtime=1000)
+    processor.sync_directory()
+    processor.node_stores.get(0).delete_all_nodes()
+
+    result = processor.sync_directory()
+    assert [node.node_id for node in result.nodes] == ["2401.00001:0:0"]
+
+
+def test_process_file_reports_the_chunks_it_replaced(processor, parsed):
+    path = _write(processor, "2401.00001.pdf", ["alpha", "beta"], mtime=1000)
+    processor.process_file(path)
+    assert processor.process_file(path).unchanged == 1
+
+    _write(processor, "2401.00001.pdf", ["alpha v2"], mtime=2000)
+    result = processor.process_file(path)
+    assert [node.get_content() for node in result.nodes] == ["alpha v2"]
+    assert result.removed_node_ids == ["2401.00001:0:1"]
@@ -0,0 +1,40 @@
+import pytest
+
+from app.db.database import SessionLocal
+from app.db.models import EmbeddingCacheEntry
+from app.rag.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def cache(database):
+    return EmbeddingCache(max_bytes=1 << 20)
+
+
+def _entry_count():
+    with SessionLocal() as db:
+        return db.query(EmbeddingCacheEntry).count()
+
+
+def test_duplicate_texts_in_one_call_are_stored_once(cache):
+    cache.put_many("model", ["a text", "a  text", "other"], [[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+
+    assert _entry_count() == 2
+    found = cache.get_many("model", ["a text", "other", "missing"])
+    assert sorted(found.values()) == [[0.0, 1.0], [1.0, 0.0]]
+
+
+def test_existing_entries_are_kept_and_new_ones_added(cache):
+    cache.put_many("model", ["a text"], [[1.0, 0.0]])
+    # Another worker embedded the same text meanwhile
+    cache.put_many("model", ["a text", "new"], [[0.5, 0.5], [0.0, 1.0]])
+
+    assert _entry_count() == 2
+    assert list(cache.get_many("model", ["a text"]).values()) == [[1.0, 0.0]]
+    assert cache.get_many("other-model", ["a text"]) == {}
+
+
+def test_eviction_keeps_the_cache_within_budget(cache):
+    cache.max_bytes = 3 * 8
+    cache.put_many("model", [f"text {i}" for i in range(5)], [[float(i), 0.0] for i in range(5)])
+
+    assert _entry_count() == 3
@@ -0,0 +1,106 @@
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import TextNode
+
+from app.core.config import settings
+from app.rag.distributed_lock import INDEX_MAINTENANCE_LOCK, RedisLeaseLock
+from app.rag.index_manager import IndexManager
+from app.rag.redis_manager import RedisManager
+from app.rag.vector_backends import EMBEDDING_DIMENSION
+
+
+def _nodes(prefix, count):
+    return [
+        TextNode(id_=f"{prefix}:0:{i}", text=f"{prefix} chunk {i}", metadata={"arxiv_id": prefix})
+        for i in range(count)
+    ]
+
+
+def _index_manager(redis_client):
+    return IndexManager(
+        redis_manager=RedisManager(redis_client=redis_client),
+        llm=MockLLM(),
+        embed_model=MockEmbedding(embed_dim=EMBEDDING_DIMENSION)
+    )
+
+
+@pytest.fixture
+def index_manager(database, redis_client):
+    manager = _index_manager(redis_client)
+    yield manager
+    for generation in set(manager.live_generations()) | {0}:
+        manager._drop_generation(generation)
+
+
+@pytest.fixture
+def lock(redis_client):
+    lease = RedisLeaseLock(redis_client, INDEX_MAINTENANCE_LOCK)
+    lease.acquire()
+    yield lease
+    lease.release()
+
+
+def test_build_switches_queries_to_the_new_generation(index_manager, lock):
+    index_manager.node_store.store_nodes(_nodes("2401.00001", 3))
+
+    generation = index_manager.build_generation(lock, nodes=_nodes("2401.00002", 4))
+
+    assert generation == 1
+    assert index_manager.generation == 1
+    assert index_manager.generations.get(1)["status"] == "active"
+    assert index_manager.generations.get(1)["vector_count"] == 4
+    assert index_manager.generations.get(0)["status"] == "retired"
+    stored = sorted(row["node_id"] for row in index_manager.node_store.iter_rows(columns=["node_id"]))
+    assert stored == [node.node_id for node in _nodes("2401.00002", 4)]
+    assert index_manager.node_store.bm25_index.synced_version() == 0
+
+
+def test_a_generation_missing_vectors_fails_validation(index_manager, lock, monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_VALIDATE_TIMEOUT", 0)
+    # Vectors that never arrive, as when upserts are silently dropped
+    monkeypatch.setattr(IndexManager, "upsert_nodes", lambda self, nodes, **kwargs: 0)
+
+    with pytest.raises(RuntimeError, match="has 0 of 2 vectors"):
+        index_manager.build_generation(lock, nodes=_nodes("2401.00001", 2))
+
+    assert index_manager.generations.current() == 0
+    assert index_manager.generation == 0
+    assert index_manager.generations.get(1)["status"] == "failed"
+
+
+def test_bm25_index_catches_up_with_papers_ingested_elsewhere(index_manager, redis_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_CHECK_INTERVAL", 0)
+    index_manager._ensure_bm25_index()
+    # Another instance, with a BM25 file of its own
+    monkeypatch.setattr(settings, "BM25_INDEX_PATH", str(tmp_path / "other.sqlite"))
+    other = _index_manager(redis_client)
+    other_bm25 = other._ensure_bm25_index()
+
+    for nodes in (_nodes("2401.00001", 2), _nodes("2401.00002", 1)):
+        index_manager.node_store.store_nodes(nodes)
+        index_manager.add_nodes(nodes)
+    index_manager.node_store.delete_nodes([_nodes("2401.00001", 2)[1].node_id])
+    index_manager.delete_nodes([_nodes("2401.00001", 2)[1].node_id])
+
+    # The ingesting instance applied every change itself, nothing to rebuild
+    assert index_manager.node_store.bm25_index.synced_version() == 3
+    assert other_bm25.search("2401.00002") == []
+    assert other._ensure_bm25_index(force=False) is other_bm25
+    assert other_bm25.synced_version() == 3
+    assert other_bm25.count() == 2
+    assert other_bm25.search("2401.00002")[0][0] == "2401.00002:0:0"
+    other_bm25.drop()
+
+
+def test_rollback_returns_to_the_retired_generation_and_back(index_manager, lock):
+    with pytest.raises(ValueError):
+        index_manager.rollback_generation(lock)
+    index_manager.build_generation(lock, nodes=_nodes("2401.00001", 2))
+
+    assert index_manager.rollback_generation(lock) == 0
+    assert index_manager.generation == 0
+    assert index_manager.generations.get(1)["status"] == "retired"
+
+    assert index_manager.rollback_generation(lock) == 1
+    assert index_manager.generation == 1
@@ -0,0 +1,80 @@
+import pytest
+from llama_index.core.schema import TextNode
+
+from app.rag.lazy_docstore import LazyDocumentStore
+from app.rag.redis_manager import RedisManager
+
+
+def _node(node_id, text):
+    return TextNode(id_=node_id, text=text, metadata={"arxiv_id": node_id.split(":")[0]})
+
+
+@pytest.fixture
+def node_cache(redis_client):
+    return RedisManager(redis_client=redis_client)
+
+
+def test_lookups_fall_through_lru_redis_and_database(node_store, node_cache):
+    node_store.store_nodes([_node(f"2401.0000{i}:0:0", f"database {i}") for i in range(3)])
+    node_cache.upsert_nodes([_node("2401.00001:0:0", "redis 1")])
+    docstore = LazyDocumentStore(node_store, redis_manager=node_cache)
+    docstore.add_documents([_node("2401.00000:0:0", "lru 0")])
+
+    nodes = docstore.get_nodes(["2401.00000:0:0", "2401.00001:0:0", "2401.00002:0:0"])
+    assert [node.get_content() for node in nodes] == ["lru 0", "redis 1", "database 2"]
+
+    # Database hits are written back to Redis, every hit lands in the LRU
+    assert node_cache.get_nodes_by_ids(["2401.00002:0:0"])[0].get_content() == "database 2"
+    assert docstore.cache_info()["size"] == 3
+
+
+def test_without_redis_the_database_is_read(node_store):
+    node_store.store_nodes([_node("2401.00001:0:0", "database 1")])
+    docstore = LazyDocumentStore(node_store)
+    assert docstore.get_document("2401.00001:0:0").get_content() == "database 1"
+    assert docstore.document_exists("2401.00001:0:0")
+
+
+def test_missing_ids_raise_or_are_skipped(node_store, node_cache):
+    node_store.store_nodes([_node("2401.00001:0:0", "database 1")])
+    docstore = LazyDocumentStore(node_store, redis_manager=node_cache)
+    with pytest.raises(ValueError):
+        docstore.get_nodes(["2401.00001:0:0", "missing"])
+    assert [node.node_id for node in docstore.get_nodes(["missing", "2401.00001:0:0"], raise_error=False)] == [
+        "2401.00001:0:0"
+    ]
+    assert docstore.get_document("missing", raise_error=False) is None
+
+
+def test_lru_is_bounded_and_deletes_evict(node_store):
+    docstore = LazyDocumentStore(node_store, cache_size=2)
+    docstore.add_documents([_node(f"2401.0000{i}:0:0", f"lru {i}") for i in range(3)])
+    assert docstore.cache_info() == {"size": 2, "capacity": 2}
+
+    docstore.delete_document("2401.00002:0:0")
+    assert docstore.get_document("2401.00002:0:0", raise_error=False) is None
+
+
+def test_changes_in_another_process_empty_the_lru(node_store, node_cache):
+    node_store.store_nodes([_node("2401.00001:0:0", "old")])
+    docstore = LazyDocumentStore(node_store, redis_manager=node_cache)
+    assert docstore.get_document("2401.00001:0:0").text == "old"
+
+    # Another worker re-ingests the paper: database, Redis, then the version
+    node_store.store_nodes([_node("2401.00001:0:0", "new")])
+    node_cache.upsert_nodes([_node("2401.00001:0:0", "new")])
+    assert docstore.get_document("2401.00001:0:0").text == "old"
+    node_cache.bump_nodes_version()
+
+    assert docstore.get_document("2401.00001:0:0").text == "new"
+
+
+def test_the_version_is_checked_without_the_redis_tier(node_store, node_cache):
+    node_store.store_nodes([_node("2401.00001:0:0", "old")])
+    docstore = LazyDocumentStore(node_store, version_source=node_cache)
+    assert docstore.get_document("2401.00001:0:0").text == "old"
+
+    node_store.store_nodes([_node("2401.00001:0:0", "new")])
+    node_cache.bump_nodes_version()
+
+    assert docstore.get_document("2401.00001:0:0").text == "new"
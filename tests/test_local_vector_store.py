@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from app.rag.local_vector_store import LocalVectorStore
+
+
+def _node(node_id, vector, **metadata):
+    return TextNode(id_=node_id, text=f"text of {node_id}", metadata=metadata, embedding=list(vector))
+
+
+def _axis(i, dim=4):
+    vector = np.zeros(dim)
+    vector[i] = 1.0
+    return vector
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(persist_dir=str(tmp_path / "vectors"))
+    yield store
+    store.close()
+
+
+def _rows(store):
+    return dict(store._db.execute("SELECT node_id, row FROM vectors"))
+
+
+def test_deleted_rows_are_reused(store):
+    store.add([_node("a", _axis(0)), _node("b", _axis(1)), _node("c", _axis(2))])
+    freed = _rows(store)["b"]
+    store.delete_nodes(["b"])
+    assert store.count() == 2
+
+    store.add([_node("d", _axis(3))])
+    assert _rows(store)["d"] == freed
+    assert store._rows == 3
+
+
+def test_overwriting_an_id_keeps_its_row(store):
+    store.add([_node("a", _axis(0)), _node("b", _axis(1))])
+    row = _rows(store)["a"]
+    store.add([_node("a", _axis(2))])
+    assert _rows(store)["a"] == row
+    assert store.count() == 2
+    result = store.query(VectorStoreQuery(query_embedding=list(_axis(2)), similarity_top_k=1))
+    assert result.ids == ["a"]
+
+
+def test_repeated_ids_in_one_add_take_one_row(store):
+    store.add([_node("a", _axis(0), version=1), _node("a", _axis(1), version=2)])
+    assert store.count() == 1
+    assert store._rows == 1
+    result = store.query(VectorStoreQuery(query_embedding=list(_axis(1)), similarity_top_k=5))
+    assert result.ids == ["a"]
+    assert result.nodes[0].metadata["version"] == 2
+
+
+def test_query_ranks_by_cosine_similarity(store):
+    store.add([_node("a", [1, 0, 0, 0]), _node("b", [1, 1, 0, 0]), _node("c", [0, 0, 1, 0])])
+    result = store.query(VectorStoreQuery(query_embedding=[1, 0.2, 0, 0], similarity_top_k=2))
+    assert result.ids == ["a", "b"]
+    assert result.similarities[0] > result.similarities[1]
+
+
+def test_another_instance_sees_rows_and_reuses_freed_ones(store):
+    store.add([_node("a", _axis(0)), _node("b", _axis(1))])
+    freed = _rows(store)["a"]
+    other = LocalVectorStore(persist_dir=store.persist_dir)
+    try:
+        other.delete_nodes(["a"])
+        store.add([_node("c", _axis(2))])
+        assert _rows(store)["c"] == freed
+        assert store._rows == 2
+        assert other.count() == 2
+        result = other.query(VectorStoreQuery(query_embedding=list(_axis(2)), similarity_top_k=1))
+        assert result.ids == ["c"]
+    finally:
+        other.close()
+
+
+def test_delete_by_metadata_filters(store):
+    store.add([
+        _node("a", _axis(0), arxiv_id="1", year=2020),
+        _node("b", _axis(1), arxiv_id="2", year=2023),
+        _node("c", _axis(2), arxiv_id="2", year=2024),
+    ])
+    store.delete_nodes(filters=MetadataFilters(filters=[
+        MetadataFilter(key="arxiv_id", value="2"),
+        MetadataFilter(key="year", value=2024, operator=FilterOperator.GTE),
+    ]))
+    assert store.existing_ids(["a", "b", "c"]) == {"a", "b"}
+
+    # With ids and filters only the listed nodes that match are deleted
+    store.delete_nodes(node_ids=["a"], filters=MetadataFilters(filters=[MetadataFilter(key="arxiv_id", value="2")]))
+    assert store.existing_ids(["a", "b"]) == {"a", "b"}
+
+
+def test_unknown_filter_operator_is_a_value_error(store):
+    store.add([_node("a", _axis(0), arxiv_id="1")])
+    metadata_filter = MetadataFilter(key="arxiv_id", value="1")
+    metadata_filter.operator = "regex"
+    with pytest.raises(ValueError):
+        store.query(VectorStoreQuery(
+            query_embedding=list(_axis(0)),
+            similarity_top_k=1,
+            filters=MetadataFilters(filters=[metadata_filter])
+        ))
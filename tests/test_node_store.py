@@ -0,0 +1,33 @@
+from llama_index.core.schema import TextNode
+
+
+def _node(i, text=None):
+    return TextNode(id_=f"2401.00001:0:{i}", text=text or f"chunk {i}", metadata={"arxiv_id": "2401.00001"})
+
+
+def test_store_counts_inserted_and_updated_rows(node_store):
+    assert node_store.store_nodes([_node(i) for i in range(5)], batch_size=2) == {"inserted": 5, "updated": 0}
+
+    counts = node_store.store_nodes([_node(3, "new 3"), _node(4, "new 4"), _node(5), _node(6)], batch_size=3)
+
+    assert counts == {"inserted": 2, "updated": 2}
+    stored = node_store.get_nodes_by_ids([_node(i).node_id for i in range(7)])
+    assert len(stored) == 7
+    assert stored[_node(3).node_id].text == "new 3"
+    assert stored[_node(0).node_id].text == "chunk 0"
+
+
+def test_an_id_repeated_in_one_call_keeps_its_last_version(node_store):
+    counts = node_store.store_nodes([_node(0, "first"), _node(1), _node(0, "last")])
+
+    assert counts == {"inserted": 2, "updated": 0}
+    assert node_store.get_nodes_by_ids([_node(0).node_id])[_node(0).node_id].text == "last"
+
+
+def test_batches_stream_every_stored_node(node_store):
+    node_store.store_nodes([_node(i) for i in range(7)])
+
+    batches = list(node_store.iter_node_batches(batch_size=3))
+
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert {node.node_id for batch in batches for node in batch} == {_node(i).node_id for i in range(7)}
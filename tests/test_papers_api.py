@@ -0,0 +1,123 @@
+import os
+import types
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.endpoints import papers
+from app.core.config import settings
+from app.core.container import container
+from app.rag.redis_manager import RedisManager
+
+
+class FakeDocumentProcessor:
+    """Papers are files in upload_dir, each with two chunks"""
+
+    def __init__(self, upload_dir):
+        self.upload_dir = upload_dir
+        self.processed = []
+
+    def find_paper_file(self, arxiv_id):
+        path = os.path.join(self.upload_dir, f"{arxiv_id}v1.pdf")
+        return path if os.path.exists(path) else None
+
+    def process_file(self, file_path, generations=None, lock=None):
+        lock.check()
+        self.processed.append(file_path)
+        arxiv_id = os.path.basename(file_path)[:-len(".pdf")]
+        return types.SimpleNamespace(nodes=[f"{arxiv_id}:0:0"], removed_node_ids=[f"{arxiv_id}:0:1"])
+
+    def remove_paper(self, arxiv_id, generations=None, lock=None):
+        lock.check()
+        path = self.find_paper_file(arxiv_id)
+        if path is None:
+            return []
+        os.remove(path)
+        return [f"{arxiv_id}v1:0:0", f"{arxiv_id}v1:0:1"]
+
+
+class FakeIndexManager:
+    """Records the node ids added and deleted"""
+
+    def __init__(self):
+        self.added = []
+        self.deleted = []
+
+    def refresh_generation(self, force=False):
+        pass
+
+    def live_generations(self):
+        return [0]
+
+    def add_nodes(self, nodes, lock=None):
+        self.added.extend(nodes)
+
+    def delete_nodes(self, node_ids, lock=None):
+        self.deleted.extend(node_ids)
+
+    def delete_paper(self, arxiv_id, node_ids=(), lock=None):
+        self.deleted.extend(node_ids)
+        return len(node_ids)
+
+
+@pytest.fixture
+def services(tmp_path, redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    processor = FakeDocumentProcessor(str(tmp_path))
+    index_manager = FakeIndexManager()
+    container.override(
+        redis_manager=RedisManager(redis_client=redis_client),
+        document_processor=processor,
+        index_manager=index_manager
+    )
+    yield processor, index_manager
+    container.reset()
+
+
+@pytest.fixture
+def client(services):
+    app = FastAPI()
+    app.include_router(papers.router, prefix="/papers")
+    return TestClient(app)
+
+
+def test_replace_overwrites_the_stored_file_and_reindexes_the_paper(client, services, tmp_path):
+    processor, index_manager = services
+    stored = tmp_path / "2401.00001v1.pdf"
+    stored.write_bytes(b"old")
+
+    response = client.put("/papers/2401.00001", files={"file": ("new.pdf", b"new", "application/pdf")})
+
+    assert response.status_code == 200
+    assert stored.read_bytes() == b"new"
+    assert processor.processed == [str(stored)]
+    assert index_manager.deleted == ["2401.00001v1:0:1"]
+    assert index_manager.added == ["2401.00001v1:0:0"]
+
+
+def test_replace_of_an_unknown_paper_stores_it_under_its_id(client, services, tmp_path):
+    response = client.put("/papers/2401.00002", files={"file": ("new.pdf", b"new", "application/pdf")})
+
+    assert response.status_code == 200
+    assert (tmp_path / "2401.00002.pdf").read_bytes() == b"new"
+
+
+def test_replace_rejects_bad_ids_and_non_pdf_files(client, services):
+    upload = {"file": ("notes.txt", b"text", "text/plain")}
+    assert client.put("/papers/2401.00001", files=upload).status_code == 400
+    pdf = {"file": ("new.pdf", b"new", "application/pdf")}
+    assert client.put("/papers/.hidden", files=pdf).status_code == 400
+
+
+def test_delete_removes_the_paper_and_its_vectors(client, services, tmp_path):
+    _, index_manager = services
+    (tmp_path / "2401.00001v1.pdf").write_bytes(b"pdf")
+
+    response = client.delete("/papers/2401.00001")
+
+    assert response.status_code == 200
+    assert response.json()["deleted_nodes"] == 2
+    assert index_manager.deleted == ["2401.00001v1:0:0", "2401.00001v1:0:1"]
+    assert not (tmp_path / "2401.00001v1.pdf").exists()
+    assert client.delete("/papers/2401.00001").status_code == 404
@@ -0,0 +1,94 @@
+from typing import List
+
+import pytest
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field
+
+from app.rag.query_embedding_cache import CachedQueryEmbedding, QueryEmbeddingCache
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Embeds a text as [length, query flag], recording every model call"""
+
+    calls: list = Field(default_factory=list)
+
+    def _vector(self, text, query):
+        return [float(len(text)), 1.0 if query else 0.0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.calls.append(("query", [query]))
+        return self._vector(query, True)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(("text", list(texts)))
+        return [self._vector(text, False) for text in texts]
+
+
+@pytest.fixture
+def model():
+    return CountingEmbedding(model_name="counting")
+
+
+def test_whitespace_variants_share_an_entry(redis_client):
+    cache = QueryEmbeddingCache(redis_client=redis_client, max_entries=10)
+    cache.put_many("m", "query", ["what is  attention?"], [[1.0, 2.0]])
+    assert cache.get_many("m", "query", [" what is attention? "]) == {" what is attention? ": [1.0, 2.0]}
+    # Case is part of the key, and so are the model and the mode
+    assert cache.get_many("m", "query", ["What is attention?"]) == {}
+    assert cache.get_many("other", "query", ["what is attention?"]) == {}
+    assert cache.get_many("m", "text", ["what is attention?"]) == {}
+
+
+def test_lru_is_bounded_and_redis_refills_it(redis_client):
+    cache = QueryEmbeddingCache(redis_client=redis_client, max_entries=2)
+    cache.put_many("m", "query", ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    assert len(cache._cache) == 2
+
+    # A fresh process only has the Redis tier
+    fresh = QueryEmbeddingCache(redis_client=redis_client, max_entries=2)
+    assert fresh.get_many("m", "query", ["a"]) == {"a": [1.0]}
+    assert len(fresh._cache) == 1
+    assert redis_client.ttl(fresh._cache_key("m", "query", "a")) > 0
+
+
+def test_without_redis_only_the_lru_is_used():
+    cache = QueryEmbeddingCache(max_entries=1)
+    cache.put_many("m", "query", ["a", "b"], [[1.0], [2.0]])
+    assert cache.get_many("m", "query", ["a", "b"]) == {"b": [2.0]}
+
+
+def test_single_queries_embed_once(model, redis_client):
+    embedding = CachedQueryEmbedding(model, QueryEmbeddingCache(redis_client=redis_client))
+    first = embedding.get_query_embedding("attention")
+    assert embedding.get_query_embedding("attention") == first
+    assert model.calls == [("query", ["attention"])]
+
+
+def test_batches_embed_only_distinct_misses_in_one_call(model, redis_client):
+    embedding = CachedQueryEmbedding(model, QueryEmbeddingCache(redis_client=redis_client))
+    embedding.get_query_embedding("cached")
+    model.calls.clear()
+
+    vectors = embedding.get_query_embedding_batch(["cached", "new", "new", "other"])
+    assert model.calls == [("text", ["new", "other"])]
+    assert vectors == [[6.0, 1.0], [3.0, 0.0], [3.0, 0.0], [5.0, 0.0]]
+
+    # Batch results are cached in text mode, which single queries never read
+    model.calls.clear()
+    embedding.get_query_embedding_batch(["new", "other"])
+    assert model.calls == []
+    embedding.get_query_embedding("new")
+    assert model.calls == [("query", ["new"])]
+
+
+def test_without_a_cache_every_call_reaches_the_model(model):
+    embedding = CachedQueryEmbedding(model)
+    embedding.get_query_embedding_batch(["a", "a"])
+    embedding.get_query_embedding("a")
+    assert model.calls == [("text", ["a", "a"]), ("query", ["a"])]
@@ -0,0 +1,52 @@
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+from app.rag.redis_manager import RedisManager, decode_node, encode_node
+
+
+def _node(i):
+    return TextNode(id_=f"2401.00001:0:{i}", text=f"chunk {i}", metadata={"arxiv_id": "2401.00001"})
+
+
+def test_encoding_round_trips_a_node_without_its_embedding():
+    node = _node(0)
+    node.embedding = [0.5, 0.25]
+    node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(node_id="2401.00001:0:parent")
+
+    decoded = decode_node(encode_node(node))
+
+    assert type(decoded) is TextNode
+    assert decoded.node_id == node.node_id
+    assert decoded.text == node.text
+    assert decoded.metadata == node.metadata
+    assert decoded.parent_node.node_id == "2401.00001:0:parent"
+    assert decoded.embedding is None
+    assert node.embedding == [0.5, 0.25]
+
+
+def test_pages_cover_every_cached_node(redis_client):
+    manager = RedisManager(redis_client=redis_client)
+    manager.batch_size = 7
+    manager.store_nodes([_node(i) for i in range(50)])
+
+    pages = list(manager.iter_node_pages(page_size=10))
+
+    assert len(pages) > 1
+    assert {node.node_id for page in pages for node in page} == {_node(i).node_id for i in range(50)}
+    assert manager.count_nodes() == 50
+    assert len(manager.get_nodes()) == 50
+
+
+def test_generations_keep_separate_node_caches(redis_client):
+    manager = RedisManager(redis_client=redis_client)
+    manager.store_nodes([_node(0)])
+    next_generation = manager.for_generation(1)
+
+    assert not next_generation.has_complete_nodes()
+    assert next_generation.get_nodes() is None
+    next_generation.upsert_nodes([_node(1), _node(2)])
+    next_generation.delete_nodes([_node(1).node_id])
+
+    deleted, kept = next_generation.get_nodes_by_ids([_node(1).node_id, _node(2).node_id])
+    assert deleted is None
+    assert kept.text == "chunk 2"
+    assert manager.count_nodes() == 1
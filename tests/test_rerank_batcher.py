@@ -0,0 +1,84 @@
+import sys
+import threading
+import types
+
+import pytest
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from app.rag.rerank_batcher import BatchedSentenceTransformerRerank, RerankBatcher
+
+
+class FakeCrossEncoder:
+    """Scores a pair by the number of query words in the text, recording each forward pass"""
+
+    def __init__(self, model, max_length=None, device=None):
+        self.batches = []
+        self.fail = False
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        self.batches.append(list(pairs))
+        if self.fail:
+            raise RuntimeError("model failed")
+        return [float(len(set(query.split()) & set(text.split()))) for query, text in pairs]
+
+
+@pytest.fixture(autouse=True)
+def cross_encoder(monkeypatch):
+    module = types.ModuleType("sentence_transformers")
+    module.CrossEncoder = FakeCrossEncoder
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    monkeypatch.setattr(RerankBatcher, "_instances", {})
+
+
+def test_concurrent_requests_share_one_forward_pass():
+    batcher = RerankBatcher("fake", max_batch_pairs=100, max_wait_ms=200)
+    requests = [[(f"q{i}", f"q{i} text"), (f"q{i}", "other")] for i in range(5)]
+    results = [None] * len(requests)
+
+    def score(i):
+        results[i] = batcher.score(requests[i])
+
+    threads = [threading.Thread(target=score, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(batcher._model.batches) == 1
+    assert len(batcher._model.batches[0]) == 10
+    # Every caller gets the scores of its own pairs, in its own order
+    assert results == [[1.0, 0.0]] * len(requests)
+
+
+def test_batches_are_capped_by_pair_count():
+    batcher = RerankBatcher("fake", max_batch_pairs=4, max_wait_ms=200)
+    futures = [batcher.submit([("q", "q"), ("q", "x")]) for _ in range(4)]
+    assert [future.result(timeout=5) for future in futures] == [[1.0, 0.0]] * 4
+    assert all(len(batch) <= 4 for batch in batcher._model.batches)
+    assert sum(len(batch) for batch in batcher._model.batches) == 8
+
+
+def test_model_errors_reach_every_caller_of_the_batch():
+    batcher = RerankBatcher("fake", max_wait_ms=0)
+    batcher._model.fail = True
+    with pytest.raises(RuntimeError):
+        batcher.score([("q", "q")])
+    assert batcher.submit([]).result() == []
+
+
+def test_postprocessor_keeps_the_best_nodes_per_query():
+    reranker = BatchedSentenceTransformerRerank(top_n=2, model="fake")
+    texts = ["graph neural networks", "all you need", "neural attention networks"]
+    node_lists = [
+        [NodeWithScore(node=TextNode(id_=f"{query}-{i}", text=text)) for i, text in enumerate(texts)]
+        for query in ("attention networks", "graph")
+    ]
+    reranked = reranker.postprocess_batch(
+        node_lists, [QueryBundle("attention networks"), QueryBundle("graph")]
+    )
+    assert [node.node.get_content() for node in reranked[0]] == [
+        "neural attention networks", "graph neural networks"
+    ]
+    assert len(reranked[1]) == 2
+    assert reranked[1][0].node.get_content() == "graph neural networks"
+    assert reranked[1][0].score == 1.0
@@ -0,0 +1,89 @@
+import pytest
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from app.rag.bm25_index import BM25Index, tokenize
+from app.rag.retrievers import HybridRetriever
+
+
+def _node(node_id, text, **metadata):
+    return TextNode(id_=node_id, text=text, metadata=metadata)
+
+
+@pytest.fixture
+def bm25_index(tmp_path):
+    index = BM25Index(path=str(tmp_path / "bm25.sqlite"))
+    yield index
+    index.drop()
+
+
+def test_tokenize_keeps_compound_tokens_and_their_parts():
+    terms = tokenize("The bge-reranker-base model on 2401.12345")
+    assert "the" not in terms
+    assert {"bge-reranker-base", "bge", "reranker", "base", "2401.12345", "2401", "12345"} <= set(terms)
+
+
+def test_search_ranks_by_term_frequency_and_rarity(bm25_index):
+    bm25_index.add_nodes([
+        _node("a", "attention attention transformers"),
+        _node("b", "transformers for vision"),
+        _node("c", "graph neural networks"),
+    ])
+    hits = bm25_index.search("attention transformers", top_k=3)
+    assert [node_id for node_id, _ in hits] == ["a", "b"]
+    assert hits[0][1] > hits[1][1]
+
+
+def test_metadata_ids_are_searchable_and_nodes_replaced(bm25_index):
+    bm25_index.add_nodes([_node("a", "retrieval", arxiv_id="2401.00001")])
+    assert bm25_index.search("2401.00001")[0][0] == "a"
+
+    bm25_index.add_nodes([_node("a", "generation", arxiv_id="2401.00001")])
+    assert bm25_index.search("retrieval") == []
+    assert bm25_index.count() == 1
+
+    bm25_index.remove_nodes(["a"])
+    assert bm25_index.count() == 0
+
+
+def test_rebuild_replaces_contents_and_records_the_version(bm25_index):
+    assert bm25_index.synced_version() is None
+    bm25_index.add_nodes([_node("a", "stale text")])
+
+    count = bm25_index.rebuild([[_node("b", "fresh text")], [_node("c", "more text")]], version=3)
+
+    assert count == 2
+    assert bm25_index.synced_version() == 3
+    assert bm25_index.search("stale") == []
+    assert [node_id for node_id, _ in bm25_index.search("fresh")] == ["b"]
+
+
+def test_version_only_advances_from_the_expected_one(bm25_index):
+    bm25_index.mark_synced(1)
+    assert bm25_index.mark_synced(2, previous=1)
+    # A change made elsewhere took the version from 2 to 3 first
+    assert not bm25_index.mark_synced(4, previous=3)
+    assert bm25_index.synced_version() == 2
+
+
+class FixedRetriever(BaseRetriever):
+    def __init__(self, node_ids):
+        super().__init__()
+        self.node_ids = node_ids
+
+    def _retrieve(self, query_bundle):
+        return [NodeWithScore(node=_node(node_id, node_id), score=1.0) for node_id in self.node_ids]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    retriever = HybridRetriever(
+        FixedRetriever(["a", "b", "c"]),
+        FixedRetriever(["c", "a", "d"]),
+        similarity_top_k=3,
+        rrf_k=60
+    )
+    results = retriever.retrieve(QueryBundle("query"))
+    assert [result.node.node_id for result in results] == ["a", "c", "b"]
+    assert results[0].score == pytest.approx(1 / 61 + 1 / 62)
+    assert results[1].score == pytest.approx(1 / 63 + 1 / 61)
+    assert results[2].score == pytest.approx(1 / 62)
@@ -0,0 +1,36 @@
+from app.rag.semantic_cache import SemanticCache
+
+
+def test_close_queries_hit_and_distant_ones_miss(redis_client):
+    cache = SemanticCache(redis_client, threshold=0.95, ttl=60, max_entries=10)
+    cache.store([1.0, 0.0, 0.0], {"answer": "first"})
+
+    assert cache.lookup([2.0, 0.1, 0.0]) == {"answer": "first"}
+    assert cache.lookup([1.0, 1.0, 0.0]) is None
+    assert cache.lookup([0.0, 0.0, 1.0]) is None
+
+
+def test_entries_are_trimmed_to_the_most_recently_used(redis_client):
+    cache = SemanticCache(redis_client, threshold=0.95, ttl=60, max_entries=2)
+    cache.store([1.0, 0.0, 0.0], {"answer": "x"})
+    cache.store([0.0, 1.0, 0.0], {"answer": "y"})
+    assert cache.lookup([1.0, 0.0, 0.0]) == {"answer": "x"}
+    cache.store([0.0, 0.0, 1.0], {"answer": "z"})
+
+    assert cache.lookup([1.0, 0.0, 0.0]) == {"answer": "x"}
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([0.0, 0.0, 1.0]) == {"answer": "z"}
+
+
+def test_invalidation_reaches_every_instance(redis_client):
+    cache = SemanticCache(redis_client, threshold=0.95, ttl=60, max_entries=10)
+    other = SemanticCache(redis_client, threshold=0.95, ttl=60, max_entries=10)
+    cache.store([1.0, 0.0], {"answer": "old index"})
+    assert other.lookup([1.0, 0.0]) == {"answer": "old index"}
+
+    # An index generation switch, done by another worker
+    other.invalidate()
+
+    assert cache.lookup([1.0, 0.0]) is None
+    cache.store([1.0, 0.0], {"answer": "new index"})
+    assert other.lookup([1.0, 0.0]) == {"answer": "new index"}